@@ -1,6 +1,11 @@
 import uvicorn
 
-from .rest_api import app
+from .travel_time import start_jvm
+
+# Before rest_api builds the solver, which would start the JVM with the default options
+start_jvm()
+
+from .rest_api import app  # noqa: E402
 
 
 def main():
@@ -0,0 +1,331 @@
+"""
+Batches of independent route plans, solved a few at a time; a single plan is a batch of one.
+
+Jobs are only handed to the SolverManager when a solver is free to take them,
+so a batch cannot fill the SolverManager's own first-come first-served queue ahead of a more urgent one.
+Whenever a job finishes, the next job comes from the batch with the highest priority
+(the oldest batch among equals) that runs fewer jobs than its concurrency limit.
+At most max_queued jobs wait; beyond that, submissions are refused until the queue drains.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Annotated, AsyncIterator, Callable, Optional
+from uuid import uuid4
+
+from timefold.solver import SolverStatus
+from timefold.solver.score import HardSoftScore
+
+from .json_serialization import JsonDomainBase, ScoreSerializer
+
+# Retry-After of a full queue before any job finished to estimate from
+DEFAULT_RETRY_AFTER_SECONDS = 30
+# Weight of the latest job in the average solve duration
+SOLVE_SECONDS_SMOOTHING = 0.2
+
+
+class QueueFullError(Exception):
+    def __init__(self, queued: int, max_queued: int, retry_after_seconds: int):
+        super().__init__(f"The solver queue is full ({queued} of {max_queued} jobs waiting); "
+                         f"retry in {retry_after_seconds} seconds.")
+        self.retry_after_seconds = retry_after_seconds
+
+
+class JobProgress(JsonDomainBase):
+    job_id: str
+    solver_status: SolverStatus
+    score: Annotated[Optional[HardSoftScore], ScoreSerializer] = None
+    # Why the job stopped, if solving it failed
+    error: Optional[str] = None
+    # While scheduled: how many queued jobs start first, and a rough estimate of the wait
+    queue_position: Optional[int] = None
+    estimated_start_seconds: Optional[float] = None
+
+
+class BatchProgress(JsonDomainBase):
+    batch_id: str
+    priority: int
+    concurrency: int
+    # Job counts by solver status: waiting in the batch, solving and finished
+    scheduled: int
+    solving: int
+    finished: int
+    jobs: list[JobProgress]
+
+
+@dataclass
+class _BatchJob:
+    job_id: str
+    solver_status: SolverStatus = SolverStatus.SOLVING_SCHEDULED
+    score: Optional[HardSoftScore] = None
+    error: Optional[str] = None
+    started: Optional[float] = None
+
+
+@dataclass
+class _Batch:
+    batch_id: str
+    sequence: int
+    priority: int
+    concurrency: int
+    jobs: list[_BatchJob]
+    pending: deque[_BatchJob]
+    running: int = 0
+    # Job ids in the order they finished
+    finished: list[str] = field(default_factory=list)
+    waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = field(default_factory=list)
+
+    @property
+    def done(self) -> bool:
+        return len(self.finished) == len(self.jobs)
+
+
+class BatchScheduler:
+    """
+    start_job is called with a job id when the job may start solving, without any lock held;
+    the job must then report back through job_finished, whether it was solved, terminated or failed.
+    max_queued bounds the jobs waiting for a solver, None for no bound.
+    A finished batch is forgotten retain_finished_seconds later, the next time any batch is looked up.
+    """
+
+    def __init__(self, start_job: Callable[[str], None], max_running: int, max_queued: Optional[int] = None,
+                 retain_finished_seconds: float = 24 * 60 * 60):
+        self.start_job = start_job
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.retain_finished_seconds = retain_finished_seconds
+        self._batches: dict[str, _Batch] = {}
+        self._batch_by_job_id: dict[str, _Batch] = {}
+        # When each finished batch finished, the earliest first
+        self._finished_at: OrderedDict[str, float] = OrderedDict()
+        self._sequence = 0
+        self._running = 0
+        self._queued = 0
+        self._average_solve_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def submit(self, job_ids: list[str], priority: int = 0, concurrency: Optional[int] = None) -> str:
+        """
+        Queues the jobs, whose problems are already in the job store, and returns the batch id.
+        concurrency limits how many jobs of the batch solve at the same time; by default, as many as can.
+        Raises QueueFullError, queuing none of the jobs, when they do not fit in the queue.
+        """
+        if concurrency is not None and concurrency < 1:
+            raise ValueError(f"concurrency ({concurrency}) must be at least 1.")
+        if self.max_queued is not None \
+                and len(job_ids) - min(self.max_running, concurrency or self.max_running) > self.max_queued:
+            raise ValueError(f"A batch of {len(job_ids)} plans does not fit in the solver queue "
+                             f"({self.max_queued} jobs).")
+        jobs = [_BatchJob(job_id) for job_id in job_ids]
+        with self._lock:
+            self._forget_expired()
+            # Jobs that can start right away never wait in the queue
+            waiting = len(jobs) - max(0, min(self.max_running - self._running, concurrency or len(jobs)))
+            if self.max_queued is not None and waiting > 0 and self._queued + waiting > self.max_queued:
+                raise QueueFullError(self._queued, self.max_queued,
+                                     self._retry_after_seconds(self._queued + waiting - self.max_queued))
+            self._queued += len(jobs)
+            self._sequence += 1
+            batch = _Batch(str(uuid4()), self._sequence, priority, concurrency or self.max_running,
+                           jobs, deque(jobs))
+            self._batches[batch.batch_id] = batch
+            for job in jobs:
+                self._batch_by_job_id[job.job_id] = batch
+            if batch.done:
+                self._finished_at[batch.batch_id] = time.monotonic()
+        self._dispatch()
+        return batch.batch_id
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._lock:
+                if self._running >= self.max_running:
+                    return
+                candidates = [batch for batch in self._batches.values()
+                              if batch.pending and batch.running < batch.concurrency]
+                if not candidates:
+                    return
+                batch = max(candidates, key=lambda candidate: (candidate.priority, -candidate.sequence))
+                job = batch.pending.popleft()
+                job.solver_status = SolverStatus.SOLVING_ACTIVE
+                job.started = time.monotonic()
+                batch.running += 1
+                self._running += 1
+                self._queued -= 1
+            try:
+                self.start_job(job.job_id)
+            except Exception as e:
+                self.job_finished(job.job_id, error=str(e))
+                raise
+
+    def job_finished(self, job_id: str, score: Optional[HardSoftScore] = None, error: Optional[str] = None) -> None:
+        """
+        Called when a job finished, with the error if solving it failed;
+        does nothing for jobs that are not part of a batch.
+        """
+        with self._lock:
+            batch = self._batch_by_job_id.get(job_id)
+            if batch is None:
+                return
+            job = next(job for job in batch.jobs if job.job_id == job_id)
+            if job.solver_status == SolverStatus.NOT_SOLVING:
+                return
+            if job.solver_status == SolverStatus.SOLVING_ACTIVE:
+                batch.running -= 1
+                self._running -= 1
+                self._record_solve_seconds(time.monotonic() - job.started)
+            job.solver_status = SolverStatus.NOT_SOLVING
+            job.score = score
+            job.error = error
+            batch.finished.append(job_id)
+            waiters, batch.waiters = batch.waiters, []
+            if batch.done:
+                self._finished_at[batch.batch_id] = time.monotonic()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+        self._dispatch()
+
+    def cancel(self, batch_id: str) -> Optional[tuple[list[str], list[str]]]:
+        """
+        Drops the jobs of the batch that did not start yet, which count as finished from then on.
+        Returns the ids of the dropped jobs and of those that are solving, for the caller to terminate;
+        None if the batch is unknown.
+        """
+        with self._lock:
+            self._forget_expired()
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            dropped = [job.job_id for job in batch.pending]
+            batch.pending.clear()
+            self._queued -= len(dropped)
+            solving = [job.job_id for job in batch.jobs if job.solver_status == SolverStatus.SOLVING_ACTIVE]
+        for job_id in dropped:
+            self.job_finished(job_id)
+        return dropped, solving
+
+    def drop(self, job_id: str) -> bool:
+        """
+        Drops the job if it did not start yet, after which it counts as finished; returns whether it did.
+        """
+        with self._lock:
+            batch = self._batch_by_job_id.get(job_id)
+            job = None if batch is None else next(
+                (job for job in batch.pending if job.job_id == job_id), None)
+            if job is None:
+                return False
+            batch.pending.remove(job)
+            self._queued -= 1
+        self.job_finished(job_id)
+        return True
+
+    def job_progress(self, job_id: str) -> Optional[JobProgress]:
+        """
+        The status of a job of a batch that is not forgotten yet, with its place in the queue while scheduled.
+        """
+        with self._lock:
+            self._forget_expired()
+            batch = self._batch_by_job_id.get(job_id)
+            if batch is None:
+                return None
+            job = next(job for job in batch.jobs if job.job_id == job_id)
+            return self._job_progress(batch, job)
+
+    def progress(self, batch_id: str) -> Optional[BatchProgress]:
+        with self._lock:
+            self._forget_expired()
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            jobs = [self._job_progress(batch, job) for job in batch.jobs]
+        counts = {status: 0 for status in SolverStatus}
+        for job in jobs:
+            counts[job.solver_status] += 1
+        return BatchProgress(batch_id=batch.batch_id, priority=batch.priority, concurrency=batch.concurrency,
+                             scheduled=counts[SolverStatus.SOLVING_SCHEDULED],
+                             solving=counts[SolverStatus.SOLVING_ACTIVE],
+                             finished=counts[SolverStatus.NOT_SOLVING], jobs=jobs)
+
+    def _job_progress(self, batch: _Batch, job: _BatchJob) -> JobProgress:
+        progress = JobProgress(job_id=job.job_id, solver_status=job.solver_status, score=job.score, error=job.error)
+        if job.solver_status == SolverStatus.SOLVING_SCHEDULED:
+            # Ignoring concurrency limits, queued jobs start by batch priority, then batch age, then batch order
+            key = (batch.priority, -batch.sequence)
+            position = batch.pending.index(job) + sum(
+                len(other.pending) for other in self._batches.values()
+                if (other.priority, -other.sequence) > key)
+            progress.queue_position = position
+            if self._average_solve_seconds is not None:
+                # Each round of max_running jobs takes about one average solve
+                progress.estimated_start_seconds = round(
+                    self._average_solve_seconds * (position // self.max_running + 1), 1)
+        return progress
+
+    def _record_solve_seconds(self, seconds: float) -> None:
+        if self._average_solve_seconds is None:
+            self._average_solve_seconds = seconds
+        else:
+            self._average_solve_seconds += SOLVE_SECONDS_SMOOTHING * (seconds - self._average_solve_seconds)
+
+    def _retry_after_seconds(self, excess: int) -> int:
+        """
+        Roughly how long until excess queued jobs have started.
+        """
+        if self._average_solve_seconds is None:
+            return DEFAULT_RETRY_AFTER_SECONDS
+        return max(1, math.ceil(self._average_solve_seconds * math.ceil(excess / self.max_running)))
+
+    def __contains__(self, batch_id: str) -> bool:
+        with self._lock:
+            self._forget_expired()
+            return batch_id in self._batches
+
+    async def finished_jobs(self, batch_id: str) -> AsyncIterator[str]:
+        """
+        Yields the id of every job of the batch as it finishes, those already finished first,
+        until the whole batch is finished.
+        """
+        loop = asyncio.get_running_loop()
+        count = 0
+        while True:
+            with self._lock:
+                self._forget_expired()
+                batch = self._batches.get(batch_id)
+                if batch is None:
+                    return
+                job_ids = batch.finished[count:]
+                total = len(batch.jobs)
+                future = None
+                if not job_ids and count < total:
+                    future = loop.create_future()
+                    batch.waiters.append((loop, future))
+            if future is not None:
+                await future
+                continue
+            for job_id in job_ids:
+                yield job_id
+            count += len(job_ids)
+            if count == total:
+                return
+
+    def _forget_expired(self) -> None:
+        """
+        Forgets the batches that finished more than retain_finished_seconds ago; called with the lock held.
+        Their jobs are all finished, so nobody waits for them.
+        """
+        expired_before = time.monotonic() - self.retain_finished_seconds
+        while self._finished_at:
+            batch_id, finished_at = next(iter(self._finished_at.items()))
+            if finished_at > expired_before:
+                return
+            del self._finished_at[batch_id]
+            for job in self._batches.pop(batch_id).jobs:
+                self._batch_by_job_id.pop(job.job_id, None)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
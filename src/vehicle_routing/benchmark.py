@@ -0,0 +1,347 @@
+"""
+Reproducible solver benchmarks.
+
+Every (variant, scale) run solves a seeded synthetic dataset in a fresh process,
+so peak RSS and class translation are measured per run. For example::
+
+    $ run-benchmark --scales 100 1000 --variants default --spent-limit 60 \\
+        --baseline benchmark-results/baseline.json
+
+The move-threads-N variants chart how move evaluation speed scales with cores
+and nearby / no-nearby compare nearby selection;
+they need timefold-enterprise installed::
+
+    $ run-benchmark --scales 1000 --variants default move-threads-2 move-threads-4 move-threads-8 move-threads-16
+
+--loading times the steps of loading a POST /route-plans body instead of solving::
+
+    $ run-benchmark --loading --scales 1000 2500
+
+--profile-constraints solves with profiled constraints (constraint_profiling) and reports,
+per constraint, the tuples its functions evaluated and its share of the time spent in them::
+
+    $ run-benchmark --profile-constraints --scales 1000
+"""
+import argparse
+import csv
+import dataclasses
+import json
+import multiprocessing
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+from timefold.solver.config import (SolverConfig, ScoreDirectorFactoryConfig, TerminationConfig, Duration,
+                                    MoveThreadCount)
+
+DEFAULT_SCALES = (100, 1_000, 5_000)
+MOVE_THREAD_COUNTS = (2, 4, 8, 16)
+
+
+def _default_variant(config: SolverConfig) -> SolverConfig:
+    return config
+
+
+def _move_threads_variant(move_thread_count: int) -> Callable[[SolverConfig], SolverConfig]:
+    # Replaces the config directly instead of going through create_solver_config,
+    # so a community edition install fails loudly instead of silently benchmarking one thread
+    def variant(config: SolverConfig) -> SolverConfig:
+        return dataclasses.replace(config, move_thread_count=move_thread_count)
+    return variant
+
+
+# Named solver_config variants; each maps the production config to the config to benchmark
+BENCHMARK_VARIANTS: dict[str, Callable[[SolverConfig], SolverConfig]] = {
+    'default': _default_variant,
+    'move-threads-auto': lambda config: dataclasses.replace(config, move_thread_count=MoveThreadCount.AUTO),
+    **{f'move-threads-{count}': _move_threads_variant(count) for count in MOVE_THREAD_COUNTS},
+    'nearby': lambda config: dataclasses.replace(config,
+                                                 nearby_distance_meter_function=_visit_nearby_distance_meter()),
+    'no-nearby': lambda config: dataclasses.replace(config, nearby_distance_meter_function=None),
+    # Timefold's default phases, which only move single visits
+    'visit-moves': lambda config: dataclasses.replace(config, xml_source_text=None),
+    # Trip moves that skip insertions making a later visit late (SOLVER_TIME_WINDOW_FILTER)
+    'time-window-filter': lambda config: dataclasses.replace(config, xml_source_text=_trip_moves_xml(True)),
+    'no-time-window-filter': lambda config: dataclasses.replace(config, xml_source_text=_trip_moves_xml(False)),
+}
+
+
+def _visit_nearby_distance_meter():
+    from .nearby import get_visit_nearby_distance_meter
+    return get_visit_nearby_distance_meter()
+
+
+def _trip_moves_xml(time_window_filter: bool) -> str:
+    from .solver import trip_moves_solver_config_xml
+    return trip_moves_solver_config_xml(time_window_filter)
+
+
+@dataclass
+class BenchmarkResult:
+    variant: str
+    dataset: str
+    trip_count: int
+    vehicle_count: int
+    best_score: Optional[str] = None
+    feasible: bool = False
+    time_to_first_feasible_millis: Optional[int] = None
+    solve_millis: int = 0
+    move_evaluation_count: int = 0
+    move_evaluation_speed: int = 0
+    score_calculation_count: int = 0
+    score_calculation_speed: int = 0
+    peak_rss_bytes: int = 0
+    # (millis spent, best score) for every new best solution
+    score_over_time: list[tuple[int, str]] = field(default_factory=list)
+    # ConstraintProfile dicts, with --profile-constraints
+    constraint_profile: list[dict] = field(default_factory=list)
+
+    @property
+    def key(self) -> tuple[str, str, int]:
+        return self.variant, self.dataset, self.trip_count
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_single(variant: str, dataset: str, trip_count: int, spent_limit_seconds: int,
+               vehicle_count: Optional[int] = None, profile_constraints: bool = False) -> BenchmarkResult:
+    """
+    Solves one benchmark dataset in the current process, with profiled constraints if profile_constraints.
+    """
+    from jpype import JImplements, JOverride
+
+    from .demo_data import DemoData, generate_benchmark_input, generate_demo_data
+    from .solver import solver_config, prepare_problem
+    from timefold.solver import SolverFactory
+
+    benchmark_input = generate_benchmark_input(DemoData[dataset], trip_count, vehicle_count)
+    problem = generate_demo_data(benchmark_input)
+    config = dataclasses.replace(BENCHMARK_VARIANTS[variant](solver_config),
+                                 termination_config=TerminationConfig(
+                                     spent_limit=Duration(seconds=spent_limit_seconds)))
+    profiler = None
+    if profile_constraints:
+        from .constraint_profiling import ConstraintProfiler
+        profiler = ConstraintProfiler()
+        config = dataclasses.replace(config, score_director_factory_config=ScoreDirectorFactoryConfig(
+            constraint_provider_function=profiler.constraint_provider()))
+    solver = SolverFactory.create(config).build_solver()
+    result = BenchmarkResult(variant=variant, dataset=dataset, trip_count=trip_count,
+                             vehicle_count=len(problem.vehicles))
+
+    # Listen on the Java solver directly: Solver.add_event_listener would copy
+    # every new best solution back to Python, which would skew the measurements
+    from ai.timefold.solver.core.api.solver.event import SolverEventListener  # noqa
+
+    @JImplements(SolverEventListener)
+    class ScoreRecorder:
+        @JOverride
+        def bestSolutionChanged(self, event):
+            score = event.getNewBestScore()
+            millis = event.getTimeMillisSpent()
+            result.score_over_time.append((millis, str(score.toString())))
+            if result.time_to_first_feasible_millis is None and score.isSolutionInitialized() \
+                    and score.isFeasible():
+                result.time_to_first_feasible_millis = millis
+
+    solver._delegate.addEventListener(ScoreRecorder())  # noqa
+    start = time.perf_counter()
+    solution = solver.solve(prepare_problem(problem))
+    result.solve_millis = round((time.perf_counter() - start) * 1000)
+
+    result.best_score = str(solution.score)
+    result.feasible = solution.score.is_feasible
+    result.move_evaluation_count = solver._delegate.getMoveEvaluationCount()  # noqa
+    result.move_evaluation_speed = solver._delegate.getMoveEvaluationSpeed()  # noqa
+    result.score_calculation_count = solver._delegate.getScoreCalculationCount()  # noqa
+    result.score_calculation_speed = solver._delegate.getScoreCalculationSpeed()  # noqa
+    result.peak_rss_bytes = _peak_rss_bytes()
+    if profiler is not None:
+        result.constraint_profile = [profile.model_dump() for profile in profiler.constraint_profiles()]
+    return result
+
+
+def run_benchmark(variants: list[str], dataset: str, scales: list[int],
+                  spent_limit_seconds: int, profile_constraints: bool = False) -> list[BenchmarkResult]:
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for trip_count in scales:
+        for variant in variants:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_single, variant, dataset, trip_count, spent_limit_seconds,
+                                         None, profile_constraints).result()
+            print(f'{variant} / {dataset} / {trip_count} trips: {result.best_score}, '
+                  f'{result.move_evaluation_speed} moves/s, {result.score_calculation_speed} score calculations/s',
+                  flush=True)
+            results.append(result)
+    return results
+
+
+SUMMARY_FIELDS = [field.name for field in dataclasses.fields(BenchmarkResult)
+                  if field.name not in ('score_over_time', 'constraint_profile')]
+
+
+def write_results(results: list[BenchmarkResult], output_directory: Path) -> None:
+    output_directory.mkdir(parents=True, exist_ok=True)
+    with open(output_directory / 'results.json', 'w') as file:
+        json.dump([dataclasses.asdict(result) for result in results], file, indent=2)
+    with open(output_directory / 'results.csv', 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=SUMMARY_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for result in results:
+            writer.writerow(dataclasses.asdict(result))
+    with open(output_directory / 'score_over_time.csv', 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['variant', 'dataset', 'trip_count', 'millis', 'score'])
+        for result in results:
+            for millis, score in result.score_over_time:
+                writer.writerow([*result.key, millis, score])
+    if any(result.constraint_profile for result in results):
+        with open(output_directory / 'constraint_profile.csv', 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['variant', 'dataset', 'trip_count', 'constraint', 'tuples_evaluated', 'seconds', 'share'])
+            for result in results:
+                for profile in result.constraint_profile:
+                    writer.writerow([*result.key, profile['name'], profile['tuples_evaluated'],
+                                     profile['seconds'], profile['share']])
+
+
+def load_results(path: Path) -> list[BenchmarkResult]:
+    with open(path) as file:
+        return [BenchmarkResult(**{**result, 'score_over_time': [tuple(point) for point in result['score_over_time']]})
+                for result in json.load(file)]
+
+
+def _relative_change(new: Optional[float], old: Optional[float]) -> str:
+    if new is None or old is None:
+        return 'n/a'
+    if old == 0:
+        return 'n/a' if new == 0 else '+inf'
+    return f'{(new - old) / old:+.1%}'
+
+
+def compare_to_baseline(results: list[BenchmarkResult], baseline: list[BenchmarkResult]) -> str:
+    """
+    Renders a plain-text table comparing every result with the baseline run of the same key.
+    """
+    baseline_by_key = {result.key: result for result in baseline}
+    header = ('variant', 'dataset', 'trips', 'best score', 'baseline score',
+              'moves/s', 'score calcs/s', 'first feasible', 'peak RSS')
+    rows = [header]
+    for result in results:
+        old = baseline_by_key.get(result.key)
+        if old is None:
+            rows.append((*map(str, result.key), result.best_score, 'n/a', 'n/a', 'n/a', 'n/a', 'n/a'))
+            continue
+        rows.append((*map(str, result.key), result.best_score, old.best_score,
+                     _relative_change(result.move_evaluation_speed, old.move_evaluation_speed),
+                     _relative_change(result.score_calculation_speed, old.score_calculation_speed),
+                     _relative_change(result.time_to_first_feasible_millis, old.time_to_first_feasible_millis),
+                     _relative_change(result.peak_rss_bytes, old.peak_rss_bytes)))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    return '\n'.join('  '.join(value.ljust(width) for value, width in zip(row, widths)) for row in rows)
+
+
+def scaling_report(results: list[BenchmarkResult], reference_variant: str = 'default') -> str:
+    """
+    Renders the speedup of every variant over the reference variant at the same scale,
+    e.g. the move thread scaling curve.
+    """
+    reference_by_scale = {(result.dataset, result.trip_count): result
+                          for result in results if result.variant == reference_variant}
+    rows = [('variant', 'dataset', 'trips', 'moves/s', 'speedup', 'best score')]
+    for result in results:
+        reference = reference_by_scale.get((result.dataset, result.trip_count))
+        speedup = 'n/a' if reference is None or reference.move_evaluation_speed == 0 \
+            else f'{result.move_evaluation_speed / reference.move_evaluation_speed:.2f}x'
+        rows.append((*map(str, result.key), str(result.move_evaluation_speed), speedup, result.best_score))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join('  '.join(value.ljust(width) for value, width in zip(row, widths)) for row in rows)
+
+
+def constraint_profile_report(results: list[BenchmarkResult]) -> str:
+    """
+    Renders the constraint profile of every profiled result, the most expensive constraint first.
+    """
+    rows = [('variant', 'dataset', 'trips', 'constraint', 'tuples evaluated', 'lambda seconds', 'share')]
+    for result in results:
+        for profile in result.constraint_profile:
+            rows.append((*map(str, result.key), profile['name'], str(profile['tuples_evaluated']),
+                         f"{profile['seconds']:.3f}", f"{profile['share']:.1%}"))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join('  '.join(value.ljust(width) for value, width in zip(row, widths)) for row in rows)
+
+
+def _best_time(function: Callable[[], object], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_loading(dataset: str, scales: list[int], repeat: int = 5) -> str:
+    """
+    Times every step of loading the POST /route-plans body of a generated plan at every scale, best of repeat,
+    and renders the result as a plain-text table.
+    """
+    import orjson
+
+    from .demo_data import DemoData, generate_benchmark_input, generate_demo_data
+    from .domain import load_vehicle_route_plan
+    from .travel_time import attach_travel_time_matrix
+
+    rows = [('trips', 'visits', 'body', 'json.loads', 'orjson.loads', 'travel times', 'load_vehicle_route_plan')]
+    for trip_count in scales:
+        problem = generate_demo_data(generate_benchmark_input(DemoData[dataset], trip_count, None))
+        body = problem.model_dump_json(by_alias=True, exclude_none=True).encode()
+        locations = [vehicle.home_location for vehicle in problem.vehicles] + \
+                    [visit.location for visit in problem.visits]
+        rows.append((str(trip_count), str(len(problem.visits)), f'{len(body) / 1e6:.1f} MB',
+                     *(f'{_best_time(step, repeat):.3f} s' for step in (
+                         lambda: json.loads(body),
+                         lambda: orjson.loads(body),
+                         lambda: attach_travel_time_matrix(locations),
+                         lambda: load_vehicle_route_plan(body)))))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join('  '.join(value.ljust(width) for value, width in zip(row, widths)) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the vehicle routing solver on synthetic datasets.')
+    parser.add_argument('--variants', nargs='+', default=['default'], choices=sorted(BENCHMARK_VARIANTS))
+    parser.add_argument('--dataset', default='HARTFORT', help='DemoData region and seed to generate trips with')
+    parser.add_argument('--scales', nargs='+', type=int, default=list(DEFAULT_SCALES), help='Trip counts')
+    parser.add_argument('--spent-limit', type=int, default=30, help='Seconds per solve')
+    parser.add_argument('--output-dir', type=Path, default=Path('benchmark-results'))
+    parser.add_argument('--baseline', type=Path, help='results.json of an earlier run to compare with')
+    parser.add_argument('--loading', action='store_true', help='Time loading plans instead of solving them')
+    parser.add_argument('--profile-constraints', action='store_true',
+                        help='Solve with profiled constraints and report the time spent in each')
+    args = parser.parse_args()
+
+    if args.loading:
+        print(benchmark_loading(args.dataset, args.scales))
+        return
+
+    results = run_benchmark(args.variants, args.dataset, args.scales, args.spent_limit, args.profile_constraints)
+    write_results(results, args.output_dir)
+    if args.profile_constraints:
+        print(constraint_profile_report(results))
+    if len(args.variants) > 1:
+        print(scaling_report(results, args.variants[0]))
+    if args.baseline is not None:
+        print(compare_to_baseline(results, load_results(args.baseline)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Opt-in profiling of the constraints: how many tuples each constraint's functions evaluate, and the time spent in them.
+
+ConstraintProfiler builds the constraints of create_constraints from a factory that wraps every function passed to
+a stream operation (filter, join, group_by, penalize, ...) before the solver translates it.
+The wrapper counts calls and nanoseconds in Java counters, since state the translated functions keep on the Python
+side does not outlive the call. Functions passed to Joiners and ConstraintCollectors are not wrapped.
+
+Profiled constraints run slower than the plain ones: every call reads the clock twice,
+which weighs most on the cheapest functions, and wrapped functions no longer let the solver share
+the nodes that several constraints have in common (pickup_dropoff_pairs).
+Compare the shares of the constraints rather than absolute speeds.
+"""
+import dataclasses
+import inspect
+import time
+from typing import Annotated, Any, Callable, Optional
+
+from timefold.solver import SolverFactory
+from timefold.solver.config import ScoreDirectorFactoryConfig, TerminationConfig, Duration
+from timefold.solver.score import ConstraintFactory, constraint_provider
+
+from .json_serialization import *
+from .domain import VehicleRoutePlan
+# Importing the constraints starts the JVM, which the Java imports below need
+from .constraints import create_constraints
+from java.lang import System  # noqa
+from java.util.concurrent.atomic import AtomicLongArray  # noqa
+
+DEFAULT_PROFILE_SPENT_LIMIT_SECONDS = 10
+
+
+class LambdaProfile(JsonDomainBase):
+    # The stream operation the function was passed to, e.g. filter
+    operation: str
+    calls: int
+    seconds: float
+
+
+class ConstraintProfile(JsonDomainBase):
+    name: str
+    # Calls of all of its functions: the tuples its filters, joins, groupings and weighers evaluated
+    tuples_evaluated: int
+    seconds: float
+    # Of the time spent in the functions of all constraints
+    share: float
+    lambdas: list[LambdaProfile]
+
+
+class ConstraintProfileReport(JsonDomainBase):
+    score: Annotated[Optional[HardSoftScore], ScoreSerializer] = None
+    solve_seconds: float
+    # None when the solver does not expose it
+    score_calculation_count: Optional[int] = None
+    # Time spent in the functions of all constraints; the rest of the solve is Java constraint streams and moves
+    lambda_seconds: float
+    constraints: list[ConstraintProfile]
+
+
+def _profiled(function: Callable, counters: Any) -> Callable:
+    """
+    Wraps the function with one of the same arity, as the solver translates a function by its arity,
+    adding a call to counters[0] and its nanoseconds to counters[1].
+    """
+    arity = len(inspect.signature(function).parameters)
+    if arity == 1:
+        def profiled(a):
+            start = System.nanoTime()
+            result = function(a)
+            counters.addAndGet(1, System.nanoTime() - start)
+            counters.incrementAndGet(0)
+            return result
+    elif arity == 2:
+        def profiled(a, b):
+            start = System.nanoTime()
+            result = function(a, b)
+            counters.addAndGet(1, System.nanoTime() - start)
+            counters.incrementAndGet(0)
+            return result
+    elif arity == 3:
+        def profiled(a, b, c):
+            start = System.nanoTime()
+            result = function(a, b, c)
+            counters.addAndGet(1, System.nanoTime() - start)
+            counters.incrementAndGet(0)
+            return result
+    elif arity == 4:
+        def profiled(a, b, c, d):
+            start = System.nanoTime()
+            result = function(a, b, c, d)
+            counters.addAndGet(1, System.nanoTime() - start)
+            counters.incrementAndGet(0)
+            return result
+    else:
+        return function
+    return profiled
+
+
+class _ProfiledStream:
+    """
+    A constraint factory, stream or builder that profiles the functions passed to it
+    and wraps the streams it returns, until as_constraint names the constraint they were for.
+    """
+
+    def __init__(self, delegate: Any, profiler: 'ConstraintProfiler', counters: list[tuple[str, Any]]):
+        self._delegate = delegate
+        self._profiler = profiler
+        # (operation, counters) of every profiled function of the stream so far, in order
+        self._counters = counters
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._delegate, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            counters = list(self._counters)
+            delegate_args = []
+            for arg in args:
+                if isinstance(arg, _ProfiledStream):
+                    counters += arg._counters
+                    arg = arg._delegate
+                elif inspect.isfunction(arg):
+                    function_counters = AtomicLongArray(2)
+                    counters.append((name, function_counters))
+                    arg = _profiled(arg, function_counters)
+                delegate_args.append(arg)
+            result = attribute(*delegate_args, **kwargs)
+            if name == 'as_constraint':
+                self._profiler.add_constraint(kwargs.get('constraint_name', args[-1] if args else None), counters)
+                return result
+            return _ProfiledStream(result, self._profiler, counters)
+        return call
+
+
+class ConstraintProfiler:
+    """
+    Collects the counters of the constraints built by its constraint_provider; thread-safe while solving.
+    """
+
+    def __init__(self):
+        # The counters of every build of every constraint by name; the solver may build the constraints more than once
+        self._builds: dict[str, list[list[tuple[str, Any]]]] = {}
+
+    def add_constraint(self, name: str, counters: list[tuple[str, Any]]) -> None:
+        self._builds.setdefault(name, []).append(counters)
+
+    def constraint_provider(self) -> Callable[[ConstraintFactory], list]:
+        @constraint_provider
+        def define_profiled_constraints(factory: ConstraintFactory):
+            return create_constraints(_ProfiledStream(factory, self, []))
+        return define_profiled_constraints
+
+    def constraint_profiles(self) -> list[ConstraintProfile]:
+        """
+        The profile of every constraint, the most expensive first; the counters of every build add up.
+        """
+        lambdas_by_constraint = {}
+        for name, builds in self._builds.items():
+            lambdas = [LambdaProfile(operation=operation, calls=0, seconds=0) for operation, _ in builds[0]]
+            for counters in builds:
+                for profile, (_, function_counters) in zip(lambdas, counters):
+                    profile.calls += function_counters.get(0)
+                    profile.seconds += function_counters.get(1) / 1e9
+            lambdas_by_constraint[name] = lambdas
+        total_seconds = sum(profile.seconds for lambdas in lambdas_by_constraint.values() for profile in lambdas)
+        profiles = []
+        for name, lambdas in lambdas_by_constraint.items():
+            seconds = sum(profile.seconds for profile in lambdas)
+            profiles.append(ConstraintProfile(name=name, tuples_evaluated=sum(profile.calls for profile in lambdas),
+                                              seconds=seconds, share=seconds / total_seconds if total_seconds else 0,
+                                              lambdas=lambdas))
+        return sorted(profiles, key=lambda profile: -profile.seconds)
+
+
+def score_calculation_count(solver: Any) -> Optional[int]:
+    """
+    The score calculation count of the solver's last solve, read from the Java solver it wraps;
+    None if a timefold version no longer wraps it as _delegate.
+    """
+    delegate = getattr(solver, '_delegate', None)
+    if delegate is None or not hasattr(delegate, 'getScoreCalculationCount'):
+        return None
+    return delegate.getScoreCalculationCount()
+
+
+def profile_solve(route_plan: VehicleRoutePlan,
+                  spent_limit_seconds: float = DEFAULT_PROFILE_SPENT_LIMIT_SECONDS) -> ConstraintProfileReport:
+    """
+    Solves the plan for the spent limit with profiled constraints, in the calling thread.
+    """
+    from .solver import solver_config, prepare_problem
+
+    profiler = ConstraintProfiler()
+    config = dataclasses.replace(
+        solver_config,
+        score_director_factory_config=ScoreDirectorFactoryConfig(
+            constraint_provider_function=profiler.constraint_provider()),
+        termination_config=TerminationConfig(spent_limit=Duration(milliseconds=round(spent_limit_seconds * 1000))))
+    solver = SolverFactory.create(config).build_solver()
+    start = time.perf_counter()
+    solution = solver.solve(prepare_problem(route_plan))
+    constraints = profiler.constraint_profiles()
+    return ConstraintProfileReport(
+        score=solution.score, solve_seconds=time.perf_counter() - start,
+        score_calculation_count=score_calculation_count(solver),
+        lambda_seconds=sum(profile.seconds for profile in constraints), constraints=constraints)
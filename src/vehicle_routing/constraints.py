@@ -1,4 +1,5 @@
-from timefold.solver.score import ConstraintFactory, HardSoftScore, constraint_provider
+from timefold.solver.score import (Constraint, ConstraintCollectors, ConstraintFactory, HardSoftScore, Joiners,
+                                  constraint_provider)
 
 from .domain import *
 
@@ -9,6 +10,13 @@ SERVICE_FINISHED_AFTER_MAX_END_TIME = "serviceFinishedAfterMaxEndTime"
 
 @constraint_provider
 def define_constraints(factory: ConstraintFactory):
+    return create_constraints(factory)
+
+
+def create_constraints(factory: ConstraintFactory) -> list[Constraint]:
+    """
+    The constraints of define_constraints, built from any factory, for example one that profiles them.
+    """
     return [
         # Hard constraints
         vehicle_capacity(factory),
@@ -33,9 +41,19 @@ def define_constraints(factory: ConstraintFactory):
 # Hard constraints
 ##############################################
 
-def pickup_immediately_before_dropoff(factory: ConstraintFactory):
+def pickup_dropoff_pairs(factory: ConstraintFactory):
+    """
+    Every (pickup, drop-off) pair exactly once, joined on the integer pair_index
+    resolved by link_paired_visits when the plan is loaded.
+    """
     return (factory.for_each(Visit)
-            .join(Visit, Joiners.equal(lambda visit: visit.paired_visit_id, lambda paired: paired.id))  # ✅ Match pickup to drop-off
+            .filter(lambda visit: visit.is_pickup and visit.pair_index is not None)
+            .join(factory.for_each(Visit).filter(lambda visit: visit.is_dropoff and visit.pair_index is not None),
+                  Joiners.equal(lambda pickup: pickup.pair_index, lambda dropoff: dropoff.pair_index)))
+
+
+def pickup_immediately_before_dropoff(factory: ConstraintFactory):
+    return (pickup_dropoff_pairs(factory)
             .filter(lambda visit, paired: visit.vehicle is not None and paired.vehicle is not None)  # ✅ Ensure both visits have assigned vehicles
             .filter(lambda visit, paired: visit.vehicle.id == paired.vehicle.id)  # ✅ Ensure same vehicle
             .filter(lambda visit, paired: visit.next_visit is not None)  # ✅ Ensure there's a next visit
@@ -52,10 +70,15 @@ def use_more_vehicles(factory: ConstraintFactory):
 
 
 def vehicle_capacity(factory: ConstraintFactory):
-    return (factory.for_each(Vehicle)
-            .filter(lambda vehicle: vehicle.calculate_total_demand() > vehicle.capacity)
-            .penalize(HardSoftScore.ONE_HARD,
-                      lambda vehicle: vehicle.calculate_total_demand() - vehicle.capacity)
+    """
+    Penalizes the peak load on board of every vehicle beyond its capacity.
+    The peak is the largest onboard_load on the route, kept up to date incrementally by the group by.
+    """
+    return (factory.for_each(Visit)
+            .filter(lambda visit: visit.vehicle is not None and visit.onboard_load is not None)
+            .group_by(lambda visit: visit.vehicle, ConstraintCollectors.max(lambda visit: visit.onboard_load))
+            .filter(lambda vehicle, peak_load: peak_load > vehicle.capacity)
+            .penalize(HardSoftScore.ONE_HARD, lambda vehicle, peak_load: peak_load - vehicle.capacity)
             .as_constraint(VEHICLE_CAPACITY)
             )
 
@@ -68,8 +91,6 @@ def service_finished_after_max_end_time(factory: ConstraintFactory):
             .as_constraint(SERVICE_FINISHED_AFTER_MAX_END_TIME)
             )
 
-from timefold.solver.score import Joiners  # ✅ Import Joiners
-
 # def pickup_before_dropoff(factory: ConstraintFactory):
 #     return (factory.for_each(Visit)
 #             .join(Visit, Joiners.equal(lambda visit: visit.paired_visit_id, lambda paired: paired.id))
@@ -86,24 +107,27 @@ from timefold.solver.score import Joiners  # ✅ Import Joiners
 #             .as_constraint("pickupBeforeDropoff"))
 
 def pickup_before_dropoff(factory: ConstraintFactory):
-    return (factory.for_each(Visit)
-            .join(Visit, Joiners.equal(lambda visit: visit.paired_visit_id, lambda paired: paired.id))  
+    return (pickup_dropoff_pairs(factory)
             .filter(lambda visit, paired: visit.vehicle is not None and paired.vehicle is not None)  # ✅ Ensure both visits have a vehicle
             .filter(lambda visit, paired: visit.vehicle.id == paired.vehicle.id)  # ✅ Ensure same vehicle
-            .filter(lambda visit, paired: visit.is_pickup and paired.is_dropoff)  # ✅ Ensure correct visit types
             .filter(lambda visit, paired: is_dropoff_before_pickup(visit, paired))  # ❌ Drop-off appears before pickup
             .penalize(HardSoftScore.ONE_HARD, lambda visit, paired: 100_000)  # ✅ Extreme penalty
             .as_constraint("pickupBeforeDropoff"))
 
 
 def is_dropoff_before_pickup(pickup: Visit, dropoff: Visit) -> bool:
-    """Check if the drop-off appears before the pickup in the visit chain."""
-    current = dropoff.previous_visit  # Start from drop-off and move backward
-    while current is not None:
-        if current.id == pickup.id:
-            return False  # ✅ Pickup is before drop-off (correct order)
-        current = current.previous_visit  # Move backward in the chain
-    return True  # ❌ Drop-off was found before pickup (incorrect)
+    """Check if the drop-off appears before the pickup in the (shared) route."""
+    # Arrivals never get earlier along a route, so they order the two visits without walking it.
+    # Two visits only arrive in the same second when nothing separates them, so a tie walks just those visits
+    if pickup.arrival_seconds is not None and dropoff.arrival_seconds is not None \
+            and pickup.arrival_seconds != dropoff.arrival_seconds:
+        return dropoff.arrival_seconds < pickup.arrival_seconds
+    visit = dropoff.next_visit
+    while visit is not None and visit.arrival_seconds == dropoff.arrival_seconds:
+        if visit.id == pickup.id:
+            return True
+        visit = visit.next_visit
+    return False
 
 
 def force_dropoff_after_pickup(factory: ConstraintFactory):
@@ -123,8 +147,7 @@ def force_dropoff_after_pickup(factory: ConstraintFactory):
 #             .as_constraint("pickupAndDropoffSameVehicle"))
 
 def pickup_and_dropoff_same_vehicle(factory: ConstraintFactory):
-    return (factory.for_each(Visit)
-            .join(Visit, Joiners.equal(lambda visit: visit.paired_visit_id, lambda paired: paired.id))  # ✅ Match pickup to drop-off
+    return (pickup_dropoff_pairs(factory)
             .filter(lambda visit, paired: visit.vehicle is not None and paired.vehicle is not None)  # ✅ Ensure both visits have assigned vehicles
             .filter(lambda visit, paired: visit.vehicle.id != paired.vehicle.id)  # ❌ If vehicles are different, apply penalty
             .penalize(HardSoftScore.ONE_HARD, lambda visit, paired: 100_000)  # ✅ Extreme penalty to block incorrect assignments
@@ -134,7 +157,7 @@ def pickup_and_dropoff_same_vehicle(factory: ConstraintFactory):
 def match_vehicle_type(factory: ConstraintFactory):
     return (factory.for_each(Visit)
             .filter(lambda visit: visit.vehicle is not None)  # ✅ Ensure visit has an assigned vehicle
-            .filter(lambda visit: visit.vehicle.vehicle_type != visit.vehicle_type)  # ✅ Check if types mismatch
+            .filter(lambda visit: visit.vehicle_type_mask & visit.vehicle.vehicle_type_mask == 0)  # ✅ Check if types mismatch
             .penalize(HardSoftScore.of(10_000, 0), lambda visit: 1)  # ✅ Penalize mismatched vehicle types
             .as_constraint("vehicleTypeConstraint"))
 
@@ -190,14 +213,22 @@ def balance_vehicle_load(factory: ConstraintFactory):
 
 def enforce_valid_arrival_time(factory: ConstraintFactory):
     return (factory.for_each(Visit)
-            .filter(lambda visit: visit.arrival_time is not None and visit.min_start_time is not None and visit.max_end_time is not None)  # ✅ Ensure valid time range
-            .filter(lambda visit: visit.arrival_time < visit.min_start_time or visit.arrival_time > visit.max_end_time)  # ❌ Arrival time outside range
-            .penalize(HardSoftScore.ONE_HARD,  
-                      lambda visit: 10_000 if abs((visit.arrival_time - visit.min_start_time).seconds // 60) > 10 
-                      else 100 * abs((visit.arrival_time - visit.min_start_time).seconds // 60))  # ✅ Hard penalty for extreme violations, soft for small ones
+            .filter(lambda visit: visit.arrival_seconds is not None)  # ✅ Ensure visit has an assigned arrival time
+            .filter(lambda visit: visit.arrival_seconds < visit.min_start_seconds or visit.arrival_seconds > visit.max_end_seconds)  # ❌ Arrival time outside range
+            .penalize(HardSoftScore.ONE_HARD,
+                      lambda visit: 10_000 if arrival_minutes_after_min_start(visit) > 10
+                      else 100 * arrival_minutes_after_min_start(visit))  # ✅ Hard penalty for extreme violations, soft for small ones
             .as_constraint("enforceValidArrivalTime"))
 
 
+def arrival_minutes_after_min_start(visit: Visit) -> int:
+    """
+    The minutes from min_start_time to the arrival, within a day, as timedelta.seconds // 60 counts them:
+    an arrival 5 minutes early counts as 1435 minutes.
+    """
+    return (visit.arrival_seconds - visit.min_start_seconds) % 86_400 // 60
+
+
 ##############################################
 # Soft constraints
 ##############################################
@@ -0,0 +1,107 @@
+"""
+Trip-level construction heuristic.
+
+The hard constraints want every pickup on the same vehicle as, and immediately before, its drop-off,
+so a route is a sequence of trips. Timefold's construction heuristic inserts one visit at a time,
+which splits nearly every trip and leaves local search to repair ±100,000 hard penalties.
+place_trips instead assigns whole trips, in pickup time order,
+each appended to the vehicle that best keeps it within its time windows.
+The solver then starts from a plan whose routes only consist of complete trips.
+"""
+import numpy as np
+
+from .domain import Vehicle, Visit, VehicleRoutePlan
+
+
+def unassigned_trips(route_plan: VehicleRoutePlan) -> list[tuple[Visit, Visit]]:
+    """
+    Returns the (pickup, drop-off) pairs of which neither visit is on a route yet,
+    ordered by pickup time.
+    """
+    assigned = {id(visit) for vehicle in route_plan.vehicles for visit in vehicle.visits}
+    trips = [(visit, visit.paired_visit) for visit in route_plan.visits
+             if visit.is_pickup and visit.paired_visit is not None
+             and id(visit) not in assigned and id(visit.paired_visit) not in assigned]
+    trips.sort(key=lambda trip: trip[0].min_start_time)
+    return trips
+
+
+def update_route_shadow_variables(vehicle: Vehicle) -> None:
+    """
+    Sets the shadow variables of every visit on the route, as the solver would after a move.
+    The solver does not recompute them for routes that are already populated when solving starts.
+    """
+    previous_visit = None
+    for visit in vehicle.visits:
+        visit.vehicle = vehicle
+        visit.previous_visit = previous_visit
+        visit.next_visit = None
+        if previous_visit is not None:
+            previous_visit.next_visit = visit
+        visit.update_arrival_time()
+        visit.update_onboard_load()
+        previous_visit = visit
+
+
+def place_trips(route_plan: VehicleRoutePlan) -> int:
+    """
+    Appends every unassigned trip to a route, pickup directly followed by drop-off,
+    and returns the number of trips placed.
+
+    A trip goes to the compatible vehicle (same vehicle_type, or any vehicle if none is compatible)
+    that is not offline and arrives within the fewest of the pickup and drop-off time windows;
+    among those, unused vehicles first, then the shortest drive to the pickup.
+    Visits without a pair, and trips when every vehicle is offline,
+    are left to the solver's own construction heuristic.
+    """
+    trips = unassigned_trips(route_plan)
+    vehicles = route_plan.vehicles
+    if not trips or not vehicles:
+        return 0
+    matrix = route_plan.travel_time_matrix
+
+    # Where and when every vehicle becomes free, given the visits already on its route
+    end_location = np.empty(len(vehicles), dtype=np.intp)
+    end_time = np.empty(len(vehicles), dtype=np.int64)
+    used = np.zeros(len(vehicles), dtype=bool)
+    changed = np.zeros(len(vehicles), dtype=bool)
+    for i, vehicle in enumerate(vehicles):
+        end_location[i], end_time[i] = vehicle.home_location.index, vehicle.departure_seconds
+        for visit in vehicle.visits:
+            arrival = end_time[i] + matrix[end_location[i], visit.location.index]
+            end_location[i] = visit.location.index
+            end_time[i] = max(arrival, visit.min_start_seconds) + visit.service_seconds
+            used[i] = True
+    vehicle_types = np.array([vehicle.vehicle_type for vehicle in vehicles])
+    # An offline vehicle is pinned, so a trip placed on it would stay there for good
+    online = np.array([not vehicle.offline for vehicle in vehicles])
+
+    placed_count = 0
+    for pickup, dropoff in trips:
+        candidates = np.flatnonzero(online & (vehicle_types == pickup.vehicle_type))
+        if len(candidates) == 0:
+            candidates = np.flatnonzero(online)
+            if len(candidates) == 0:
+                break
+        deadhead = matrix[end_location[candidates], pickup.location.index]
+        pickup_arrival = end_time[candidates] + deadhead
+        pickup_departure = np.maximum(pickup_arrival, pickup.min_start_seconds) + pickup.service_seconds
+        dropoff_arrival = pickup_departure + matrix[pickup.location.index, dropoff.location.index]
+        # Arriving outside a visit's window, early or late, is what enforce_valid_arrival_time penalizes
+        window_violations = ((pickup_arrival < pickup.min_start_seconds).astype(np.int8) +
+                             (pickup_arrival > pickup.max_end_seconds) +
+                             (dropoff_arrival < dropoff.min_start_seconds) +
+                             (dropoff_arrival > dropoff.max_end_seconds))
+        # np.lexsort sorts by its last key first
+        best = candidates[np.lexsort((deadhead, used[candidates], window_violations))[0]]
+
+        vehicles[best].visits.extend((pickup, dropoff))
+        end_location[best] = dropoff.location.index
+        end_time[best] = max(dropoff_arrival[candidates == best][0], dropoff.min_start_seconds) \
+            + dropoff.service_seconds
+        used[best] = changed[best] = True
+        placed_count += 1
+
+    for i in np.flatnonzero(changed):
+        update_route_shadow_variables(vehicles[i])
+    return placed_count
@@ -0,0 +1,213 @@
+"""
+Versioned deltas between the best solutions of a job.
+
+Between consecutive best solutions usually only a few routes change,
+so a client that polls a large plan can send the version it last saw
+and only get the vehicles whose route changed and the visits whose placement or timing changed.
+
+Every best solution of a job solved in this process gets a new version, which costs nothing more than a counter.
+A snapshot of the routes is only taken when a version is served, since that is the only version
+a client can later ask a delta from, and the snapshots of the least recently served versions are dropped.
+A client asking for a delta from a version that is no longer known gets the full plan.
+Versions are local to the process, so with several workers a client should keep polling the same one.
+The versions of a job are forgotten once the job store no longer has it, or once more recently solved jobs
+push it out of the max_finished_jobs kept.
+
+Deltas are serialized like full plans (serialization.route_plan_to_dict), with the route metrics computed in one pass.
+"""
+import threading
+from collections import OrderedDict
+from typing import Annotated, Callable, Optional
+
+from pydantic import Field, PrivateAttr
+from timefold.solver import SolverStatus
+from timefold.solver.score import HardSoftScore
+
+from .domain import Vehicle, Visit, VehicleRoutePlan
+from .json_serialization import JsonDomainBase, ScoreSerializer
+from .serialization import RouteMetrics, compute_route_metrics, route_plan_to_dict, vehicle_to_dict, visit_to_dict
+
+DEFAULT_MAX_SNAPSHOTS = 64
+DEFAULT_MAX_FINISHED_JOBS = 1024
+
+# Vehicle id, previous visit id, index in the route and arrival (epoch seconds):
+# everything the computed fields of a visit depend on
+_Placement = tuple[Optional[str], Optional[str], Optional[int], Optional[int]]
+_UNASSIGNED: _Placement = (None, None, None, None)
+
+
+class RoutePlanDelta(JsonDomainBase):
+    """
+    The changes since base_version, or the whole plan when base_version is None.
+    """
+    version: int
+    base_version: Optional[int] = None
+    score: Annotated[Optional[HardSoftScore], ScoreSerializer, Field(default=None)]
+    solver_status: Optional[SolverStatus] = None
+    total_driving_time_seconds: int
+    vehicles: list[Vehicle] = Field(default_factory=list)
+    visits: list[Visit] = Field(default_factory=list)
+    plan: Optional[VehicleRoutePlan] = None
+    # The metrics of the whole plan, which the changed vehicles and visits are serialized with
+    _metrics: Optional[RouteMetrics] = PrivateAttr(default=None)
+
+
+def delta_to_dict(delta: RoutePlanDelta) -> dict:
+    """
+    Returns the JSON-ready dict of a delta of SolutionHistory.delta, as model_dump(mode='json', by_alias=True,
+    exclude_none=True) would.
+    """
+    data = delta.model_dump(mode='json', by_alias=True, exclude_none=True, exclude={'vehicles', 'visits', 'plan'})
+    data['vehicles'] = [vehicle_to_dict(vehicle, delta._metrics) for vehicle in delta.vehicles]
+    data['visits'] = [visit_to_dict(visit, delta._metrics) for visit in delta.visits]
+    if delta.plan is not None:
+        data['plan'] = route_plan_to_dict(delta.plan, metrics=delta._metrics)
+    return data
+
+
+class _Snapshot:
+    __slots__ = ('routes', 'placements')
+
+    def __init__(self, route_plan: VehicleRoutePlan):
+        self.routes: dict[str, tuple[str, ...]] = {}
+        self.placements: dict[str, _Placement] = {}
+        for vehicle in route_plan.vehicles:
+            visit_ids = tuple(visit.id for visit in vehicle.visits)
+            self.routes[vehicle.id] = visit_ids
+            previous_id = None
+            for index, (visit_id, visit) in enumerate(zip(visit_ids, vehicle.visits)):
+                self.placements[visit_id] = (vehicle.id, previous_id, index, visit.arrival_seconds)
+                previous_id = visit_id
+
+
+def diff(route_plan: VehicleRoutePlan, base: _Snapshot, current: _Snapshot) -> tuple[list[Vehicle], list[Visit]]:
+    """
+    Returns the vehicles whose route or timing changed, and the visits whose placement or timing changed.
+    """
+    changed_visit_ids = {visit_id for visit_id, placement in current.placements.items()
+                         if base.placements.get(visit_id, _UNASSIGNED) != placement}
+    # Visits that left every route
+    changed_visit_ids.update(visit_id for visit_id in base.placements if visit_id not in current.placements)
+    vehicles = [vehicle for vehicle in route_plan.vehicles
+                if base.routes.get(vehicle.id) != current.routes[vehicle.id]
+                or any(visit_id in changed_visit_ids for visit_id in current.routes[vehicle.id])]
+    visits = [visit for visit in route_plan.visits if visit.id in changed_visit_ids]
+    return vehicles, visits
+
+
+class SolutionHistory:
+    """
+    Tracks the versions of the jobs solved in this process; thread-safe.
+
+    While a job solves, its latest plan is kept with its version, so a version is never paired with
+    the plan of another version. Once the job is solved, its plan no longer changes and is read from the job store.
+    """
+
+    def __init__(self, max_snapshots: int = DEFAULT_MAX_SNAPSHOTS,
+                 max_finished_jobs: int = DEFAULT_MAX_FINISHED_JOBS):
+        self.max_snapshots = max_snapshots
+        self.max_finished_jobs = max_finished_jobs
+        self._versions: dict[str, int] = {}
+        self._solving_plans: dict[str, VehicleRoutePlan] = {}
+        # The jobs with a final solution, the least recently finished first
+        self._finished_jobs: OrderedDict[str, None] = OrderedDict()
+        # Least recently served first
+        self._snapshots: OrderedDict[tuple[str, int], _Snapshot] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, job_id: str, route_plan: VehicleRoutePlan, final: bool = False) -> int:
+        """
+        Called for every new best solution of a job, and with final=True for its final solution.
+        """
+        with self._lock:
+            version = self._versions.get(job_id, 0) + 1
+            self._versions[job_id] = version
+            if final:
+                self._solving_plans.pop(job_id, None)
+                self._finished_jobs[job_id] = None
+                self._finished_jobs.move_to_end(job_id)
+                while len(self._finished_jobs) > self.max_finished_jobs:
+                    self._forget(next(iter(self._finished_jobs)))
+            else:
+                self._solving_plans[job_id] = route_plan
+                self._finished_jobs.pop(job_id, None)
+            return version
+
+    def forget(self, job_id: str) -> None:
+        """
+        Drops the versions and snapshots of a job, for example once the job store no longer has it.
+        """
+        with self._lock:
+            self._forget(job_id)
+
+    def _forget(self, job_id: str) -> None:
+        self._versions.pop(job_id, None)
+        self._solving_plans.pop(job_id, None)
+        self._finished_jobs.pop(job_id, None)
+        for key in [key for key in self._snapshots if key[0] == job_id]:
+            del self._snapshots[key]
+
+    def _load(self, job_id: str, version: Optional[int],
+              load_plan: Callable[[], Optional[VehicleRoutePlan]]) -> Optional[VehicleRoutePlan]:
+        route_plan = load_plan()
+        if route_plan is None and version is not None:
+            # The job store forgot the job
+            self.forget(job_id)
+        return route_plan
+
+    def latest(self, job_id: str,
+               load_plan: Callable[[], Optional[VehicleRoutePlan]]) -> tuple[Optional[int], Optional[VehicleRoutePlan]]:
+        """
+        Returns the latest version of the job and its plan;
+        the version is None if the job is not solved in this process, and the plan is None if the job is unknown.
+        """
+        with self._lock:
+            version = self._versions.get(job_id)
+            route_plan = self._solving_plans.get(job_id)
+        if route_plan is None:
+            route_plan = self._load(job_id, version, load_plan)
+        return version, route_plan
+
+    def delta(self, job_id: str, base_version: Optional[int],
+              load_plan: Callable[[], Optional[VehicleRoutePlan]]) -> Optional[RoutePlanDelta]:
+        """
+        Returns the changes of the latest plan of the job since base_version,
+        or the whole plan if base_version is None or no longer known, or the job is not solved in this process.
+        load_plan reads the plan of a job that is not solving in this process; None means the job is unknown.
+        """
+        with self._lock:
+            version = self._versions.get(job_id)
+            route_plan = self._solving_plans.get(job_id)
+            base = self._snapshots.get((job_id, base_version)) if base_version is not None else None
+            if base is not None:
+                self._snapshots.move_to_end((job_id, base_version))
+            current = self._snapshots.get((job_id, version))
+        if route_plan is None:
+            route_plan = self._load(job_id, version, load_plan)
+            if route_plan is None:
+                return None
+        metrics = compute_route_metrics(route_plan)
+        common = dict(version=version or 0, score=route_plan.score, solver_status=route_plan.solver_status,
+                      total_driving_time_seconds=metrics.total_driving_time_seconds)
+        if version is None:
+            # Solved by another process: the plan may have changed without a new version
+            return _with_metrics(RoutePlanDelta(**common, plan=route_plan), metrics)
+        if current is None:
+            current = _Snapshot(route_plan)
+            with self._lock:
+                current = self._snapshots.setdefault((job_id, version), current)
+                while len(self._snapshots) > self.max_snapshots:
+                    self._snapshots.popitem(last=False)
+
+        if base is None:
+            return _with_metrics(RoutePlanDelta(**common, plan=route_plan), metrics)
+        if base is current:
+            return _with_metrics(RoutePlanDelta(**common, base_version=base_version), metrics)
+        vehicles, visits = diff(route_plan, base, current)
+        return _with_metrics(RoutePlanDelta(**common, base_version=base_version, vehicles=vehicles, visits=visits),
+                             metrics)
+
+
+def _with_metrics(delta: RoutePlanDelta, metrics: RouteMetrics) -> RoutePlanDelta:
+    delta._metrics = metrics
+    return delta
@@ -1,4 +1,4 @@
-from typing import Generator, TypeVar, Sequence, List
+from typing import Generator, TypeVar, Sequence, List, Optional
 from datetime import date, datetime, time, timedelta
 from enum import Enum
 from random import Random
@@ -208,7 +208,6 @@ def generate_names(random: Random) -> Generator[str, None, None]:
 
 
 def generate_demo_data(demo_data_enum: DemoData) -> VehicleRoutePlan:
-    print("demo_data_enum", demo_data_enum)
     random = Random(0)
 
     # vehicles_df = pd.read_csv("src/vehicle_routing/data/Vehicles.csv")
@@ -308,5 +307,54 @@ def generate_demo_data(demo_data_enum: DemoData) -> VehicleRoutePlan:
     )
 
 
+# generate_demo_data departs every vehicle at 07:00 on this day
+BENCHMARK_DAY = date(2025, 2, 26)
+BENCHMARK_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def generate_benchmark_input(demo_data_enum: DemoData, trip_count: int,
+                             vehicle_count: Optional[int] = None) -> dict:
+    """
+    Generates a reproducible pickup/drop-off input, in the shape generate_demo_data reads,
+    with trips spread over the region and capacities of the given DemoData.
+    """
+    properties = demo_data_enum.value
+    random = Random(properties.seed)
+    if vehicle_count is None:
+        vehicle_count = max(2, trip_count // 10)
+
+    latitudes = doubles(random, properties.south_west_corner.latitude, properties.north_east_corner.latitude)
+    longitudes = doubles(random, properties.south_west_corner.longitude, properties.north_east_corner.longitude)
+    vehicle_capacities = ints(random, properties.min_vehicle_capacity, properties.max_vehicle_capacity + 1)
+    # Pickups between 07:30 and 16:30, drop-offs 20 to 60 minutes later
+    pickup_minutes = ints(random, 7 * 60 + 30, 16 * 60 + 30)
+    ride_minutes = ints(random, 20, 61)
+    mobilities = values(random, ("WC", "CC", "STS"))
+
+    depot = (next(latitudes), next(longitudes))
+    vehicles = [{"VehicleId": str(i),
+                 "TotalCapacity": next(vehicle_capacities),
+                 "Vehicle_Location_Lat": depot[0],
+                 "Vehicle_Location_Lon": depot[1],
+                 "Make_Model": f"Van #{i}",
+                 "DriverId": f"driver{i}"}
+                for i in range(vehicle_count)]
+
+    trips = []
+    start_of_day = datetime.combine(BENCHMARK_DAY, time(0, 0))
+    for i in range(trip_count):
+        pickup_time = start_of_day + timedelta(minutes=next(pickup_minutes))
+        dropoff_time = pickup_time + timedelta(minutes=next(ride_minutes))
+        trips.append({"TblId": str(i),
+                      "Mobility": next(mobilities),
+                      "PickupTime": pickup_time.strftime(BENCHMARK_TIME_FORMAT),
+                      "DropTime": dropoff_time.strftime(BENCHMARK_TIME_FORMAT),
+                      "PickupLatitude": next(latitudes),
+                      "PickupLongitude": next(longitudes),
+                      "DropLatitude": next(latitudes),
+                      "DropLongitude": next(longitudes)})
+    return {"vehicles": vehicles, "trips": trips}
+
+
 def tomorrow_at(local_time: time) -> datetime:
     return datetime.combine(date.today(), local_time)
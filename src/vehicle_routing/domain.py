@@ -2,13 +2,33 @@ from timefold.solver import SolverStatus
 from timefold.solver.score import HardSoftScore
 from timefold.solver.domain import *
 
-from datetime import datetime, timedelta
-from typing import Annotated, Optional
-from pydantic import Field, computed_field, BeforeValidator
+from datetime import datetime, timedelta, timezone
+from typing import Annotated, Any, Optional
+
+import orjson
+from pydantic import Field, computed_field, BeforeValidator, model_validator
 
 from .json_serialization import *
+from .travel_time import attach_travel_time_matrix
 # from timefold.solver import PlanningSolution, value_range_provider
 
+def to_epoch_seconds(time: datetime) -> int:
+    """
+    Whole seconds since the Unix epoch; naive datetimes are taken as UTC.
+    """
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    return int(time.timestamp())
+
+
+def from_epoch_seconds(seconds: int, like: datetime) -> datetime:
+    """
+    The inverse of to_epoch_seconds, in the time zone of like (naive if like is naive).
+    """
+    time = datetime.fromtimestamp(seconds, like.tzinfo or timezone.utc)
+    return time if like.tzinfo is not None else time.replace(tzinfo=None)
+
+
 LocationValidator = BeforeValidator(lambda location: location if isinstance(location, Location)
                                     else Location(latitude=location[0], longitude=location[1]))
 
@@ -16,8 +36,14 @@ LocationValidator = BeforeValidator(lambda location: location if isinstance(loca
 class Location(JsonDomainBase):
     latitude: float
     longitude: float
+    # Dense index into the plan's travel time matrix and this location's row of it,
+    # both set by attach_travel_time_matrix from the configured TravelTimeProvider when the plan is loaded
+    index: Annotated[Optional[int], Field(default=None, exclude=True)]
+    travel_times: Annotated[Optional[Any], Field(default=None, exclude=True)]
 
     def driving_time_to(self, other: 'Location') -> int:
+        if self.travel_times is not None and other.index is not None:
+            return self.travel_times[other.index]
         return round((
              (self.latitude - other.latitude) ** 2 +
              (self.longitude - other.longitude) ** 2
@@ -49,33 +75,96 @@ class Visit(JsonDomainBase):
     next_visit: Annotated[Optional['Visit'],
                           NextElementShadowVariable(source_variable_name='visits'),
                           IdSerializer, VisitValidator, Field(default=None)]
-    arrival_time: Annotated[
-        Optional[datetime],
+    # Times in the solver are integer epoch seconds; the datetimes are only built when serializing.
+    # update_arrival_time sets arrival_seconds only, so the solver stops propagating a move down the route
+    # at the first visit whose arrival does not change.
+    arrival_seconds: Annotated[
+        Optional[int],
         CascadingUpdateShadowVariable(target_method_name='update_arrival_time'),
-        Field(default=None)]
+        Field(default=None, exclude=True)]
+    # The load on board as the vehicle leaves this visit: pickups add their demand and drop-offs subtract theirs.
+    # Kept apart from arrival_seconds, so a trip moving in or out of a route, which adds up to no load,
+    # stops propagating at the visit after it.
+    onboard_load: Annotated[
+        Optional[int],
+        CascadingUpdateShadowVariable(target_method_name='update_onboard_load'),
+        Field(default=None, exclude=True)]
+    # Set from min_start_time, max_end_time and service_duration when the visit is loaded
+    min_start_seconds: Annotated[int, Field(default=0, exclude=True)]
+    max_end_seconds: Annotated[int, Field(default=0, exclude=True)]
+    service_seconds: Annotated[int, Field(default=0, exclude=True)]
     paired_visit_id: Annotated[Optional[str], Field(default=None)]  # ✅ NEW: Link Pickup & Drop-off
+    # Resolved from paired_visit_id by link_paired_visits when the plan is loaded;
+    # pair_index is a dense integer shared by a pickup and its drop-off, used as a cheap join key
+    paired_visit: Annotated[Optional['Visit'], Field(default=None, exclude=True)]
+    pair_index: Annotated[Optional[int], Field(default=None, exclude=True)]
     vehicle_type: str  # ✅ Added vehicle type constraint
-    # index_in_vehicle_route: Annotated[Optional[int], PlanningVariable]  # ✅ Track visit order in the route
-    # index_in_vehicle_route: Annotated[Optional[int], PlanningVariable(value_range_provider_refs=["visit_index_range"])]  # ✅ Now correctly references the value range
+    # The bits of the vehicle types that may serve this visit, set by link_vehicle_types when the plan is loaded
+    vehicle_type_mask: Annotated[int, Field(default=0, exclude=True)]
     is_pickup: bool = Field(default=False)  # ✅ True if this visit is a pickup
     is_dropoff: bool = Field(default=False)  # ✅ True if this visit is a drop-off
 
+    @model_validator(mode='after')
+    def compute_epoch_seconds(self) -> 'Visit':
+        self.min_start_seconds = to_epoch_seconds(self.min_start_time)
+        self.max_end_seconds = to_epoch_seconds(self.max_end_time)
+        self.service_seconds = int(self.service_duration.total_seconds())
+        return self
+
     def update_arrival_time(self):
-        if self.vehicle is None or (self.previous_visit is not None and self.previous_visit.arrival_time is None):
-            self.arrival_time = None
+        if self.vehicle is None or (self.previous_visit is not None and self.previous_visit.arrival_seconds is None):
+            self.arrival_seconds = None
         elif self.previous_visit is None:
-            self.arrival_time = (self.vehicle.departure_time +
-                                 timedelta(seconds=self.vehicle.home_location.driving_time_to(self.location)))
+            self.arrival_seconds = (self.vehicle.departure_seconds +
+                                    self.vehicle.home_location.driving_time_to(self.location))
         else:
-            self.arrival_time = (self.previous_visit.calculate_departure_time() +
-                                 timedelta(seconds=self.previous_visit.location.driving_time_to(self.location)))
+            self.arrival_seconds = (self.previous_visit.calculate_departure_seconds() +
+                                    self.previous_visit.location.driving_time_to(self.location))
+
+    def update_onboard_load(self):
+        if self.vehicle is None or (self.previous_visit is not None and self.previous_visit.onboard_load is None):
+            self.onboard_load = None
+        elif self.previous_visit is None:
+            self.onboard_load = self.demand
+        else:
+            self.onboard_load = self.previous_visit.onboard_load + self.demand
+
+    def calculate_departure_seconds(self) -> Optional[int]:
+        if self.arrival_seconds is None:
+            return None
+        return max(self.arrival_seconds, self.min_start_seconds) + self.service_seconds
 
-    def calculate_departure_time(self):
-        if self.arrival_time is None:
+    def calculate_departure_time(self) -> Optional[datetime]:
+        departure_seconds = self.calculate_departure_seconds()
+        if departure_seconds is None:
             return None
+        return self._to_datetime(departure_seconds)
 
-        return max(self.arrival_time, self.min_start_time) + self.service_duration
+    def _to_datetime(self, seconds: int) -> datetime:
+        # In the time zone of the vehicle's departure time, which the arrival times count from
+        return from_epoch_seconds(seconds, self.vehicle.departure_time if self.vehicle is not None
+                                  else self.min_start_time)
 
+    @computed_field
+    @property
+    def arrival_time(self) -> Optional[datetime]:
+        if self.arrival_seconds is None:
+            return None
+        return self._to_datetime(self.arrival_seconds)
+
+    @computed_field
+    @property
+    def index_in_vehicle_route(self) -> Optional[int]:
+        # Counted rather than kept as a shadow variable: an index shifts all the way down the route on every move
+        # Counting walks the route, so responses fill it in for all visits in one pass (route_plan_to_dict)
+        if self.vehicle is None:
+            return None
+        index = 0
+        visit = self.previous_visit
+        while visit is not None:
+            index += 1
+            visit = visit.previous_visit
+        return index
 
     @computed_field
     @property
@@ -97,22 +186,22 @@ class Visit(JsonDomainBase):
     @computed_field
     @property
     def start_service_time(self) -> Optional[datetime]:
-        if self.arrival_time is None:
+        if self.arrival_seconds is None:
             return None
-        return max(self.arrival_time, self.min_start_time)
+        return self._to_datetime(max(self.arrival_seconds, self.min_start_seconds))
 
     def is_service_finished_after_max_end_time(self) -> bool:
-        return self.arrival_time is not None and self.calculate_departure_time() > self.max_end_time
+        return self.arrival_seconds is not None and self.calculate_departure_seconds() > self.max_end_seconds
 
     def service_finished_delay_in_minutes(self) -> int:
-        if self.arrival_time is None:
+        if self.arrival_seconds is None:
             return 0
-        # Floor division always rounds down, so divide by a negative duration and negate the result
+        # Floor division always rounds down, so divide by a negative minute and negate the result
         # to round up
-        # ex: 30 seconds / -1 minute = -0.5,
-        # so 30 seconds // -1 minute = -1,
+        # ex: 30 seconds / -60 = -0.5,
+        # so 30 seconds // -60 = -1,
         # and negating that gives 1
-        return -((self.calculate_departure_time() - self.max_end_time) // timedelta(minutes=-1))
+        return -((self.calculate_departure_seconds() - self.max_end_seconds) // -60)
 
     @computed_field
     @property
@@ -133,7 +222,43 @@ class Visit(JsonDomainBase):
 
     def is_paired_with(self, other: 'Visit') -> bool:
         """Returns True if this visit is the paired visit of another (pickup & drop-off pair)."""
-        return self.paired_visit == other
+        return self.paired_visit is other
+
+    def can_be_served_by(self, vehicle: 'Vehicle') -> bool:
+        """
+        Returns False if the vehicle is of a type that may not serve this visit.
+        A visit no vehicle may serve can go anywhere, and is penalized wherever it goes.
+        """
+        return self.vehicle_type_mask == 0 or self.vehicle_type_mask & vehicle.vehicle_type_mask != 0
+
+
+def link_paired_visits(visits: list[Visit]) -> None:
+    """
+    Replaces the paired_visit_id strings by direct paired_visit references,
+    and gives every pickup and its drop-off the same pair_index.
+    """
+    visit_by_id = {visit.id: visit for visit in visits}
+    pair_count = 0
+    for visit in visits:
+        visit.paired_visit = visit_by_id.get(visit.paired_visit_id) if visit.paired_visit_id else None
+    for visit in visits:
+        if visit.is_pickup and visit.paired_visit is not None:
+            visit.pair_index = visit.paired_visit.pair_index = pair_count
+            pair_count += 1
+
+
+def link_vehicle_types(vehicles: list['Vehicle'], visits: list[Visit]) -> None:
+    """
+    Codes every vehicle type as a small integer, in order of first appearance among the vehicles,
+    and gives every vehicle the bit of its type and every visit the bit of the type that may serve it
+    (none if no vehicle is of that type), so the constraints compare integers rather than strings.
+    """
+    type_masks: dict[str, int] = {}
+    for vehicle in vehicles:
+        vehicle.vehicle_type_mask = type_masks.setdefault(vehicle.vehicle_type, 1 << len(type_masks))
+    for visit in visits:
+        visit.vehicle_type_mask = type_masks.get(visit.vehicle_type, 0)
+
 
 @planning_entity
 class Vehicle(JsonDomainBase):
@@ -141,12 +266,24 @@ class Vehicle(JsonDomainBase):
     capacity: int
     home_location: Annotated[Location, LocationSerializer, LocationValidator]
     departure_time: datetime
+    departure_seconds: Annotated[int, Field(default=0, exclude=True)]
     visits: Annotated[list[Visit],
                       PlanningListVariable,
                       IdListSerializer, VisitListValidator, Field(default_factory=list)]
     vehicle_type: str  # ✅ Added vehicle type constraint
+    # The bit of vehicle_type, set by link_vehicle_types when the plan is loaded
+    vehicle_type_mask: Annotated[int, Field(default=0, exclude=True)]
     make_model: str
     driver_id: str
+    # The first pinned_visit_count visits are already under way: the solver neither moves them nor inserts before them
+    pinned_visit_count: Annotated[int, PlanningPinToIndex, Field(default=0)]
+    # An offline vehicle only finishes the visits on its route; the solver leaves its route alone
+    offline: Annotated[bool, PlanningPin, Field(default=False)]
+
+    @model_validator(mode='after')
+    def compute_epoch_seconds(self) -> 'Vehicle':
+        self.departure_seconds = to_epoch_seconds(self.departure_time)
+        return self
 
     @computed_field
     @property
@@ -161,6 +298,11 @@ class Vehicle(JsonDomainBase):
     def total_demand(self) -> int:
         return self.calculate_total_demand()
 
+    @computed_field
+    @property
+    def peak_load(self) -> int:
+        return self.calculate_peak_load()
+
     @computed_field
     @property
     def total_driving_time_seconds(self) -> int:
@@ -172,6 +314,14 @@ class Vehicle(JsonDomainBase):
             total_demand += visit.demand
         return total_demand
 
+    def calculate_peak_load(self) -> int:
+        load = 0
+        peak_load = 0
+        for visit in self.visits:
+            load += visit.demand
+            peak_load = max(peak_load, load)
+        return peak_load
+
     def calculate_total_driving_time_seconds(self) -> int:
         if len(self.visits) == 0:
             return 0
@@ -185,6 +335,10 @@ class Vehicle(JsonDomainBase):
         total_driving_time_seconds += previous_location.driving_time_to(self.home_location)
         return total_driving_time_seconds
 
+    def take_offline(self) -> None:
+        # A method, so that the solver's translated code can set the field from a ProblemChange
+        self.offline = True
+
     def __str__(self):
         return self.id
 
@@ -204,6 +358,24 @@ class VehicleRoutePlan(JsonDomainBase):
                      ScoreSerializer, ScoreValidator, Field(default=None)]
     solver_status: Annotated[Optional[SolverStatus],
                              Field(default=None)]
+    # The matrix behind every Location.travel_times row, indexed by Location.index
+    travel_time_matrix: Annotated[Optional[Any], Field(default=None, exclude=True)]
+
+    @model_validator(mode='after')
+    def resolve_paired_visits(self) -> 'VehicleRoutePlan':
+        link_paired_visits(self.visits)
+        return self
+
+    @model_validator(mode='after')
+    def resolve_vehicle_types(self) -> 'VehicleRoutePlan':
+        link_vehicle_types(self.vehicles, self.visits)
+        return self
+
+    @model_validator(mode='after')
+    def build_travel_time_matrix(self) -> 'VehicleRoutePlan':
+        self.travel_time_matrix = attach_travel_time_matrix(
+            [vehicle.home_location for vehicle in self.vehicles] + [visit.location for visit in self.visits])
+        return self
 
     @computed_field
     @property
@@ -221,4 +393,53 @@ class VehicleRoutePlan(JsonDomainBase):
     # @value_range_provider
     # def visit_index_range(self) -> list[int]:
     #     """Defines the range of possible visit indexes within a route."""
-    #     return list(range(1000))  # Adjust the number based on max visits per vehicle
\ No newline at end of file
+    #     return list(range(1000))  # Adjust the number based on max visits per vehicle
+
+
+def json_to_vehicle_route_plan(json: dict) -> VehicleRoutePlan:
+    visits = {
+        visit['id']: visit for visit in json.get('visits', [])
+    }
+    vehicles = {
+        vehicle['id']: vehicle for vehicle in json.get('vehicles', [])
+    }
+
+    for visit in visits.values():
+        if 'vehicle' in visit:
+            del visit['vehicle']
+
+        if 'previousVisit' in visit:
+            del visit['previousVisit']
+
+        if 'nextVisit' in visit:
+            del visit['nextVisit']
+
+    visits = {visit_id: Visit.model_validate(visits[visit_id]) for visit_id in visits}
+    json['visits'] = list(visits.values())
+
+    for vehicle in vehicles.values():
+        vehicle['visits'] = [visits[visit_id] for visit_id in vehicle['visits']]
+
+    json['vehicles'] = list(vehicles.values())
+
+    return VehicleRoutePlan.model_validate(json, context={
+        'visits': visits,
+        'vehicles': vehicles
+    })
+
+
+def load_vehicle_route_plan(body: bytes | str) -> VehicleRoutePlan:
+    """
+    Parses a request body; orjson parses a large plan about twice as fast as the json module.
+    """
+    return json_to_vehicle_route_plan(orjson.loads(body))
+
+
+def load_vehicle_route_plans(body: bytes | str) -> list[VehicleRoutePlan]:
+    """
+    Parses a request body holding a JSON array of plans.
+    """
+    data = orjson.loads(body)
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of route plans.")
+    return [json_to_vehicle_route_plan(plan) for plan in data]
@@ -0,0 +1,104 @@
+"""
+The trip assignment export: one row per trip, with the vehicle and driver its pickup is assigned to.
+
+Rows are built in one pass over the visits, looking drop-offs up by id, either from a plan posted back as JSON
+or from a stored job. They can be written as a JSON document, as newline-delimited JSON or as CSV,
+the last two a chunk of rows at a time so a large export streams.
+"""
+import csv
+import io
+from enum import Enum
+from typing import Any, Iterable, Iterator, Optional
+
+import orjson
+
+from .domain import VehicleRoutePlan
+
+EXPORT_COLUMNS = ('TblId', 'VehicleId', 'DriverId', 'IsAssigned', 'Exception', 'Make_Model', 'ProgressId')
+ROWS_PER_CHUNK = 500
+
+
+class ExportFormat(str, Enum):
+    JSON = 'json'
+    NDJSON = 'ndjson'
+    CSV = 'csv'
+
+    @property
+    def media_type(self) -> str:
+        return {ExportFormat.JSON: 'application/json', ExportFormat.NDJSON: 'application/x-ndjson',
+                ExportFormat.CSV: 'text/csv'}[self]
+
+
+def _row(trip_id: str, vehicle_id: Optional[str], driver_id: Optional[str], make_model: Optional[str],
+         is_assigned: bool, progress_id: Any) -> dict[str, Any]:
+    return {'TblId': trip_id, 'VehicleId': vehicle_id, 'DriverId': driver_id, 'IsAssigned': is_assigned,
+            'Exception': None, 'Make_Model': make_model, 'ProgressId': progress_id}
+
+
+def rows_from_json(plan: dict[str, Any], progress_id: Any = None) -> Iterator[dict[str, Any]]:
+    """
+    The rows of a plan as serialized by the API; progress_id defaults to the plan's ProgressId.
+    A trip is assigned when both its pickup and its drop-off are on a vehicle.
+    """
+    if progress_id is None:
+        progress_id = plan.get('ProgressId')
+    visits = plan['visits']
+    visit_by_id = {visit['id']: visit for visit in visits}
+    for pickup in visits:
+        if not pickup['isPickup']:
+            continue
+        trip_id = pickup['id'].replace('pickup_', '')
+        dropoff = visit_by_id.get(f'dropoff_{trip_id}')
+        is_assigned = bool(pickup.get('vehicle')) and dropoff is not None and dropoff.get('vehicle') is not None
+        yield _row(trip_id, pickup.get('vehicle'), pickup.get('driverId'), pickup.get('vehicleName'),
+                   is_assigned, progress_id)
+
+
+def rows_from_plan(plan: VehicleRoutePlan, progress_id: Any = None) -> Iterator[dict[str, Any]]:
+    """
+    The same rows as rows_from_json, read from the plan itself rather than from its JSON.
+    """
+    visit_by_id = {visit.id: visit for visit in plan.visits}
+    for pickup in plan.visits:
+        if not pickup.is_pickup:
+            continue
+        trip_id = pickup.id.replace('pickup_', '')
+        dropoff = visit_by_id.get(f'dropoff_{trip_id}')
+        vehicle = pickup.vehicle
+        is_assigned = vehicle is not None and dropoff is not None and dropoff.vehicle is not None
+        yield _row(trip_id, vehicle.id if vehicle is not None else None,
+                   vehicle.driver_id if vehicle is not None else None,
+                   vehicle.make_model if vehicle is not None else None, is_assigned, progress_id)
+
+
+def _chunks(rows: Iterable[dict[str, Any]]) -> Iterator[list[dict[str, Any]]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == ROWS_PER_CHUNK:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_rows(rows: Iterable[dict[str, Any]], export_format: ExportFormat) -> Iterator[bytes]:
+    """
+    Yields the rows in the given format, a chunk at a time; JSON comes as a single {"data": [...]} document.
+    """
+    if export_format == ExportFormat.JSON:
+        yield orjson.dumps({'data': list(rows)})
+    elif export_format == ExportFormat.NDJSON:
+        for chunk in _chunks(rows):
+            yield b''.join(orjson.dumps(row) + b'\n' for row in chunk)
+    else:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, EXPORT_COLUMNS, lineterminator='\n')
+        writer.writeheader()
+        for chunk in _chunks(rows):
+            writer.writerows(chunk)
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
@@ -0,0 +1,336 @@
+"""
+Where the REST API keeps the latest plan of every job.
+
+InMemoryJobStore keeps the plans themselves, for a single worker process.
+SqliteJobStore keeps compact compressed JSON in a SQLite file, so several uvicorn workers share the jobs
+and they survive a restart.
+Both evict jobs that were not updated for ttl_seconds, and then the least recently used jobs
+until the store fits max_bytes.
+"""
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import orjson
+from timefold.solver import SolverStatus
+
+from .construction import update_route_shadow_variables
+from .domain import Vehicle, Visit, VehicleRoutePlan, load_vehicle_route_plan
+
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Plans a SqliteJobStore keeps loaded, with their travel time matrices
+DEFAULT_MAX_LOADED_PLANS = 8
+# Rough footprint of one live Visit or Vehicle with its Location,
+# used to weigh in-memory plans without serializing them
+ESTIMATED_BYTES_PER_PLANNING_OBJECT = 2048
+
+
+@dataclass
+class _StoredJob:
+    plan: VehicleRoutePlan
+    size: int
+    updated: float
+
+
+class JobStore(ABC):
+    """
+    Maps job ids to the latest plan of the job and its solver status.
+    """
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[VehicleRoutePlan]:
+        """
+        Returns the latest plan of the job, with its stored solver_status, or None if it is unknown or evicted.
+        """
+        ...
+
+    @abstractmethod
+    def put(self, job_id: str, plan: VehicleRoutePlan, solver_status: Optional[SolverStatus] = None) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, job_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def __contains__(self, job_id: str) -> bool:
+        """
+        Whether get would return a plan, without loading it.
+        """
+        ...
+
+
+class InMemoryJobStore(JobStore):
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_bytes: int = DEFAULT_MAX_BYTES):
+        super().__init__(ttl_seconds, max_bytes)
+        # Least recently used first
+        self._jobs: OrderedDict[str, _StoredJob] = OrderedDict()
+        # Least recently updated first, so expired jobs are found at the head
+        self._update_order: OrderedDict[str, None] = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def estimate_size(plan: VehicleRoutePlan) -> int:
+        return (len(plan.visits) + len(plan.vehicles)) * ESTIMATED_BYTES_PER_PLANNING_OBJECT
+
+    def get(self, job_id: str) -> Optional[VehicleRoutePlan]:
+        with self._lock:
+            self._evict()
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            self._jobs.move_to_end(job_id)
+            return job.plan
+
+    def __contains__(self, job_id: str) -> bool:
+        with self._lock:
+            self._evict()
+            return job_id in self._jobs
+
+    def put(self, job_id: str, plan: VehicleRoutePlan, solver_status: Optional[SolverStatus] = None) -> None:
+        if solver_status is not None:
+            plan.solver_status = solver_status
+        with self._lock:
+            self._remove(job_id)
+            job = _StoredJob(plan, self.estimate_size(plan), time.monotonic())
+            self._jobs[job_id] = job
+            self._update_order[job_id] = None
+            self._total_bytes += job.size
+            self._evict()
+
+    def delete(self, job_id: str) -> None:
+        with self._lock:
+            self._remove(job_id)
+
+    def _remove(self, job_id: str) -> None:
+        job = self._jobs.pop(job_id, None)
+        if job is not None:
+            self._total_bytes -= job.size
+            del self._update_order[job_id]
+
+    def _evict(self) -> None:
+        expired_before = time.monotonic() - self.ttl_seconds
+        while self._update_order:
+            job_id = next(iter(self._update_order))
+            if self._jobs[job_id].updated >= expired_before:
+                break
+            self._remove(job_id)
+        # Keep the most recently used job even if it alone exceeds the budget
+        while self._total_bytes > self.max_bytes and len(self._jobs) > 1:
+            self._remove(next(iter(self._jobs)))
+
+
+# Computed fields are derived from the stored fields, so they are left out of the stored JSON
+_COMPACT_EXCLUDE = {
+    **{name: True for name in VehicleRoutePlan.model_computed_fields},
+    'visits': {'__all__': set(Visit.model_computed_fields) | {'vehicle', 'previous_visit', 'next_visit'}},
+    'vehicles': {'__all__': set(Vehicle.model_computed_fields)},
+}
+
+
+def to_compact_dict(plan: VehicleRoutePlan) -> dict:
+    """
+    The plan without computed fields or shadow variables, as json_to_vehicle_route_plan reads it.
+    """
+    return plan.model_dump(mode='json', by_alias=True, exclude_none=True, exclude=_COMPACT_EXCLUDE)
+
+
+def dump_compact(plan: VehicleRoutePlan) -> bytes:
+    return zlib.compress(orjson.dumps(to_compact_dict(plan)))
+
+
+def load_compact(data: bytes) -> VehicleRoutePlan:
+    plan = load_vehicle_route_plan(zlib.decompress(data))
+    for vehicle in plan.vehicles:
+        update_route_shadow_variables(vehicle)
+    return plan
+
+
+class SqliteJobStore(JobStore):
+    """
+    A job store in a SQLite file, shared by every process that opens the same path.
+
+    A job solving in this process gets a new best solution many times per second,
+    so writes of the same job are batched: at most one per min_write_interval_seconds,
+    the latest plan winning, and reads in this process see the pending plan.
+    A write with a final solver status (NOT_SOLVING) is never delayed.
+
+    Loading a plan rebuilds its travel time matrix, so the max_loaded_plans most recently read plans are kept
+    with the time they were stored, and a read only loads the plan again once the stored plan is newer.
+    Like InMemoryJobStore, the store hands out the same plan to every reader.
+    """
+
+    def __init__(self, path: str | Path, ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_bytes: int = DEFAULT_MAX_BYTES, min_write_interval_seconds: float = 1.0,
+                 max_loaded_plans: int = DEFAULT_MAX_LOADED_PLANS):
+        super().__init__(ttl_seconds, max_bytes)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.min_write_interval_seconds = min_write_interval_seconds
+        self.max_loaded_plans = max_loaded_plans
+        # The time each plan was stored and the plan, the least recently read first
+        self._loaded: OrderedDict[str, tuple[float, VehicleRoutePlan]] = OrderedDict()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        # Every put gets a new version, so that an older pending plan never overwrites a newer one
+        self._version = 0
+        self._written_versions: dict[str, int] = {}
+        self._pending: dict[str, tuple[int, VehicleRoutePlan]] = {}
+        self._last_write: dict[str, float] = {}
+        connection = self._connection()
+        connection.execute('CREATE TABLE IF NOT EXISTS jobs ('
+                           'job_id TEXT PRIMARY KEY, plan BLOB NOT NULL, solver_status TEXT, '
+                           'size INTEGER NOT NULL, updated REAL NOT NULL, accessed REAL NOT NULL)')
+        connection.execute('CREATE INDEX IF NOT EXISTS jobs_by_accessed ON jobs (accessed)')
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared between threads, and the solver listeners run on solver threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, job_id: str) -> Optional[VehicleRoutePlan]:
+        with self._lock:
+            _, plan = self._pending.get(job_id, (None, None))
+        if plan is not None:
+            return plan
+        connection = self._connection()
+        row = connection.execute('SELECT updated, solver_status FROM jobs WHERE job_id = ? AND updated >= ?',
+                                 (job_id, time.time() - self.ttl_seconds)).fetchone()
+        if row is None:
+            return None
+        updated, solver_status = row
+        connection.execute('UPDATE jobs SET accessed = ? WHERE job_id = ?', (time.time(), job_id))
+        with self._lock:
+            loaded_updated, plan = self._loaded.get(job_id, (None, None))
+            if loaded_updated == updated:
+                self._loaded.move_to_end(job_id)
+        if loaded_updated != updated:
+            row = connection.execute('SELECT plan FROM jobs WHERE job_id = ? AND updated = ?',
+                                     (job_id, updated)).fetchone()
+            if row is None:
+                # Replaced by a newer plan since; read that one
+                return self.get(job_id)
+            plan = load_compact(row[0])
+            with self._lock:
+                self._loaded[job_id] = (updated, plan)
+                self._loaded.move_to_end(job_id)
+                while len(self._loaded) > self.max_loaded_plans:
+                    self._loaded.popitem(last=False)
+        plan.solver_status = SolverStatus[solver_status] if solver_status is not None else None
+        return plan
+
+    def __contains__(self, job_id: str) -> bool:
+        with self._lock:
+            if job_id in self._pending:
+                return True
+        return self._connection().execute('SELECT 1 FROM jobs WHERE job_id = ? AND updated >= ?',
+                                          (job_id, time.time() - self.ttl_seconds)).fetchone() is not None
+
+    def put(self, job_id: str, plan: VehicleRoutePlan, solver_status: Optional[SolverStatus] = None) -> None:
+        if solver_status is not None:
+            plan.solver_status = solver_status
+        with self._lock:
+            self._version += 1
+            version = self._version
+            last_write = self._last_write.get(job_id)
+            delay = 0 if last_write is None or plan.solver_status == SolverStatus.NOT_SOLVING \
+                else last_write + self.min_write_interval_seconds - time.monotonic()
+            if delay > 0:
+                if job_id not in self._pending:
+                    # Writes the latest pending plan once the interval is over, even if no newer plan comes
+                    timer = threading.Timer(delay, self._write_pending, (job_id,))
+                    timer.daemon = True
+                    timer.start()
+                self._pending[job_id] = (version, plan)
+                return
+            self._pending.pop(job_id, None)
+            if plan.solver_status == SolverStatus.NOT_SOLVING:
+                self._last_write.pop(job_id, None)
+            else:
+                self._last_write[job_id] = time.monotonic()
+        self._write(job_id, plan, version)
+
+    def _write_pending(self, job_id: str) -> None:
+        with self._lock:
+            version, plan = self._pending.pop(job_id, (None, None))
+            if plan is None:
+                return
+            self._last_write[job_id] = time.monotonic()
+        self._write(job_id, plan, version)
+
+    def _write(self, job_id: str, plan: VehicleRoutePlan, version: int) -> None:
+        data = dump_compact(plan)
+        solver_status = plan.solver_status.name if plan.solver_status is not None else None
+        with self._write_lock:
+            # A pending write can race a later final write; the later put wins
+            if self._written_versions.get(job_id, 0) > version:
+                return
+            self._written_versions[job_id] = version
+            now = time.time()
+            connection = self._connection()
+            connection.execute('INSERT OR REPLACE INTO jobs (job_id, plan, solver_status, size, updated, accessed) '
+                               'VALUES (?, ?, ?, ?, ?, ?)', (job_id, data, solver_status, len(data), now, now))
+            self._evict(connection)
+        # The plan just written is already loaded
+        with self._lock:
+            self._loaded[job_id] = (now, plan)
+            self._loaded.move_to_end(job_id)
+            while len(self._loaded) > self.max_loaded_plans:
+                self._loaded.popitem(last=False)
+
+    def delete(self, job_id: str) -> None:
+        with self._lock:
+            self._pending.pop(job_id, None)
+            self._last_write.pop(job_id, None)
+            self._loaded.pop(job_id, None)
+        with self._write_lock:
+            self._written_versions.pop(job_id, None)
+        self._connection().execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        connection.execute('DELETE FROM jobs WHERE updated < ?', (time.time() - self.ttl_seconds,))
+        total_bytes = connection.execute('SELECT COALESCE(SUM(size), 0) FROM jobs').fetchone()[0]
+        if total_bytes <= self.max_bytes:
+            return
+        evicted = []
+        for job_id, size in connection.execute('SELECT job_id, size FROM jobs ORDER BY accessed DESC LIMIT -1 OFFSET 1'
+                                               ).fetchall()[::-1]:
+            if total_bytes <= self.max_bytes:
+                break
+            evicted.append((job_id,))
+            total_bytes -= size
+        connection.executemany('DELETE FROM jobs WHERE job_id = ?', evicted)
+
+
+def create_job_store_from_environment() -> JobStore:
+    """
+    JOB_STORE selects the backend: memory (default) or sqlite, stored at JOB_STORE_PATH.
+    JOB_STORE_TTL_SECONDS and JOB_STORE_MAX_BYTES bound either backend.
+    """
+    ttl_seconds = float(os.environ.get('JOB_STORE_TTL_SECONDS', DEFAULT_TTL_SECONDS))
+    max_bytes = int(os.environ.get('JOB_STORE_MAX_BYTES', DEFAULT_MAX_BYTES))
+    backend = os.environ.get('JOB_STORE', 'memory').lower()
+    if backend == 'memory':
+        return InMemoryJobStore(ttl_seconds, max_bytes)
+    if backend == 'sqlite':
+        return SqliteJobStore(os.environ.get('JOB_STORE_PATH', 'jobs.sqlite3'), ttl_seconds, max_bytes)
+    raise ValueError(f"JOB_STORE ({backend}) must be memory or sqlite.")
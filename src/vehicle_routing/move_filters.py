@@ -0,0 +1,121 @@
+"""
+Move filters for the trip moves, translated to Java classes for the filterClass of their move selectors.
+
+The sublist moves only move and swap whole trips: a pickup directly followed by its own drop-off.
+Two other adjacent visits, such as a drop-off and the next trip's pickup, would split two trips.
+Moves that put a visit on a vehicle of a type that may not serve it (Visit.can_be_served_by) are always pruned:
+the plan's value range is every visit for every vehicle, and a list variable cannot narrow it per vehicle,
+so the vehicle type bits set by link_vehicle_types stop those moves before the solver applies and scores them.
+With time_window_filter, moves to another route are also pruned when they make a visit there late
+(time_slack.insertion_fits_time_windows).
+"""
+from timefold.solver.score import ScoreDirector
+from timefold.solver._timefold_java_interop import _process_compilation_queue
+
+from .domain import Vehicle, Visit
+from .time_slack import insertion_fits_time_windows
+
+
+def can_all_be_served_by(vehicle: Vehicle, visits: list[Visit]) -> bool:
+    for visit in visits:
+        if not visit.can_be_served_by(vehicle):
+            return False
+    return True
+
+
+def is_trip(visits: list[Visit]) -> bool:
+    return len(visits) == 2 and visits[0].is_pickup and visits[0].paired_visit is visits[1]
+
+
+def accept_list_change_move(score_director: ScoreDirector, move) -> bool:
+    return move.getMovedValue().can_be_served_by(move.getDestinationEntity())
+
+
+def accept_list_change_move_in_time(score_director: ScoreDirector, move) -> bool:
+    vehicle = move.getDestinationEntity()
+    visit = move.getMovedValue()
+    if not visit.can_be_served_by(vehicle):
+        return False
+    if move.getSourceEntity() is vehicle:
+        return True
+    return insertion_fits_time_windows(vehicle, move.getDestinationIndex(), [visit])
+
+
+def accept_sub_list_change_move(score_director: ScoreDirector, move) -> bool:
+    vehicle = move.getDestinationEntity()
+    source = move.getSourceEntity()
+    from_index = move.getFromIndex()
+    visits = source.visits[from_index:from_index + move.getSubListSize()]
+    if not is_trip(visits):
+        return False
+    return source is vehicle or can_all_be_served_by(vehicle, visits)
+
+
+def accept_sub_list_change_move_in_time(score_director: ScoreDirector, move) -> bool:
+    vehicle = move.getDestinationEntity()
+    source = move.getSourceEntity()
+    from_index = move.getFromIndex()
+    visits = source.visits[from_index:from_index + move.getSubListSize()]
+    if not is_trip(visits):
+        return False
+    if source is vehicle:
+        return True
+    return (can_all_be_served_by(vehicle, visits) and
+            insertion_fits_time_windows(vehicle, move.getDestinationIndex(), visits))
+
+
+def accept_list_swap_move(score_director: ScoreDirector, move) -> bool:
+    # Swap selectors also yield a NoChangeMove, which the solver skips anyway
+    if not move.isMoveDoable(score_director):
+        return True
+    left = move.getLeftEntity()
+    right = move.getRightEntity()
+    if left is right:
+        return True
+    return move.getLeftValue().can_be_served_by(right) and move.getRightValue().can_be_served_by(left)
+
+
+def accept_sub_list_swap_move(score_director: ScoreDirector, move) -> bool:
+    if not move.isMoveDoable(score_director):
+        return True
+    left = move.getLeftSubList()
+    right = move.getRightSubList()
+    left_vehicle = left.entity()
+    right_vehicle = right.entity()
+    left_visits = left_vehicle.visits[left.fromIndex():left.fromIndex() + left.length()]
+    right_visits = right_vehicle.visits[right.fromIndex():right.fromIndex() + right.length()]
+    if not is_trip(left_visits) or not is_trip(right_visits):
+        return False
+    if left_vehicle is right_vehicle:
+        return True
+    return can_all_be_served_by(right_vehicle, left_visits) and can_all_be_served_by(left_vehicle, right_visits)
+
+
+_move_filter_class_names = {}
+
+
+def _move_filter_class_name(move_filter) -> str:
+    if move_filter not in _move_filter_class_names:
+        from _jpyinterpreter import translate_python_bytecode_to_java_bytecode, \
+            generate_proxy_class_for_translated_function
+        from ai.timefold.solver.core.impl.heuristic.selector.common.decorator import SelectionFilter  # noqa
+        _process_compilation_queue()
+        _move_filter_class_names[move_filter] = generate_proxy_class_for_translated_function(
+            SelectionFilter, translate_python_bytecode_to_java_bytecode(move_filter, SelectionFilter)).getName()
+    return _move_filter_class_names[move_filter]
+
+
+def get_move_filter_class_names(time_window_filter: bool) -> dict[str, str]:
+    """
+    Returns the Java class name of the filter of each trip move selector, by the selector's element name.
+    Translation needs the domain classes compiled first, so it cannot happen at import time.
+    """
+    move_filters = {
+        'listChangeMoveSelector':
+            accept_list_change_move_in_time if time_window_filter else accept_list_change_move,
+        'listSwapMoveSelector': accept_list_swap_move,
+        'subListChangeMoveSelector':
+            accept_sub_list_change_move_in_time if time_window_filter else accept_sub_list_change_move,
+        'subListSwapMoveSelector': accept_sub_list_swap_move,
+    }
+    return {selector: _move_filter_class_name(move_filter) for selector, move_filter in move_filters.items()}
@@ -0,0 +1,35 @@
+"""
+Travel time proximity between visits.
+
+visit_nearby_distance is the distance meter for nearby selection on Vehicle.visits:
+the solver then mostly tries to put a visit next to the visits (or vehicle depots) closest to it,
+instead of next to a visit on the other side of the region.
+It reads the same travel time matrix as Location.driving_time_to.
+"""
+from timefold.solver.heuristic import nearby_distance_meter
+from timefold.solver._timefold_java_interop import _process_compilation_queue
+
+from .domain import Vehicle, Visit
+
+
+def visit_nearby_distance(origin: Visit, destination: Visit | Vehicle) -> float:
+    # The destination is a Vehicle when the move puts the origin first on its route
+    if isinstance(destination, Vehicle):
+        return origin.location.driving_time_to(destination.home_location)
+    return origin.location.driving_time_to(destination.location)
+
+
+_visit_nearby_distance_meter = None
+
+
+def get_visit_nearby_distance_meter():
+    """
+    Returns visit_nearby_distance translated for the solver.
+    Translation needs the domain classes compiled first, so it cannot happen at import time.
+    """
+    global _visit_nearby_distance_meter
+    if _visit_nearby_distance_meter is None:
+        _process_compilation_queue()
+        _visit_nearby_distance_meter = nearby_distance_meter(visit_nearby_distance)
+    return _visit_nearby_distance_meter
+
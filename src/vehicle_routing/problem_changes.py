@@ -0,0 +1,300 @@
+"""
+Live changes to a job while it solves: adding trips, cancelling trips and taking vehicles offline.
+
+Re-planning solves the changed plan as a new job, so the solver starts over from its best solution.
+A live change goes to the running solver as a ProblemChange instead: the solver applies it to its working solution
+between two moves and solves on, keeping its state.
+Every change is checked against the job's latest best solution before it is submitted,
+so the solver never gets a change it cannot apply.
+
+While a batch of changes is being absorbed, the changes submitted for the same job wait,
+and are then submitted together as one ProblemChange, so a burst of changes restarts the solver once.
+"""
+import asyncio
+import time
+from typing import Annotated, Any, Callable, Optional
+
+from timefold.solver import ProblemChange, ProblemChangeDirector
+from timefold.solver.score import HardSoftScore
+
+from .domain import Location, Vehicle, Visit, VehicleRoutePlan
+from .json_serialization import JsonDomainBase, ScoreSerializer
+from .travel_time import Coordinates, coordinates_of
+
+# How long a submission waits for the solver to absorb its changes
+DEFAULT_ABSORB_TIMEOUT_SECONDS = 60
+ABSORB_POLL_SECONDS = 0.1
+
+# Shadow variables of a visit, which the solver sets once the visit is on a route
+_SHADOW_FIELDS = ('vehicle', 'previousVisit', 'nextVisit', 'arrivalTime', 'indexInVehicleRoute')
+
+
+class LiveRouteChanges(JsonDomainBase):
+    # Visits are removed with their paired visit. The visits an offline vehicle has not left for
+    # go back to the other vehicles; those under way stay on its route.
+    added_visits: list[dict[str, Any]] = []
+    removed_visit_ids: list[str] = []
+    offline_vehicle_ids: list[str] = []
+
+    def merged(self, other: 'LiveRouteChanges') -> 'LiveRouteChanges':
+        return LiveRouteChanges(added_visits=self.added_visits + other.added_visits,
+                                removed_visit_ids=self.removed_visit_ids + other.removed_visit_ids,
+                                offline_vehicle_ids=self.offline_vehicle_ids + other.offline_vehicle_ids)
+
+
+class LiveChangeResult(JsonDomainBase):
+    # The first version of the job's best solution with the changes, all visits assigned;
+    # absorbed is false if the job stopped, or the wait timed out, before there was one
+    version: int
+    score: Annotated[Optional[HardSoftScore], ScoreSerializer] = None
+    absorbed: bool
+
+
+class RoutePlanChange(ProblemChange[VehicleRoutePlan]):
+    """
+    Removes visits, takes vehicles offline and adds visits; built by create_route_plan_change.
+    The visits an offline vehicle has not left for are removed and added again unassigned,
+    as copies of those in visits, the visits of the plan the change was checked against.
+    """
+
+    def __init__(self, removed_visit_ids: list[str], offline_vehicle_ids: list[str], added_visits: list[Visit],
+                 visits: dict[str, Visit]):
+        self.removed_visit_ids = removed_visit_ids
+        self.offline_vehicle_ids = offline_vehicle_ids
+        self.added_visits = added_visits
+        self.visits = visits
+
+    def do_change(self, working_solution: VehicleRoutePlan, problem_change_director: ProblemChangeDirector) -> None:
+        # The working solution is made of Java objects, whose ids and counts are read as Python strings.
+        # The director cannot change a list variable, so visits leave their route as a change of their vehicle.
+        # Every function given to the director is translated, so each is made once and finds visits by id.
+        removed_visit_ids = set(self.removed_visit_ids)
+        offline_vehicle_ids = set(self.offline_vehicle_ids)
+        readded_visits = []
+        # Read now rather than when the change was checked: the solver may have moved visits since
+        for working_vehicle in working_solution.vehicles:
+            if str(working_vehicle.id) in offline_vehicle_ids:
+                for working_visit in list(working_vehicle.visits)[int(str(working_vehicle.pinned_visit_count)):]:
+                    visit_id = str(working_visit.id)
+                    if visit_id not in removed_visit_ids and visit_id in self.visits:
+                        removed_visit_ids.add(visit_id)
+                        readded_visits.append(_unassigned_copy(self.visits[visit_id]))
+
+        removed_visits = [visit for visit in working_solution.visits if str(visit.id) in removed_visit_ids]
+        remove_from_route = lambda vehicle: _remove_visits(vehicle.visits, removed_visit_ids)
+        for working_vehicle in {id(visit.vehicle): visit.vehicle
+                                for visit in removed_visits if visit.vehicle is not None}.values():
+            problem_change_director.change_problem_property(working_vehicle, remove_from_route)
+        remove_from_solution = lambda visit: _remove_visits(working_solution.visits, {visit.id})
+        for working_visit in removed_visits:
+            problem_change_director.remove_entity(working_visit, remove_from_solution)
+        take_offline = lambda vehicle: vehicle.take_offline()
+        for working_vehicle in working_solution.vehicles:
+            if str(working_vehicle.id) in offline_vehicle_ids:
+                problem_change_director.change_problem_property(working_vehicle, take_offline)
+        add_to_solution = lambda visit: working_solution.visits.append(visit)
+        for visit in readded_visits + self.added_visits:
+            problem_change_director.add_entity(visit, add_to_solution)
+
+    def is_applied_to(self, route_plan: VehicleRoutePlan) -> bool:
+        visit_ids = {visit.id for visit in route_plan.visits}
+        offline_vehicle_ids = set(self.offline_vehicle_ids)
+        return all(visit.id in visit_ids for visit in self.added_visits) \
+            and not visit_ids.intersection(self.removed_visit_ids) \
+            and all(vehicle.offline for vehicle in route_plan.vehicles if vehicle.id in offline_vehicle_ids)
+
+
+def _remove_visits(visits: list[Visit], visit_ids: set[str]) -> None:
+    for index in range(len(visits) - 1, -1, -1):
+        if visits[index].id in visit_ids:
+            del visits[index]
+
+
+def create_route_plan_change(route_plan: VehicleRoutePlan, changes: LiveRouteChanges) -> RoutePlanChange:
+    """
+    Checks the changes against route_plan, the latest best solution of the job, and returns the problem change.
+    Raises ValueError for unknown or duplicate ids, for removing visits that are under way,
+    and for adding visits at locations the plan has no travel times for.
+    """
+    visits = {visit.id: visit for visit in route_plan.visits}
+    vehicles = {vehicle.id: vehicle for vehicle in route_plan.vehicles}
+    pinned_visit_ids = {visit.id for vehicle in route_plan.vehicles
+                        for visit in vehicle.visits[:_pinned_count(vehicle)]}
+
+    removed_visit_ids = set()
+    for visit_id in changes.removed_visit_ids:
+        if visit_id not in visits:
+            raise ValueError(f"Cannot remove visit {visit_id}: there is no such visit.")
+        removed_visit_ids.add(visit_id)
+        if visits[visit_id].paired_visit_id in visits:
+            removed_visit_ids.add(visits[visit_id].paired_visit_id)
+    removed_visit_ids |= {visit_id for visit_id, visit in visits.items()
+                          if visit.paired_visit_id in removed_visit_ids}
+    if removed_visit_ids & pinned_visit_ids:
+        raise ValueError(f"Cannot remove visits that are under way: {sorted(removed_visit_ids & pinned_visit_ids)}.")
+
+    offline_vehicle_ids = []
+    for vehicle_id in changes.offline_vehicle_ids:
+        if vehicle_id not in vehicles:
+            raise ValueError(f"Cannot take vehicle {vehicle_id} offline: there is no such vehicle.")
+        if not vehicles[vehicle_id].offline and vehicle_id not in offline_vehicle_ids:
+            offline_vehicle_ids.append(vehicle_id)
+
+    added_visits = []
+    for data in changes.added_visits:
+        visit_id = data.get('id')
+        if visit_id is None or visit_id in visits or any(visit.id == visit_id for visit in added_visits):
+            raise ValueError(f"Cannot add visit {visit_id}: its id is missing or already taken.")
+        added_visits.append(Visit.model_validate({key: value for key, value in data.items()
+                                                  if key not in _SHADOW_FIELDS}))
+    _link_added_visits(route_plan, added_visits)
+
+    return RoutePlanChange(sorted(removed_visit_ids), offline_vehicle_ids, added_visits, visits)
+
+
+def _pinned_count(vehicle: Vehicle) -> int:
+    return len(vehicle.visits) if vehicle.offline else vehicle.pinned_visit_count
+
+
+def _unassigned_copy(visit: Visit) -> Visit:
+    # The copy keeps its pair_index, which the constraints join the pickup and drop-off on
+    return visit.model_copy(update=dict(vehicle=None, previous_visit=None, next_visit=None, arrival_seconds=None,
+                                        onboard_load=None, paired_visit=None))
+
+
+def _link_added_visits(route_plan: VehicleRoutePlan, added_visits: list[Visit]) -> None:
+    """
+    Pairs the added visits among themselves, with pair indices after those of the plan,
+    gives them the vehicle type bits of the plan's vehicles,
+    and gives every added visit the travel times of the plan's location with the same coordinates.
+    Raises ValueError if an added visit is somewhere else.
+    """
+    visit_by_id = {visit.id: visit for visit in added_visits}
+    pair_count = max((visit.pair_index for visit in route_plan.visits if visit.pair_index is not None),
+                     default=-1) + 1
+    for visit in added_visits:
+        if visit.is_pickup and visit.paired_visit_id in visit_by_id:
+            visit.pair_index = visit_by_id[visit.paired_visit_id].pair_index = pair_count
+            pair_count += 1
+
+    type_masks = {vehicle.vehicle_type: vehicle.vehicle_type_mask for vehicle in route_plan.vehicles}
+    for visit in added_visits:
+        visit.vehicle_type_mask = type_masks.get(visit.vehicle_type, 0)
+
+    locations: dict[Coordinates, Location] = {}
+    for location in [*(vehicle.home_location for vehicle in route_plan.vehicles),
+                     *(visit.location for visit in route_plan.visits)]:
+        if location.index is not None:
+            locations.setdefault(coordinates_of(location), location)
+    # The solver's locations share the rows of the plan's matrix, which cannot grow while it solves
+    unknown_visit_ids = [visit.id for visit in added_visits if coordinates_of(visit.location) not in locations]
+    if unknown_visit_ids:
+        raise ValueError(f"Cannot add visits at locations the plan has no travel times for: {unknown_visit_ids}. "
+                         f"Re-plan the job to add them.")
+    for visit in added_visits:
+        known = locations[coordinates_of(visit.location)]
+        visit.location.index = known.index
+        visit.location.travel_times = known.travel_times
+
+
+class ProblemChangeBatcher:
+    """
+    Submits the live changes of solving jobs and waits for the solver to absorb them.
+    add_problem_change hands a change to the solver of a job without waiting for it;
+    latest_solution returns the latest version of a job and its plan, as SolutionHistory.latest does;
+    is_solving tells whether a job still solves in this process.
+    """
+
+    def __init__(self, add_problem_change: Callable[[str, RoutePlanChange], None],
+                 latest_solution: Callable[[str], tuple[Optional[int], Optional[VehicleRoutePlan]]],
+                 is_solving: Callable[[str], bool],
+                 absorb_timeout_seconds: float = DEFAULT_ABSORB_TIMEOUT_SECONDS):
+        self.add_problem_change = add_problem_change
+        self.latest_solution = latest_solution
+        self.is_solving = is_solving
+        self.absorb_timeout_seconds = absorb_timeout_seconds
+        # The changes waiting for the batch being absorbed, per job with a batch being absorbed
+        self._pending: dict[str, list[tuple[LiveRouteChanges, asyncio.Future]]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, job_id: str, changes: LiveRouteChanges) -> LiveChangeResult:
+        """
+        Returns once the solver absorbed the changes, together with those submitted around the same time.
+        Raises ValueError if the changes do not apply to the latest best solution.
+        """
+        future = asyncio.get_running_loop().create_future()
+        pending = self._pending.get(job_id)
+        if pending is not None:
+            pending.append((changes, future))
+        else:
+            self._pending[job_id] = [(changes, future)]
+            task = asyncio.create_task(self._apply_pending(job_id))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return await future
+
+    async def _apply_pending(self, job_id: str) -> None:
+        try:
+            while self._pending[job_id]:
+                batch, self._pending[job_id] = self._pending[job_id], []
+                try:
+                    await self._apply_batch(job_id, batch)
+                except Exception as e:
+                    for _, future in batch:
+                        future.get_loop().call_soon_threadsafe(_set_exception, future, e)
+        finally:
+            del self._pending[job_id]
+
+    async def _apply_batch(self, job_id: str, batch: list[tuple[LiveRouteChanges, asyncio.Future]]) -> None:
+        _, route_plan = await asyncio.to_thread(self.latest_solution, job_id)
+        if route_plan is None:
+            raise ValueError(f"No route plan with id {job_id}.")
+        change, accepted = await asyncio.to_thread(_combine, route_plan, batch)
+        if change is None:
+            return
+        await asyncio.to_thread(self.add_problem_change, job_id, change)
+        result = await self._wait_until_absorbed(job_id, change)
+        for future in accepted:
+            future.get_loop().call_soon_threadsafe(_set_result, future, result)
+
+    async def _wait_until_absorbed(self, job_id: str, change: RoutePlanChange) -> LiveChangeResult:
+        deadline = time.monotonic() + self.absorb_timeout_seconds
+        while True:
+            version, route_plan = await asyncio.to_thread(self.latest_solution, job_id)
+            absorbed = route_plan is not None and change.is_applied_to(route_plan) \
+                and route_plan.score is not None and route_plan.score.init_score == 0
+            if absorbed or not self.is_solving(job_id) or time.monotonic() >= deadline:
+                return LiveChangeResult(version=version or 0, absorbed=absorbed,
+                                        score=route_plan.score if route_plan is not None else None)
+            await asyncio.sleep(ABSORB_POLL_SECONDS)
+
+
+def _combine(route_plan: VehicleRoutePlan, batch: list[tuple[LiveRouteChanges, asyncio.Future]]) \
+        -> tuple[Optional[RoutePlanChange], list[asyncio.Future]]:
+    """
+    Merges the changes of the batch that apply on top of the earlier ones into a single problem change;
+    the submissions whose changes do not apply fail on their own. Returns the change and the accepted submissions.
+    """
+    merged = LiveRouteChanges()
+    change = None
+    accepted = []
+    for changes, future in batch:
+        try:
+            candidate = merged.merged(changes)
+            change = create_route_plan_change(route_plan, candidate)
+        except ValueError as e:
+            future.get_loop().call_soon_threadsafe(_set_exception, future, e)
+            continue
+        merged = candidate
+        accepted.append(future)
+    return change, accepted
+
+
+def _set_result(future: asyncio.Future, result: LiveChangeResult) -> None:
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, error: Exception) -> None:
+    if not future.done():
+        future.set_exception(error)
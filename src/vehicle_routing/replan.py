@@ -0,0 +1,125 @@
+"""
+Re-planning a job after trips or vehicles change during the day.
+
+Rather than solving the changed plan from scratch, the changes are applied to the job's latest best solution,
+so every route that is not affected starts out already optimized.
+Visits a vehicle has already left for are pinned (Vehicle.pinned_visit_count),
+together with the drop-off of every pinned pickup, so the solver only re-plans what is still ahead.
+"""
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+from .construction import update_route_shadow_variables
+from .domain import Vehicle, VehicleRoutePlan, json_to_vehicle_route_plan
+from .job_store import to_compact_dict
+from .json_serialization import JsonDomainBase
+
+
+class RouteChanges(JsonDomainBase):
+    # Visits are removed with their paired visit; modified visits and vehicles only need their id
+    # and the fields that change. The route of a modified vehicle is kept.
+    added_visits: list[dict[str, Any]] = []
+    modified_visits: list[dict[str, Any]] = []
+    removed_visit_ids: list[str] = []
+    added_vehicles: list[dict[str, Any]] = []
+    modified_vehicles: list[dict[str, Any]] = []
+    removed_vehicle_ids: list[str] = []
+    # Visits the vehicles left for by then are pinned; the current time by default.
+    # A time without time zone is read in the plan's time zone.
+    now: Optional[datetime] = None
+
+
+def pinned_visit_count(vehicle: Vehicle, now: datetime) -> int:
+    """
+    The number of visits at the start of the route that the vehicle has left for by now,
+    extended to the drop-off of every pickup among them, and never less than the count already pinned.
+    """
+    departure_time = vehicle.departure_time
+    if (now.tzinfo is None) != (departure_time.tzinfo is None):
+        now = now.replace(tzinfo=departure_time.tzinfo)
+    count = 0
+    for visit in vehicle.visits:
+        if departure_time is None or departure_time > now:
+            break
+        count += 1
+        departure_time = visit.calculate_departure_time()
+    index_by_visit = {id(visit): index for index, visit in enumerate(vehicle.visits)}
+    index = 0
+    while index < count:
+        paired_visit = vehicle.visits[index].paired_visit
+        if vehicle.visits[index].is_pickup and paired_visit is not None and id(paired_visit) in index_by_visit:
+            count = max(count, index_by_visit[id(paired_visit)] + 1)
+        index += 1
+    return max(count, vehicle.pinned_visit_count)
+
+
+def apply_route_changes(route_plan: VehicleRoutePlan, changes: RouteChanges) -> VehicleRoutePlan:
+    """
+    Returns a new plan: route_plan with the changes applied and the visits under way pinned.
+    Added visits are unassigned, as are the visits of removed vehicles.
+    Raises ValueError for unknown or duplicate ids, and for removing visits or vehicles that are under way.
+    """
+    now = changes.now or datetime.now(timezone.utc)
+    pinned_counts = {vehicle.id: pinned_visit_count(vehicle, now) for vehicle in route_plan.vehicles}
+    pinned_visit_ids = {visit.id for vehicle in route_plan.vehicles
+                        for visit in vehicle.visits[:pinned_counts[vehicle.id]]}
+
+    data = to_compact_dict(route_plan)
+    visits = {visit['id']: visit for visit in data['visits']}
+    vehicles = {vehicle['id']: vehicle for vehicle in data['vehicles']}
+
+    removed_visit_ids = set()
+    for visit_id in changes.removed_visit_ids:
+        if visit_id not in visits:
+            raise ValueError(f"Cannot remove visit {visit_id}: there is no such visit.")
+        removed_visit_ids.add(visit_id)
+        if visits[visit_id].get('pairedVisitId') in visits:
+            removed_visit_ids.add(visits[visit_id]['pairedVisitId'])
+    removed_visit_ids |= {visit_id for visit_id, visit in visits.items()
+                          if visit.get('pairedVisitId') in removed_visit_ids}
+    if removed_visit_ids & pinned_visit_ids:
+        raise ValueError(f"Cannot remove visits that are under way: {sorted(removed_visit_ids & pinned_visit_ids)}.")
+    for visit_id in removed_visit_ids:
+        del visits[visit_id]
+    for vehicle in vehicles.values():
+        vehicle['visits'] = [visit_id for visit_id in vehicle['visits'] if visit_id not in removed_visit_ids]
+
+    _merge(visits, changes.modified_visits, 'visit')
+    _add(visits, changes.added_visits, 'visit')
+
+    for vehicle_id in changes.removed_vehicle_ids:
+        if vehicle_id not in vehicles:
+            raise ValueError(f"Cannot remove vehicle {vehicle_id}: there is no such vehicle.")
+        if pinned_counts[vehicle_id] > 0:
+            raise ValueError(f"Cannot remove vehicle {vehicle_id}: its route is under way.")
+        del vehicles[vehicle_id]
+    _merge(vehicles, [{key: value for key, value in vehicle.items() if key != 'visits'}
+                      for vehicle in changes.modified_vehicles], 'vehicle')
+    _add(vehicles, [{**vehicle, 'visits': []} for vehicle in changes.added_vehicles], 'vehicle')
+    for vehicle_id, vehicle in vehicles.items():
+        vehicle['pinnedVisitCount'] = pinned_counts.get(vehicle_id, 0)
+
+    data['visits'] = list(visits.values())
+    data['vehicles'] = list(vehicles.values())
+    data.pop('score', None)
+    data.pop('solverStatus', None)
+    plan = json_to_vehicle_route_plan(data)
+    for vehicle in plan.vehicles:
+        update_route_shadow_variables(vehicle)
+    return plan
+
+
+def _merge(items: dict[str, dict], changes: list[dict[str, Any]], kind: str) -> None:
+    for change in changes:
+        item_id = change.get('id')
+        if item_id not in items:
+            raise ValueError(f"Cannot modify {kind} {item_id}: there is no such {kind}.")
+        items[item_id] = {**items[item_id], **change}
+
+
+def _add(items: dict[str, dict], added: list[dict[str, Any]], kind: str) -> None:
+    for item in added:
+        item_id = item.get('id')
+        if item_id is None or item_id in items:
+            raise ValueError(f"Cannot add {kind} {item_id}: its id is missing or already taken.")
+        items[item_id] = item
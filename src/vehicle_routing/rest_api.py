@@ -1,15 +1,58 @@
-from fastapi import FastAPI, Depends, Request
+import asyncio
+import logging
+import math
+import threading
+from typing import Iterator
+
+import orjson
+from fastapi import FastAPI, Depends, Request, Query, HTTPException, Header
+from fastapi.responses import Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+from timefold.solver import SolverManager
+from timefold.solver.config import TerminationConfig
 from uuid import uuid4
 
 from .domain import *
 from .score_analysis import *
 from .demo_data import DemoData, generate_demo_data
-from .solver import solver_manager, solution_manager
-
-
+from .job_store import create_job_store_from_environment
+from .streaming import SolutionBroadcaster, score_key, to_event
+from .delta import RoutePlanDelta, SolutionHistory, delta_to_dict
+from .serialization import ResponseCache, dump_route_plan, route_plan_to_dict
+from .replan import RouteChanges, apply_route_changes
+from .problem_changes import LiveChangeResult, LiveRouteChanges, ProblemChangeBatcher, RoutePlanChange
+from .export import ExportFormat, encode_rows, rows_from_json, rows_from_plan
+from .batch import BatchProgress, BatchScheduler, JobProgress, QueueFullError
+from .solver import (solver_manager, solution_manager, get_solver_manager, parse_move_thread_count,
+                     create_termination_config, solve_and_listen, MAX_RUNNING_SOLVERS, MAX_QUEUED_JOBS,
+                     CONSTRAINT_PROFILING)
+from .constraint_profiling import ConstraintProfileReport, DEFAULT_PROFILE_SPENT_LIMIT_SECONDS, profile_solve
+
+
+logger = logging.getLogger(__name__)
 app = FastAPI(docs_url='/q/swagger-ui')
-data_sets: dict[str, VehicleRoutePlan] = {}
+job_store = create_job_store_from_environment()
+broadcaster = SolutionBroadcaster()
+solution_history = SolutionHistory()
+response_cache = ResponseCache()
+# How often a stream re-reads a job that another worker process is solving
+JOB_STORE_POLL_SECONDS = 2
+# The SolverManager of every job solving in this process;
+# jobs solved with a non-default moveThreadCount run on their own SolverManager
+job_solver_managers: dict[str, SolverManager] = {}
+# The SolverManager and termination of every job waiting for a free solver
+queued_job_settings: dict[str, tuple[SolverManager, TerminationConfig]] = {}
+
+PriorityQuery = Annotated[int, Query(description='Jobs with a higher priority get free solvers first')]
+MoveThreadCountQuery = Annotated[Optional[str], Query(alias='moveThreadCount')]
+SpentLimitQuery = Annotated[Optional[float], Query(
+    alias='spentLimit', description='Seconds; scaled to the plan size by default')]
+UnimprovedSpentLimitQuery = Annotated[Optional[float], Query(
+    alias='unimprovedSpentLimit', description='Seconds without improvement after which a feasible plan stops')]
+BestScoreLimitQuery = Annotated[Optional[str], Query(
+    alias='bestScoreLimit', description='For example 0hard/-5000soft')]
+ExportFormatQuery = Annotated[ExportFormat, Query(alias='format')]
 
 
 @app.get("/demo-data")
@@ -26,94 +69,382 @@ async def demo_data_list():
 async def get_demo_data(dataset_id: dict) -> VehicleRoutePlan:
     print(dataset_id)
     demo_data = generate_demo_data(dataset_id)
-    return demo_data
+    return Response(dump_route_plan(demo_data), media_type='application/json')
 
 @app.post("/route-plans/{problem_id}", response_model_exclude_none=True)
 async def get_route(problem_id: str) -> VehicleRoutePlan:
-    route = data_sets[problem_id]
-    return route.model_copy(update={
-        'solver_status': solver_manager.get_solver_status(problem_id),
-    })
-
-@app.post("/output", response_model_exclude_none=True)
-async def get_output_data(input: dict):
-    print(input)
-    output = []
-    
-    visits = input["visits"]
-    for trip in visits:
-        if trip["isPickup"]:
-            isassigned = True
-            trip_id = trip["id"].replace("pickup_", "")
-            pickup = next((v for v in visits if v["id"] == trip["id"]), None)
-            dropoff = next((v for v in visits if v["id"] == f"dropoff_{trip_id}"), None)
-
-            if not pickup or not dropoff:
-                isassigned = False
-
-            if "vehicle" not in pickup or "vehicle" not in dropoff:
-                isassigned = False
-
-            if not trip.get("vehicle"):
-                isassigned = False
-
-            output.append({"TblId": trip_id,
-                           "VehicleId": trip.get("vehicle"),
-                           "DriverId": trip.get("driverId"),"IsAssigned":isassigned,"Exception":None,
-                           "Make_Model":trip.get("vehicleName"),"ProgressId":input.get("ProgressId")})
-    return {"data": output}
+    version, route = await run_in_threadpool(solution_history.latest, problem_id, lambda: job_store.get(problem_id))
+    if route is None:
+        raise HTTPException(status_code=404, detail=f"No route plan with id {problem_id}.")
+    solver_status = job_solver_status(problem_id, route)
+    if version is None:
+        # Not solved in this process, so the stored plan may change without a new version
+        body = await run_in_threadpool(dump_route_plan, route, solver_status)
+    else:
+        body = await run_in_threadpool(response_cache.get, (problem_id, version, solver_status), route, solver_status)
+    return Response(body, media_type='application/json')
+
+def job_solver_status(problem_id: str, route: VehicleRoutePlan) -> SolverStatus:
+    job_solver_manager = job_solver_managers.get(problem_id)
+    if job_solver_manager is None:
+        # Another worker process may be solving the job, in which case the stored status is the latest known one
+        return route.solver_status or SolverStatus.NOT_SOLVING
+    solver_status = job_solver_manager.get_solver_status(problem_id)
+    if solver_status == SolverStatus.NOT_SOLVING:
+        # The job is registered before its problem is handed to the SolverManager,
+        # and stays registered until its final solution is stored
+        return route.solver_status or SolverStatus.SOLVING_SCHEDULED
+    return solver_status
+
+
+@app.get("/route-plans/{problem_id}/delta", response_model=RoutePlanDelta, response_model_exclude_none=True)
+async def get_route_delta(problem_id: str,
+                          since_version: Annotated[Optional[int], Query(
+                              alias='sinceVersion',
+                              description='The version the client has; omit it to get the whole plan')] = None):
+    """
+    Returns the vehicles and visits that changed since sinceVersion,
+    or the whole plan (in plan) when that version is no longer known.
+    """
+    delta = await run_in_threadpool(solution_history.delta, problem_id, since_version,
+                                    lambda: job_store.get(problem_id))
+    if delta is None:
+        raise HTTPException(status_code=404, detail=f"No route plan with id {problem_id}.")
+    # Serialized directly: validating the response model again would cost as much as the full plan
+    body = await run_in_threadpool(lambda: orjson.dumps(delta_to_dict(delta)))
+    return Response(body, media_type='application/json')
+
+
+@app.get("/route-plans/{problem_id}/status", response_model_exclude_none=True)
+async def get_route_status(problem_id: str) -> JobProgress:
+    """
+    The solver status and score of a job, with its place in the queue and estimated wait while it is scheduled.
+    """
+    progress = batch_scheduler.job_progress(problem_id)
+    if progress is not None and progress.solver_status != SolverStatus.SOLVING_ACTIVE:
+        return progress
+    _, route = await run_in_threadpool(solution_history.latest, problem_id, lambda: job_store.get(problem_id))
+    if route is None:
+        raise HTTPException(status_code=404, detail=f"No route plan with id {problem_id}.")
+    solver_status = progress.solver_status if progress is not None \
+        else route.solver_status or SolverStatus.NOT_SOLVING
+    return JobProgress(job_id=problem_id, solver_status=solver_status, score=route.score)
+
+
+@app.get("/route-plans/{problem_id}/events")
+async def stream_route(problem_id: str,
+                       last_event_id: Annotated[Optional[int], Header()] = None) -> StreamingResponse:
+    """
+    Server-Sent Events: a bestSolution event with the whole plan every time the score improves,
+    at most twice per second, ending with the final solution.
+    """
+    if broadcaster.is_streaming(problem_id):
+        events = broadcaster.subscribe(problem_id, last_event_id or 0)
+    elif await run_in_threadpool(job_store.__contains__, problem_id):
+        events = poll_job_store(problem_id)
+    else:
+        raise HTTPException(status_code=404, detail=f"No route plan with id {problem_id}.")
+    return StreamingResponse(events, media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.post("/output")
+async def get_output_data(request: Request, export_format: ExportFormatQuery = ExportFormat.JSON) -> Response:
+    """
+    The trip assignment export of a plan posted back as JSON: one row per trip,
+    as {"data": [...]} by default, or streamed as NDJSON or CSV.
+    """
+    body = await request.body()
+    try:
+        plan = await run_in_threadpool(orjson.loads, body)
+    except orjson.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not isinstance(plan, dict) or not isinstance(plan.get('visits'), list):
+        raise HTTPException(status_code=400, detail="Expected a route plan with visits.")
+    return await export_response(rows_from_json(plan), export_format)
+
+
+@app.get("/route-plans/{problem_id}/output")
+async def get_route_output(problem_id: str, export_format: ExportFormatQuery = ExportFormat.JSON,
+                           progress_id: Annotated[Optional[str], Query(alias='progressId')] = None) -> Response:
+    """
+    The trip assignment export of the latest plan of a job, as POST /output gives it for the posted plan.
+    """
+    _, route = await run_in_threadpool(solution_history.latest, problem_id, lambda: job_store.get(problem_id))
+    if route is None:
+        raise HTTPException(status_code=404, detail=f"No route plan with id {problem_id}.")
+    return await export_response(rows_from_plan(route, progress_id), export_format)
+
+
+async def export_response(rows: Iterator[dict], export_format: ExportFormat) -> Response:
+    if export_format == ExportFormat.JSON:
+        body = await run_in_threadpool(lambda: b''.join(encode_rows(rows, export_format)))
+        return Response(body, media_type=export_format.media_type)
+    # Rows are built as the response is sent, on a worker thread
+    return StreamingResponse(encode_rows(rows, export_format), media_type=export_format.media_type)
 
-def update_route(problem_id: str, route: VehicleRoutePlan):
-    global data_sets
-    data_sets[problem_id] = route
 
+def update_route(problem_id: str, route: VehicleRoutePlan):
+    job_store.put(problem_id, route, SolverStatus.SOLVING_ACTIVE)
+    solution_history.record(problem_id, route)
+    broadcaster.publish(problem_id, route)
+
+
+def finish_route(problem_id: str, route: Optional[VehicleRoutePlan] = None, error: Optional[str] = None):
+    job_solver_managers.pop(problem_id, None)
+    route = route or job_store.get(problem_id)
+    if route is not None:
+        job_store.put(problem_id, route, SolverStatus.NOT_SOLVING)
+        solution_history.record(problem_id, route, final=True)
+        broadcaster.publish(problem_id, route)
+    else:
+        broadcaster.close(problem_id)
+    batch_scheduler.job_finished(problem_id, route.score if route is not None else None, error)
+
+
+def fail_route(problem_id: str, error: Exception):
+    logger.error('Solving route plan %s failed.', problem_id, exc_info=error)
+    finish_route(problem_id, error=f'{type(error).__name__}: {error}')
+
+
+async def poll_job_store(problem_id: str):
+    """
+    Streams a job this process is not solving, by re-reading it from the job store until it is solved.
+    """
+    version = 0
+    last_seen = None
+    while True:
+        route = await run_in_threadpool(job_store.get, problem_id)
+        if route is None:
+            return
+        if (score_key(route), route.solver_status) != last_seen:
+            last_seen = (score_key(route), route.solver_status)
+            version += 1
+            yield to_event(route, version)
+        if route.solver_status in (None, SolverStatus.NOT_SOLVING):
+            return
+        await asyncio.sleep(JOB_STORE_POLL_SECONDS)
 
-def json_to_vehicle_route_plan(json: dict) -> VehicleRoutePlan:
-    visits = {
-        visit['id']: visit for visit in json.get('visits', [])
-    }
-    vehicles = {
-        vehicle['id']: vehicle for vehicle in json.get('vehicles', [])
-    }
 
-    for visit in visits.values():
-        if 'vehicle' in visit:
-            del visit['vehicle']
+async def setup_context(request: Request) -> VehicleRoutePlan:
+    body = await request.body()
+    # Building the travel time matrix of a large plan takes a while, so keep it off the event loop
+    return await run_in_threadpool(load_vehicle_route_plan, body)
 
-        if 'previousVisit' in visit:
-            del visit['previousVisit']
 
-        if 'nextVisit' in visit:
-            del visit['nextVisit']
+def start_solving(job_id: str, route: VehicleRoutePlan, job_solver_manager: SolverManager,
+                  termination_config: TerminationConfig):
+    broadcaster.start(job_id)
+    job_solver_managers[job_id] = job_solver_manager
+    solve_and_listen(job_solver_manager, job_id, route,
+                     lambda solution: update_route(job_id, solution), termination_config,
+                     final_listener=lambda solution: finish_route(job_id, solution),
+                     exception_handler=lambda _, error: fail_route(job_id, error))
 
-    visits = {visit_id: Visit.model_validate(visits[visit_id]) for visit_id in visits}
-    json['visits'] = list(visits.values())
 
-    for vehicle in vehicles.values():
-        vehicle['visits'] = [visits[visit_id] for visit_id in vehicle['visits']]
+def start_queued_job(job_id: str):
+    job_solver_manager, termination_config = queued_job_settings.pop(job_id)
+    route = job_store.get(job_id)
+    if route is None:
+        # Evicted from the job store while it waited
+        batch_scheduler.job_finished(job_id)
+        return
+    start_solving(job_id, route, job_solver_manager, termination_config)
 
-    json['vehicles'] = list(vehicles.values())
 
-    return VehicleRoutePlan.model_validate(json, context={
-        'visits': visits,
-        'vehicles': vehicles
-    })
+batch_scheduler = BatchScheduler(start_queued_job, MAX_RUNNING_SOLVERS, MAX_QUEUED_JOBS,
+                                 retain_finished_seconds=job_store.ttl_seconds)
 
 
-async def setup_context(request: Request) -> VehicleRoutePlan:
-    json = await request.json()
-    return json_to_vehicle_route_plan(json)
+@app.post("/route-plans")
+async def solve_route(route: Annotated[VehicleRoutePlan, Depends(setup_context)],
+                      priority: PriorityQuery = 0,
+                      move_thread_count: MoveThreadCountQuery = None,
+                      spent_limit: SpentLimitQuery = None,
+                      unimproved_spent_limit: UnimprovedSpentLimitQuery = None,
+                      best_score_limit: BestScoreLimitQuery = None) -> str:
+    """
+    Queues the plan until a solver is free, and returns the job id;
+    429 with Retry-After when the queue is full.
+    """
+    try:
+        job_solver_manager = get_solver_manager(parse_move_thread_count(move_thread_count)
+                                                if move_thread_count is not None else None)
+        termination_config = create_termination_config(route, spent_limit, unimproved_spent_limit,
+                                                       best_score_limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _, [job_id] = await run_in_threadpool(submit_batch, [route], job_solver_manager, [termination_config],
+                                          priority, None)
+    return job_id
 
 
-@app.post("/route-plans")
-async def solve_route(route: Annotated[VehicleRoutePlan, Depends(setup_context)]) -> str:
-    job_id = str(uuid4())
-    data_sets[job_id] = route
-    solver_manager.solve_and_listen(job_id, route,
-                                    lambda solution: update_route(job_id, solution))
+@app.post("/route-plans/{problem_id}/replan")
+async def replan_route(problem_id: str, changes: RouteChanges,
+                       priority: PriorityQuery = 0,
+                       move_thread_count: MoveThreadCountQuery = None,
+                       spent_limit: SpentLimitQuery = None,
+                       unimproved_spent_limit: UnimprovedSpentLimitQuery = None,
+                       best_score_limit: BestScoreLimitQuery = None) -> str:
+    """
+    Applies the changes to the latest best solution of the job and solves on from there, as a new job;
+    returns its id. Visits already under way stay where they are.
+    Once the changes apply, the job is stopped if it is still solving or queued, as the new job supersedes it;
+    a request that is refused leaves the job alone.
+    """
+    _, route = await run_in_threadpool(solution_history.latest, problem_id, lambda: job_store.get(problem_id))
+    if route is None:
+        raise HTTPException(status_code=404, detail=f"No route plan with id {problem_id}.")
+    try:
+        # apply_route_changes builds a new plan, so the job's own solution is untouched if it fails
+        route = await run_in_threadpool(apply_route_changes, route, changes)
+        job_solver_manager = get_solver_manager(parse_move_thread_count(move_thread_count)
+                                                if move_thread_count is not None else None)
+        termination_config = create_termination_config(route, spent_limit, unimproved_spent_limit,
+                                                       best_score_limit, warm_start=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if batch_scheduler.drop(problem_id):
+        await run_in_threadpool(drop_queued_jobs, [problem_id])
+    elif problem_id in job_solver_managers:
+        await run_in_threadpool(job_solver_managers.get(problem_id, solver_manager).terminate_early, problem_id)
+    _, [job_id] = await run_in_threadpool(submit_batch, [route], job_solver_manager, [termination_config],
+                                          priority, None)
     return job_id
 
 
+def add_problem_change(job_id: str, change: RoutePlanChange) -> None:
+    # The returned future completes once a best solution with the change is consumed,
+    # which may still have the changed visits unassigned, so the batcher watches the best solutions instead
+    job_solver_managers.get(job_id, solver_manager).add_problem_change(job_id, change)
+
+
+problem_change_batcher = ProblemChangeBatcher(
+    add_problem_change, lambda job_id: solution_history.latest(job_id, lambda: job_store.get(job_id)),
+    lambda job_id: job_id in job_solver_managers)
+
+
+@app.post("/route-plans/{problem_id}/changes", response_model_exclude_none=True)
+async def change_route(problem_id: str, changes: LiveRouteChanges) -> LiveChangeResult:
+    """
+    Applies the changes to the job while it keeps solving, and returns the first version of its best solution
+    with the changes absorbed and every visit assigned; 409 if the job is not solving in this process.
+    Visits already under way stay where they are.
+    """
+    if problem_id not in job_solver_managers:
+        if not await run_in_threadpool(job_store.__contains__, problem_id):
+            raise HTTPException(status_code=404, detail=f"No route plan with id {problem_id}.")
+        raise HTTPException(status_code=409, detail=f"Route plan {problem_id} is not solving in this process; "
+                                                    f"re-plan it instead.")
+    try:
+        return await problem_change_batcher.submit(problem_id, changes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.post("/route-plan-batches")
+async def solve_route_batch(request: Request,
+                            priority: PriorityQuery = 0,
+                            concurrency: Annotated[Optional[int], Query(
+                                ge=1, description='How many plans of the batch solve at the same time')] = None,
+                            move_thread_count: MoveThreadCountQuery = None,
+                            spent_limit: SpentLimitQuery = None,
+                            unimproved_spent_limit: UnimprovedSpentLimitQuery = None,
+                            best_score_limit: BestScoreLimitQuery = None) -> str:
+    """
+    Solves a JSON array of independent route plans, and returns the batch id.
+    Every plan gets its own job id, so each one can also be read, streamed or stopped through /route-plans.
+    The whole batch is refused with 429 and Retry-After when it does not fit in the queue.
+    """
+    body = await request.body()
+    try:
+        routes = await run_in_threadpool(load_vehicle_route_plans, body)
+        job_solver_manager = get_solver_manager(parse_move_thread_count(move_thread_count)
+                                                if move_thread_count is not None else None)
+        termination_configs = [create_termination_config(route, spent_limit, unimproved_spent_limit,
+                                                         best_score_limit) for route in routes]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    batch_id, _ = await run_in_threadpool(submit_batch, routes, job_solver_manager, termination_configs,
+                                          priority, concurrency)
+    return batch_id
+
+
+def submit_batch(routes: list[VehicleRoutePlan], job_solver_manager: SolverManager,
+                 termination_configs: list[TerminationConfig], priority: int,
+                 concurrency: Optional[int]) -> tuple[str, list[str]]:
+    """
+    Stores the plans and queues them; returns the batch id and the job ids.
+    """
+    job_ids = [str(uuid4()) for _ in routes]
+    for job_id, route, termination_config in zip(job_ids, routes, termination_configs):
+        job_store.put(job_id, route, SolverStatus.SOLVING_SCHEDULED)
+        queued_job_settings[job_id] = (job_solver_manager, termination_config)
+    try:
+        return batch_scheduler.submit(job_ids, priority, concurrency), job_ids
+    except (QueueFullError, ValueError) as e:
+        for job_id in job_ids:
+            queued_job_settings.pop(job_id, None)
+            job_store.delete(job_id)
+        if isinstance(e, QueueFullError):
+            raise HTTPException(status_code=429, detail=str(e),
+                                headers={'Retry-After': str(e.retry_after_seconds)})
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/route-plan-batches/{batch_id}", response_model_exclude_none=True)
+async def get_route_batch(batch_id: str) -> BatchProgress:
+    progress = batch_scheduler.progress(batch_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail=f"No batch with id {batch_id}.")
+    return progress
+
+
+@app.get("/route-plan-batches/{batch_id}/results")
+async def stream_route_batch(batch_id: str) -> StreamingResponse:
+    """
+    Newline-delimited JSON: one {"jobId": ..., "plan": ...} line per plan, as soon as it is solved.
+    """
+    if batch_id not in batch_scheduler:
+        raise HTTPException(status_code=404, detail=f"No batch with id {batch_id}.")
+    return StreamingResponse(batch_results(batch_id), media_type='application/x-ndjson',
+                             headers={'X-Accel-Buffering': 'no'})
+
+
+@app.delete("/route-plan-batches/{batch_id}")
+async def stop_solving_batch(batch_id: str) -> None:
+    """
+    Plans that did not start solving are returned unsolved; those solving stop early.
+    """
+    cancelled = batch_scheduler.cancel(batch_id)
+    if cancelled is None:
+        raise HTTPException(status_code=404, detail=f"No batch with id {batch_id}.")
+    dropped, solving = cancelled
+    for job_id in solving:
+        job_solver_managers.get(job_id, solver_manager).terminate_early(job_id)
+    await run_in_threadpool(drop_queued_jobs, dropped)
+
+
+def drop_queued_jobs(job_ids: list[str]):
+    for job_id in job_ids:
+        queued_job_settings.pop(job_id, None)
+        route = job_store.get(job_id)
+        if route is not None:
+            job_store.put(job_id, route, SolverStatus.NOT_SOLVING)
+
+
+async def batch_results(batch_id: str):
+    async for job_id in batch_scheduler.finished_jobs(batch_id):
+        route = await run_in_threadpool(job_store.get, job_id)
+        if route is None:
+            continue
+        yield await run_in_threadpool(batch_result_line, job_id, route)
+
+
+def batch_result_line(job_id: str, route: VehicleRoutePlan) -> bytes:
+    return orjson.dumps({'jobId': job_id, 'plan': route_plan_to_dict(route, SolverStatus.NOT_SOLVING)}) + b'\n'
+
+
 @app.put("/route-plans/analyze")
 async def analyze_route(route: Annotated[VehicleRoutePlan, Depends(setup_context)]) \
         -> dict['str', list[ConstraintAnalysisDTO]]:
@@ -132,9 +463,38 @@ async def analyze_route(route: Annotated[VehicleRoutePlan, Depends(setup_context
     ) for constraint in solution_manager.analyze(route).constraint_analyses]}
 
 
+# Profiling solves outside the job queue, so it is bounded separately, by as many solves as the queue runs at once
+profiling_slots = threading.BoundedSemaphore(MAX_RUNNING_SOLVERS)
+
+
+@app.put("/route-plans/profile", response_model_exclude_none=True)
+async def profile_route(route: Annotated[VehicleRoutePlan, Depends(setup_context)],
+                        spent_limit: Annotated[float, Query(alias='spentLimit', description='Seconds')] =
+                        DEFAULT_PROFILE_SPENT_LIMIT_SECONDS) -> ConstraintProfileReport:
+    """
+    Solves the plan with profiled constraints, outside the job queue, and returns the time spent in each constraint;
+    404 unless SOLVER_CONSTRAINT_PROFILING is true,
+    429 with Retry-After while SOLVER_PARALLEL_SOLVER_COUNT profiling solves are already running.
+    """
+    if not CONSTRAINT_PROFILING:
+        raise HTTPException(status_code=404, detail="Constraint profiling is off (SOLVER_CONSTRAINT_PROFILING).")
+    if spent_limit <= 0:
+        raise HTTPException(status_code=400, detail=f"spentLimit ({spent_limit}) must be positive.")
+    if not profiling_slots.acquire(blocking=False):
+        raise HTTPException(status_code=429, detail=f"All {MAX_RUNNING_SOLVERS} profiling slots are in use.",
+                            headers={'Retry-After': str(math.ceil(spent_limit))})
+    try:
+        return await run_in_threadpool(profile_solve, route, spent_limit)
+    finally:
+        profiling_slots.release()
+
+
 @app.delete("/route-plans/{problem_id}")
 async def stop_solving(problem_id: str) -> None:
-    solver_manager.terminate_early(problem_id)
+    if batch_scheduler.drop(problem_id):
+        await run_in_threadpool(drop_queued_jobs, [problem_id])
+    else:
+        job_solver_managers.get(problem_id, solver_manager).terminate_early(problem_id)
 
 
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
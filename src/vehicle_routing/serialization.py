@@ -0,0 +1,176 @@
+"""
+JSON responses of a VehicleRoutePlan, with the route metrics computed once per solution version.
+
+Serializing the computed fields as is walks every route twice (once per vehicle, once for the plan total)
+and reads every travel time from its JVM row one by one.
+dump_route_plan computes the metrics of all routes in a single pass over the plan's travel time matrix
+and fills them in, and ResponseCache keeps the resulting bytes for as long as the solution version is current,
+so every client polling a job gets the same bytes.
+"""
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Hashable, Optional
+
+import numpy as np
+import orjson
+from pydantic import TypeAdapter
+from timefold.solver import SolverStatus
+
+from .domain import Vehicle, Visit, VehicleRoutePlan
+
+DEFAULT_MAX_RESPONSES = 32
+_DATETIME = TypeAdapter(datetime)
+
+# Computed fields that walk a route; every other computed field is a cheap lookup and left to pydantic
+_VEHICLE_METRICS_EXCLUDE = {'arrival_time', 'total_driving_time_seconds', 'total_demand', 'peak_load'}
+_VISIT_METRICS_EXCLUDE = {'driving_time_seconds_from_previous_standstill', 'index_in_vehicle_route'}
+_ROUTE_METRICS_EXCLUDE = {
+    'total_driving_time_seconds': True,
+    'vehicles': {'__all__': _VEHICLE_METRICS_EXCLUDE},
+    'visits': {'__all__': _VISIT_METRICS_EXCLUDE},
+}
+
+
+@dataclass
+class VehicleMetrics:
+    arrival_time: Optional[datetime]
+    total_demand: int
+    peak_load: int
+    total_driving_time_seconds: int
+
+
+@dataclass
+class RouteMetrics:
+    vehicles: dict[str, VehicleMetrics] = field(default_factory=dict)
+    # Keyed by visit id; only visits on a route
+    driving_time_seconds_from_previous_standstill: dict[str, int] = field(default_factory=dict)
+    index_in_vehicle_route: dict[str, int] = field(default_factory=dict)
+    total_driving_time_seconds: int = 0
+
+
+def _route_driving_times(route_plan: VehicleRoutePlan, vehicle: Vehicle) -> list[int]:
+    """
+    Returns the driving times of the legs of the route: depot to the first visit, ..., last visit to the depot.
+    """
+    locations = [vehicle.home_location, *(visit.location for visit in vehicle.visits), vehicle.home_location]
+    matrix = route_plan.travel_time_matrix
+    if matrix is not None and all(location.index is not None for location in locations):
+        indices = np.fromiter((location.index for location in locations), dtype=np.intp, count=len(locations))
+        return matrix[indices[:-1], indices[1:]].tolist()
+    return [origin.driving_time_to(destination) for origin, destination in zip(locations, locations[1:])]
+
+
+def compute_route_metrics(route_plan: VehicleRoutePlan) -> RouteMetrics:
+    """
+    Computes the values of Vehicle.arrival_time, total_demand, peak_load and total_driving_time_seconds,
+    Visit.driving_time_seconds_from_previous_standstill and index_in_vehicle_route
+    and VehicleRoutePlan.total_driving_time_seconds in one pass.
+    """
+    metrics = RouteMetrics()
+    for vehicle in route_plan.vehicles:
+        if not vehicle.visits:
+            metrics.vehicles[vehicle.id] = VehicleMetrics(vehicle.departure_time, 0, 0, 0)
+            continue
+        driving_times = _route_driving_times(route_plan, vehicle)
+        total_demand = 0
+        peak_load = 0
+        for index, (visit, driving_time) in enumerate(zip(vehicle.visits, driving_times)):
+            total_demand += visit.demand
+            peak_load = max(peak_load, total_demand)
+            if visit.vehicle is not None:
+                metrics.driving_time_seconds_from_previous_standstill[visit.id] = driving_time
+                metrics.index_in_vehicle_route[visit.id] = index
+        last_departure_time = vehicle.visits[-1].calculate_departure_time()
+        arrival_time = None if last_departure_time is None \
+            else last_departure_time + timedelta(seconds=driving_times[-1])
+        total_driving_time_seconds = sum(driving_times)
+        metrics.vehicles[vehicle.id] = VehicleMetrics(arrival_time, total_demand, peak_load,
+                                                      total_driving_time_seconds)
+        metrics.total_driving_time_seconds += total_driving_time_seconds
+    return metrics
+
+
+def _add_vehicle_metrics(data: dict, metrics: RouteMetrics) -> dict:
+    vehicle_metrics = metrics.vehicles[data['id']]
+    if vehicle_metrics.arrival_time is not None:
+        data['arrivalTime'] = _DATETIME.dump_python(vehicle_metrics.arrival_time, mode='json')
+    data['totalDemand'] = vehicle_metrics.total_demand
+    data['peakLoad'] = vehicle_metrics.peak_load
+    data['totalDrivingTimeSeconds'] = vehicle_metrics.total_driving_time_seconds
+    return data
+
+
+def _add_visit_metrics(data: dict, metrics: RouteMetrics) -> dict:
+    driving_time = metrics.driving_time_seconds_from_previous_standstill.get(data['id'])
+    if driving_time is not None:
+        data['drivingTimeSecondsFromPreviousStandstill'] = driving_time
+        data['indexInVehicleRoute'] = metrics.index_in_vehicle_route[data['id']]
+    return data
+
+
+def route_plan_to_dict(route_plan: VehicleRoutePlan, solver_status: Optional[SolverStatus] = None,
+                       metrics: Optional[RouteMetrics] = None) -> dict:
+    """
+    Returns the JSON-ready dict of the plan, as model_dump(mode='json', by_alias=True, exclude_none=True) would,
+    optionally with another solver status; metrics are computed unless given.
+    """
+    if metrics is None:
+        metrics = compute_route_metrics(route_plan)
+    data = route_plan.model_dump(mode='json', by_alias=True, exclude_none=True, exclude=_ROUTE_METRICS_EXCLUDE)
+    for vehicle in data['vehicles']:
+        _add_vehicle_metrics(vehicle, metrics)
+    for visit in data['visits']:
+        _add_visit_metrics(visit, metrics)
+    data['totalDrivingTimeSeconds'] = metrics.total_driving_time_seconds
+    if solver_status is not None:
+        data['solverStatus'] = solver_status.value
+    return data
+
+
+def vehicle_to_dict(vehicle: Vehicle, metrics: RouteMetrics) -> dict:
+    """
+    The vehicle as route_plan_to_dict puts it in the plan, with the metrics of compute_route_metrics.
+    """
+    return _add_vehicle_metrics(vehicle.model_dump(mode='json', by_alias=True, exclude_none=True,
+                                                   exclude=_VEHICLE_METRICS_EXCLUDE), metrics)
+
+
+def visit_to_dict(visit: Visit, metrics: RouteMetrics) -> dict:
+    """
+    The visit as route_plan_to_dict puts it in the plan, with the metrics of compute_route_metrics.
+    """
+    return _add_visit_metrics(visit.model_dump(mode='json', by_alias=True, exclude_none=True,
+                                               exclude=_VISIT_METRICS_EXCLUDE), metrics)
+
+
+def dump_route_plan(route_plan: VehicleRoutePlan, solver_status: Optional[SolverStatus] = None) -> bytes:
+    return orjson.dumps(route_plan_to_dict(route_plan, solver_status))
+
+
+class ResponseCache:
+    """
+    The serialized plans of the latest solution versions; thread-safe.
+    Keys identify a version, for example (job id, version, solver status); the least recently used are dropped.
+    """
+
+    def __init__(self, max_responses: int = DEFAULT_MAX_RESPONSES):
+        self.max_responses = max_responses
+        self._responses: OrderedDict[Hashable, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, route_plan: VehicleRoutePlan, solver_status: Optional[SolverStatus] = None) -> bytes:
+        with self._lock:
+            response = self._responses.get(key)
+            if response is not None:
+                self._responses.move_to_end(key)
+                return response
+        # Serialized outside the lock: two clients asking for a new version at once both serialize it,
+        # rather than every other job waiting for the serialization
+        response = dump_route_plan(route_plan, solver_status)
+        with self._lock:
+            self._responses[key] = response
+            while len(self._responses) > self.max_responses:
+                self._responses.popitem(last=False)
+        return response
@@ -1,25 +1,268 @@
+import logging
+import os
+from typing import Callable
+
 from timefold.solver import SolverManager, SolutionManager
-from timefold.solver.config import (SolverConfig, ScoreDirectorFactoryConfig,
-                                    TerminationConfig, Duration)
+from timefold.solver.config import (SolverConfig, ScoreDirectorFactoryConfig, SolverConfigOverride,
+                                    TerminationConfig, TerminationCompositionStyle, Duration, MoveThreadCount,
+                                    SolverManagerConfig)
+from timefold.solver.score import HardSoftScore
+from timefold.solver._timefold_java_interop import is_enterprise_installed
 
 from .domain import *
 from .constraints import define_constraints
+from .nearby import get_visit_nearby_distance_meter
+from .move_filters import get_move_filter_class_names
+from .construction import place_trips
+
+
+logger = logging.getLogger(__name__)
+
+# Local search that also moves and swaps two adjacent visits at once: a pickup and its drop-off
+# stay together on a route, so these move whole trips without splitting them.
+# Reversing is off, as it would put the drop-off before its pickup.
+TRIP_MOVES_SOLVER_CONFIG_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<solver xmlns="https://timefold.ai/xsd/solver">
+  <constructionHeuristic/>
+  <localSearch>
+    <unionMoveSelector>
+      <listChangeMoveSelector/>
+      <listSwapMoveSelector/>
+      <subListChangeMoveSelector>
+        <selectReversingMoveToo>false</selectReversingMoveToo>
+        <subListSelector>
+          <minimumSubListSize>2</minimumSubListSize>
+          <maximumSubListSize>2</maximumSubListSize>
+        </subListSelector>
+      </subListChangeMoveSelector>
+      <subListSwapMoveSelector>
+        <selectReversingMoveToo>false</selectReversingMoveToo>
+        <subListSelector>
+          <minimumSubListSize>2</minimumSubListSize>
+          <maximumSubListSize>2</maximumSubListSize>
+        </subListSelector>
+      </subListSwapMoveSelector>
+    </unionMoveSelector>
+  </localSearch>
+</solver>
+"""
+
+
+def trip_moves_solver_config_xml(time_window_filter: bool) -> str:
+    """
+    TRIP_MOVES_SOLVER_CONFIG_XML, with every move selector filtered so that no visit goes to a vehicle
+    of a type that may not serve it, and the change moves also filtered by the time windows
+    of the destination route if time_window_filter.
+    """
+    config_xml = TRIP_MOVES_SOLVER_CONFIG_XML
+    for selector, filter_class in get_move_filter_class_names(time_window_filter).items():
+        config_xml = (config_xml
+                      .replace(f'<{selector}/>', f'<{selector}>\n      </{selector}>')
+                      .replace(f'<{selector}>', f'<{selector}>\n        <filterClass>{filter_class}</filterClass>'))
+    return config_xml
+
 
+def parse_move_thread_count(value: Optional[str | int]) -> int | MoveThreadCount:
+    """
+    Reads a move thread count given as NONE, AUTO or a number of threads.
+    """
+    if value is None or isinstance(value, MoveThreadCount):
+        return value or MoveThreadCount.NONE
+    if isinstance(value, int) or value.isdigit():
+        count = int(value)
+        if count < 1:
+            raise ValueError(f"moveThreadCount ({value}) must be at least 1.")
+        return MoveThreadCount.NONE if count == 1 else count
+    try:
+        return MoveThreadCount[value.upper()]
+    except KeyError:
+        raise ValueError(f"moveThreadCount ({value}) must be NONE, AUTO or a number of threads.") from None
 
-solver_config = SolverConfig(
-    solution_class=VehicleRoutePlan,
-    entity_class_list=[Vehicle, Visit],
-    score_director_factory_config=ScoreDirectorFactoryConfig(
-        constraint_provider_function=define_constraints
-    ),
-    termination_config=TerminationConfig(
-        spent_limit=Duration(seconds=30)
+
+def create_solver_config(move_thread_count: int | MoveThreadCount = MoveThreadCount.NONE,
+                         nearby_selection: Optional[bool] = None,
+                         trip_moves: Optional[bool] = None,
+                         time_window_filter: bool = False) -> SolverConfig:
+    """
+    Nearby selection only applies to the default phases, so it cannot be combined with the trip moves
+    and their move filters. Trip moves are on unless nearby_selection is explicitly on, or trip_moves off;
+    nearby selection is on when timefold-enterprise is installed and the trip moves are off.
+    time_window_filter only applies to the trip moves.
+    """
+    if move_thread_count is not MoveThreadCount.NONE and not is_enterprise_installed():
+        # Multithreaded incremental solving is an enterprise feature;
+        # fall back to one move thread rather than failing every solve
+        logger.warning('Ignoring moveThreadCount (%s): multithreaded solving requires timefold-enterprise.',
+                       move_thread_count)
+        move_thread_count = MoveThreadCount.NONE
+    if nearby_selection and not is_enterprise_installed():
+        logger.warning('Ignoring nearby selection: it requires timefold-enterprise.')
+        nearby_selection = False
+    if trip_moves is None:
+        trip_moves = not nearby_selection
+    if nearby_selection is None:
+        nearby_selection = is_enterprise_installed() and not trip_moves
+        if is_enterprise_installed() and trip_moves:
+            logger.info('Nearby selection is off, as it does not apply to the trip moves; '
+                        'set SOLVER_TRIP_MOVES=false to use it.')
+    elif nearby_selection and trip_moves:
+        logger.warning('Ignoring nearby selection: it does not apply to the trip moves (SOLVER_TRIP_MOVES=true).')
+        nearby_selection = False
+    return SolverConfig(
+        xml_source_text=trip_moves_solver_config_xml(time_window_filter) if trip_moves else None,
+        solution_class=VehicleRoutePlan,
+        entity_class_list=[Vehicle, Visit],
+        move_thread_count=move_thread_count,
+        nearby_distance_meter_function=get_visit_nearby_distance_meter() if nearby_selection else None,
+        score_director_factory_config=ScoreDirectorFactoryConfig(
+            constraint_provider_function=define_constraints
+        ),
+        termination_config=TerminationConfig(
+            spent_limit=Duration(seconds=30)
+        )
     )
+
+
+# Spent limit = MIN_SPENT_LIMIT_SECONDS + (visits x vehicles) / PROBLEM_SIZE_PER_SECOND, up to MAX_SPENT_LIMIT_SECONDS;
+# 100 trips on 30 vehicles get about 30 seconds, 10 trips on 3 vehicles about 5
+MIN_SPENT_LIMIT_SECONDS = 5
+MAX_SPENT_LIMIT_SECONDS = 300
+PROBLEM_SIZE_PER_SECOND = 250
+# A feasible plan stops once the score has not improved for this share of the spent limit,
+# and any plan once it has not improved for the larger share
+FEASIBLE_UNIMPROVED_SPENT_LIMIT_RATIO = 0.2
+UNIMPROVED_SPENT_LIMIT_RATIO = 0.5
+MIN_UNIMPROVED_SPENT_LIMIT_SECONDS = 2
+# A re-plan starts from the previous solution, so it gets this share of the spent limit of a solve from scratch
+WARM_START_SPENT_LIMIT_RATIO = 0.2
+MIN_WARM_START_SPENT_LIMIT_SECONDS = 2
+
+
+def create_termination_config(route_plan: VehicleRoutePlan,
+                              spent_limit_seconds: Optional[float] = None,
+                              unimproved_spent_limit_seconds: Optional[float] = None,
+                              best_score_limit: Optional[str] = None,
+                              warm_start: bool = False) -> TerminationConfig:
+    """
+    Terminates when the first of these is reached:
+
+    - the spent limit, scaled to the plan size unless given, and shorter for a warm start;
+    - no improvement for half the spent limit;
+    - a feasible best score with no improvement for the unimproved spent limit,
+      scaled to the spent limit unless given;
+    - the best score limit, if given.
+    """
+    if best_score_limit is not None:
+        HardSoftScore.parse(best_score_limit)  # Raises ValueError early instead of in the solver thread
+    for name, value in (('spentLimit', spent_limit_seconds),
+                        ('unimprovedSpentLimit', unimproved_spent_limit_seconds)):
+        if value is not None and value <= 0:
+            raise ValueError(f"{name} ({value}) must be positive.")
+    if spent_limit_seconds is None:
+        problem_size = len(route_plan.visits) * len(route_plan.vehicles)
+        spent_limit_seconds = min(MAX_SPENT_LIMIT_SECONDS,
+                                  MIN_SPENT_LIMIT_SECONDS + problem_size / PROBLEM_SIZE_PER_SECOND)
+        if warm_start:
+            spent_limit_seconds = max(MIN_WARM_START_SPENT_LIMIT_SECONDS,
+                                      spent_limit_seconds * WARM_START_SPENT_LIMIT_RATIO)
+    if unimproved_spent_limit_seconds is None:
+        unimproved_spent_limit_seconds = max(MIN_UNIMPROVED_SPENT_LIMIT_SECONDS,
+                                             spent_limit_seconds * FEASIBLE_UNIMPROVED_SPENT_LIMIT_RATIO)
+
+    def duration(seconds: float) -> Duration:
+        return Duration(milliseconds=round(seconds * 1000))
+
+    return TerminationConfig(
+        termination_composition_style=TerminationCompositionStyle.OR,
+        termination_config_list=[
+            TerminationConfig(spent_limit=duration(spent_limit_seconds)),
+            TerminationConfig(unimproved_spent_limit=duration(
+                max(unimproved_spent_limit_seconds, spent_limit_seconds * UNIMPROVED_SPENT_LIMIT_RATIO))),
+            TerminationConfig(
+                termination_composition_style=TerminationCompositionStyle.AND,
+                termination_config_list=[
+                    TerminationConfig(best_score_feasible=True),
+                    TerminationConfig(unimproved_spent_limit=duration(unimproved_spent_limit_seconds)),
+                ]
+            ),
+            *([TerminationConfig(best_score_limit=best_score_limit)] if best_score_limit is not None else []),
+        ]
+    )
+
+
+def prepare_problem(route_plan: VehicleRoutePlan) -> VehicleRoutePlan:
+    """
+    Places the unassigned trips whole before solving, unless SOLVER_TRIP_CONSTRUCTION is false.
+    """
+    if TRIP_CONSTRUCTION:
+        place_trips(route_plan)
+    return route_plan
+
+
+def solve_and_listen(manager: SolverManager, job_id: str, route_plan: VehicleRoutePlan,
+                     listener: Callable[[VehicleRoutePlan], None],
+                     termination_config: Optional[TerminationConfig] = None,
+                     final_listener: Optional[Callable[[VehicleRoutePlan], None]] = None,
+                     exception_handler: Optional[Callable[[str, Exception], None]] = None) -> None:
+    prepare_problem(route_plan)
+    builder = manager.solve_builder() \
+        .with_problem_id(job_id) \
+        .with_problem(route_plan) \
+        .with_config_override(SolverConfigOverride(
+            termination_config=termination_config or create_termination_config(route_plan))) \
+        .with_best_solution_consumer(listener)
+    if final_listener is not None:
+        builder = builder.with_final_best_solution_consumer(final_listener)
+    if exception_handler is not None:
+        builder = builder.with_exception_handler(exception_handler)
+    builder.run()
+
+
+# SOLVER_MOVE_THREAD_COUNT: threads per solve (NONE, AUTO or a number);
+# SOLVER_PARALLEL_SOLVER_COUNT: solves running at the same time (AUTO or a number);
+# SOLVER_MAX_QUEUED_JOBS: jobs waiting for a free solver (100 by default);
+# SOLVER_NEARBY_SELECTION: true or false, on by default when timefold-enterprise is installed and trip moves are off;
+# SOLVER_TRIP_MOVES: true or false, on by default unless SOLVER_NEARBY_SELECTION is true;
+# SOLVER_TRIP_CONSTRUCTION: true (default) or false;
+# SOLVER_TIME_WINDOW_FILTER: true or false (default);
+# SOLVER_CONSTRAINT_PROFILING: true or false (default), enables PUT /route-plans/profile
+def _environment_flag(name: str) -> Optional[bool]:
+    return None if name not in os.environ else os.environ[name].lower() in ('true', '1', 'yes')
+
+
+DEFAULT_MOVE_THREAD_COUNT = parse_move_thread_count(os.environ.get('SOLVER_MOVE_THREAD_COUNT'))
+NEARBY_SELECTION = _environment_flag('SOLVER_NEARBY_SELECTION')
+TRIP_MOVES = _environment_flag('SOLVER_TRIP_MOVES')
+TRIP_CONSTRUCTION = _environment_flag('SOLVER_TRIP_CONSTRUCTION') is not False
+TIME_WINDOW_FILTER = _environment_flag('SOLVER_TIME_WINDOW_FILTER') is True
+CONSTRAINT_PROFILING = _environment_flag('SOLVER_CONSTRAINT_PROFILING') is True
+PARALLEL_SOLVER_COUNT = os.environ.get('SOLVER_PARALLEL_SOLVER_COUNT', 'AUTO')
+solver_manager_config = SolverManagerConfig(
+    parallel_solver_count=int(PARALLEL_SOLVER_COUNT) if PARALLEL_SOLVER_COUNT.isdigit() else 'AUTO'
 )
+# How many solves a SolverManager runs at the same time; AUTO is half the processors, as Timefold resolves it
+MAX_RUNNING_SOLVERS = int(PARALLEL_SOLVER_COUNT) if PARALLEL_SOLVER_COUNT.isdigit() \
+    else max(1, (os.cpu_count() or 1) // 2)
+# Jobs waiting for a free solver; further submissions are refused until the queue drains
+MAX_QUEUED_JOBS = int(os.environ.get('SOLVER_MAX_QUEUED_JOBS', 100))
 
-solver_manager = SolverManager.create(solver_config)
+solver_config = create_solver_config(DEFAULT_MOVE_THREAD_COUNT, NEARBY_SELECTION, TRIP_MOVES, TIME_WINDOW_FILTER)
+solver_manager = SolverManager.create(solver_config, solver_manager_config)
 solution_manager = SolutionManager.create(solver_manager)
 
+# Move thread count is part of the solver config, so every other count gets its own SolverManager
+_solver_managers: dict[int | MoveThreadCount, SolverManager] = {DEFAULT_MOVE_THREAD_COUNT: solver_manager}
+
+
+def get_solver_manager(move_thread_count: Optional[int | MoveThreadCount] = None) -> SolverManager:
+    if move_thread_count is None or not is_enterprise_installed():
+        return solver_manager
+    if move_thread_count not in _solver_managers:
+        _solver_managers[move_thread_count] = SolverManager.create(
+            create_solver_config(move_thread_count, NEARBY_SELECTION, TRIP_MOVES, TIME_WINDOW_FILTER),
+            solver_manager_config)
+    return _solver_managers[move_thread_count]
+
 # import logging
 
 # logging.basicConfig(level=logging.DEBUG)
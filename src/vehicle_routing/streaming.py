@@ -0,0 +1,163 @@
+"""
+Pushes best solutions to the clients watching a job, as Server-Sent Events.
+
+The solver calls publish on its own thread for every new best solution.
+Only solutions that improve the score are published, at most one per min_interval_seconds (the latest wins),
+and each published solution is serialized once into an SSE frame that every subscriber is sent as is.
+"""
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Optional
+
+from timefold.solver import SolverStatus
+
+from .domain import VehicleRoutePlan
+from .serialization import dump_route_plan
+
+BEST_SOLUTION_EVENT = 'bestSolution'
+
+
+def score_key(plan: VehicleRoutePlan) -> Optional[tuple[int, int, int]]:
+    score = plan.score
+    if score is None:
+        return None
+    return score.init_score, score.hard_score, score.soft_score
+
+
+def to_event(plan: VehicleRoutePlan, version: int) -> bytes:
+    # orjson never emits a line break, so the whole plan fits on one data line
+    return f'id: {version}\nevent: {BEST_SOLUTION_EVENT}\ndata: '.encode() + dump_route_plan(plan) + b'\n\n'
+
+
+@dataclass
+class _Channel:
+    version: int = 0
+    event: Optional[bytes] = None
+    final: bool = False
+    published_score: Optional[tuple[int, int, int]] = None
+    published_at: float = float('-inf')
+    pending: Optional[VehicleRoutePlan] = None
+    waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = field(default_factory=list)
+    # Held by publishers while serializing, so a large plan only holds up its own job
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    # Held briefly to swap in a new version, so subscribers on the event loop never wait for a serialization
+    state_lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class SolutionBroadcaster:
+    """
+    The stream of a job is kept for retain_final_seconds after its final solution,
+    so clients that connect late still get it; after that, clients read the job store.
+    """
+
+    def __init__(self, min_interval_seconds: float = 0.5, retain_final_seconds: float = 60):
+        self.min_interval_seconds = min_interval_seconds
+        self.retain_final_seconds = retain_final_seconds
+        self._channels: dict[str, _Channel] = {}
+        self._lock = threading.Lock()
+
+    def start(self, job_id: str) -> None:
+        with self._lock:
+            self._channels[job_id] = _Channel()
+
+    def publish(self, job_id: str, plan: VehicleRoutePlan) -> None:
+        """
+        Offers a new best solution; thread-safe.
+        A plan whose solver_status is NOT_SOLVING is final: it is always sent, and ends the stream.
+        """
+        final = plan.solver_status == SolverStatus.NOT_SOLVING
+        with self._lock:
+            channel = self._channels.setdefault(job_id, _Channel())
+        with channel.lock:
+            if channel.final:
+                return
+            if not final:
+                score = score_key(plan)
+                if score is not None and channel.published_score is not None and score <= channel.published_score:
+                    return
+                delay = channel.published_at + self.min_interval_seconds - time.monotonic()
+                if delay > 0:
+                    if channel.pending is None:
+                        timer = threading.Timer(delay, self._publish_pending, (job_id,))
+                        timer.daemon = True
+                        timer.start()
+                    channel.pending = plan
+                    return
+            channel.pending = None
+            self._send(job_id, channel, plan, final)
+
+    def _publish_pending(self, job_id: str) -> None:
+        with self._lock:
+            channel = self._channels.get(job_id)
+        if channel is None:
+            return
+        with channel.lock:
+            if channel.pending is None or channel.final:
+                return
+            plan, channel.pending = channel.pending, None
+            self._send(job_id, channel, plan, False)
+
+    def _send(self, job_id: str, channel: _Channel, plan: VehicleRoutePlan, final: bool) -> None:
+        # Called with the channel lock held, so versions go out in order
+        event = to_event(plan, channel.version + 1)
+        channel.published_score = score_key(plan)
+        channel.published_at = time.monotonic()
+        with channel.state_lock:
+            channel.version += 1
+            channel.event = event
+            channel.final = final
+            waiters, channel.waiters = channel.waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+        if final:
+            timer = threading.Timer(self.retain_final_seconds, self.close, (job_id,))
+            timer.daemon = True
+            timer.start()
+
+    def close(self, job_id: str) -> None:
+        """
+        Forgets the job, once its clients had the time to receive the final solution.
+        """
+        with self._lock:
+            channel = self._channels.pop(job_id, None)
+        if channel is not None:
+            with channel.state_lock:
+                waiters, channel.waiters = channel.waiters, []
+            for loop, future in waiters:
+                loop.call_soon_threadsafe(_resolve, future)
+
+    def is_streaming(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._channels
+
+    async def subscribe(self, job_id: str, last_version: int = 0) -> AsyncIterator[bytes]:
+        """
+        Yields the SSE frame of every version after last_version, until the final solution.
+        A slow client skips the versions it missed and gets the latest one.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                channel = self._channels.get(job_id)
+            if channel is None:
+                return
+            with channel.state_lock:
+                if channel.version > last_version:
+                    last_version, event, final = channel.version, channel.event, channel.final
+                    future = None
+                else:
+                    future = loop.create_future()
+                    channel.waiters.append((loop, future))
+            if future is not None:
+                await future
+                continue
+            yield event
+            if final:
+                return
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
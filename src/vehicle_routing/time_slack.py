@@ -0,0 +1,42 @@
+"""
+Checks that prune insertions breaking the time windows of the visits after them.
+
+Inserting visits in front of a visit delays it, and every visit after it, until waiting for a min start time
+absorbs the delay. insertion_fits_time_windows computes the delay from the visits just before the insertion,
+then walks the integer arrivals the solver already keeps, only until the delay is absorbed,
+so move_filters can prune a move that would make an on-time visit late before the solver applies and scores it.
+
+The walk stands in for Savelsbergh's forward time slack, which would make the check O(1)
+but has to be kept up to date on every move: the solver does not accept the cascading arrival time
+as the source of a shadow variable, and a Python variable listener costs most of the solver's moves per second.
+Moves within one route are never pruned, since the visit they take out may absorb the delay.
+"""
+from .domain import Vehicle, Visit
+
+
+def insertion_fits_time_windows(vehicle: Vehicle, index: int, visits: list[Visit]) -> bool:
+    """
+    Returns False if putting the visits, in order, at index in the vehicle's route
+    makes a visit after them that arrives on time arrive after its max end time.
+    """
+    route = vehicle.visits
+    if index == len(route) or route[index].arrival_seconds is None:
+        return True
+    if index == 0:
+        departure_seconds = vehicle.departure_seconds
+        location = vehicle.home_location
+    else:
+        departure_seconds = route[index - 1].calculate_departure_seconds()
+        location = route[index - 1].location
+    for visit in visits:
+        arrival_seconds = departure_seconds + location.driving_time_to(visit.location)
+        departure_seconds = max(arrival_seconds, visit.min_start_seconds) + visit.service_seconds
+        location = visit.location
+    delay = departure_seconds + location.driving_time_to(route[index].location) - route[index].arrival_seconds
+    while delay > 0 and index < len(route):
+        visit = route[index]
+        if visit.arrival_seconds <= visit.max_end_seconds < visit.arrival_seconds + delay:
+            return False
+        delay -= max(0, visit.min_start_seconds - visit.arrival_seconds)
+        index += 1
+    return True
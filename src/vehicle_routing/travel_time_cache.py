@@ -0,0 +1,143 @@
+import hashlib
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+from .travel_time import TravelTimeProvider, coordinates_of, group_rows_by_missing_columns
+
+MATRIX_SUFFIX = '.matrix.npy'
+COORDINATES_SUFFIX = '.coordinates.npy'
+
+
+class _CacheEntry:
+    """
+    One cached matrix: its coordinates (loaded in memory, small)
+    and its durations (memory-mapped, so every process reads the same page cache).
+    """
+
+    def __init__(self, key: str, directory: Path):
+        self.key = key
+        self.matrix_path = directory / f'{key}{MATRIX_SUFFIX}'
+        coordinates = np.load(directory / f'{key}{COORDINATES_SUFFIX}')
+        self.row_by_coordinates = {(latitude, longitude): row
+                                   for row, (latitude, longitude) in enumerate(coordinates.tolist())}
+        self.durations = np.load(self.matrix_path, mmap_mode='r')
+
+
+class CachedTravelTimeProvider(TravelTimeProvider):
+    """
+    Wraps another provider with a persistent, memory-mapped cache of travel time matrices.
+
+    Each solved location set is stored as its own matrix file, named after its rounded coordinates.
+    A new location set reuses every pair that any cached matrix already knows
+    and only asks the wrapped provider for the missing pairs.
+    Matrices with pairs the wrapped provider only estimated, and matrices larger than max_bytes, are not stored.
+    The least recently used matrices are evicted once the files exceed max_bytes.
+    The cache directory can be shared by several worker processes.
+    """
+
+    def __init__(self, provider: TravelTimeProvider, directory: str | Path, max_bytes: int = 1 << 30):
+        self.provider = provider
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._entries: dict[str, _CacheEntry] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_of(coordinates: Sequence[tuple[float, float]]) -> str:
+        digest = hashlib.sha1()
+        for latitude, longitude in sorted(coordinates):
+            digest.update(f'{latitude},{longitude};'.encode())
+        return digest.hexdigest()
+
+    def _refresh_entries(self) -> list[_CacheEntry]:
+        """
+        Syncs the in-process view with the directory, which other processes may have changed,
+        and returns the entries from most to least recently used.
+        """
+        modified_times = {}
+        for path in self.directory.glob(f'*{MATRIX_SUFFIX}'):
+            try:
+                modified_times[path.name.removesuffix(MATRIX_SUFFIX)] = path.stat().st_mtime
+            except FileNotFoundError:
+                continue  # Evicted by another process
+        for key in self._entries.keys() - modified_times.keys():
+            del self._entries[key]
+        for key in modified_times.keys() - self._entries.keys():
+            try:
+                self._entries[key] = _CacheEntry(key, self.directory)
+            except (FileNotFoundError, ValueError, OSError):
+                modified_times.pop(key)  # Evicted or still being written by another process
+        return sorted((self._entries[key] for key in modified_times),
+                      key=lambda entry: modified_times[entry.key], reverse=True)
+
+    def _save(self, key: str, coordinates: Sequence[tuple[float, float]], matrix: np.ndarray) -> None:
+        # Write to temporary files and rename, so other processes never map a partial matrix;
+        # the coordinates go first because an entry is discovered through its matrix file
+        for suffix, array in ((COORDINATES_SUFFIX, np.array(coordinates, dtype=np.float64)),
+                              (MATRIX_SUFFIX, matrix)):
+            file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(file_descriptor, 'wb') as file:
+                np.save(file, array)
+            os.replace(temporary_path, self.directory / f'{key}{suffix}')
+
+    def _evict(self, entries: list[_CacheEntry]) -> None:
+        total_bytes = 0
+        for entry in entries:
+            try:
+                total_bytes += entry.matrix_path.stat().st_size
+            except FileNotFoundError:
+                continue
+            if total_bytes > self.max_bytes:
+                self._entries.pop(entry.key, None)
+                for suffix in (MATRIX_SUFFIX, COORDINATES_SUFFIX):
+                    (self.directory / f'{entry.key}{suffix}').unlink(missing_ok=True)
+
+    def travel_times_between(self, origins: Sequence['Location'],
+                             destinations: Sequence['Location']) -> np.ndarray:
+        return self.provider.travel_times_between(origins, destinations)
+
+    def travel_time_matrix(self, locations: Sequence['Location']) -> np.ndarray:
+        coordinates = [coordinates_of(location) for location in locations]
+        key = self.key_of(coordinates)
+        with self._lock:
+            entries = self._refresh_entries()
+            matrix = np.full((len(locations), len(locations)), -1, dtype=np.int32)
+            for entry in entries:
+                rows = np.fromiter((entry.row_by_coordinates.get(location, -1) for location in coordinates),
+                                   dtype=np.intp, count=len(coordinates))
+                known = np.flatnonzero(rows >= 0)
+                if len(known) == 0:
+                    continue
+                try:
+                    os.utime(entry.matrix_path)
+                except FileNotFoundError:
+                    pass  # Evicted by another process; the mapping stays readable
+                block = np.ix_(known, known)
+                matrix[block] = np.where(matrix[block] < 0,
+                                         entry.durations[np.ix_(rows[known], rows[known])],
+                                         matrix[block])
+                if not (matrix < 0).any():
+                    break
+
+            for rows, columns in group_rows_by_missing_columns(matrix < 0):
+                matrix[np.ix_(rows, columns)] = self.provider.known_travel_times_between(
+                    [locations[row] for row in rows], [locations[column] for column in columns])
+            estimated = matrix < 0
+            for rows, columns in group_rows_by_missing_columns(estimated):
+                matrix[np.ix_(rows, columns)] = self.provider.travel_times_between(
+                    [locations[row] for row in rows], [locations[column] for column in columns])
+
+            # A cached estimate would outlive the provider learning the real travel time,
+            # and a matrix over max_bytes would be evicted as soon as it is written
+            if key not in self._entries and not estimated.any() and matrix.nbytes <= self.max_bytes:
+                self._save(key, coordinates, matrix)
+                entries.insert(0, _CacheEntry(key, self.directory))
+                self._entries[key] = entries[0]
+            self._evict(entries)
+        return matrix
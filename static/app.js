@@ -1,4 +1,5 @@
 let autoRefreshIntervalId = null;
+let solutionEventSource = null;
 let initialized = false;
 let optimizing = false;
 let demoDataId = null;
@@ -375,13 +376,21 @@ function refreshSolvingButtons(solving) {
         $("#solveButton").hide();
         $("#visitButton").hide();
         $("#stopSolvingButton").show();
-        if (autoRefreshIntervalId == null) {
-            autoRefreshIntervalId = setInterval(refreshRoutePlan, 2000);
+        if (solutionEventSource == null && autoRefreshIntervalId == null) {
+            if (window.EventSource) {
+                listenToBestSolutions();
+            } else {
+                autoRefreshIntervalId = setInterval(refreshRoutePlan, 2000);
+            }
         }
     } else {
         $("#solveButton").show();
         $("#visitButton").show();
         $("#stopSolvingButton").hide();
+        if (solutionEventSource != null) {
+            solutionEventSource.close();
+            solutionEventSource = null;
+        }
         if (autoRefreshIntervalId != null) {
             clearInterval(autoRefreshIntervalId);
             autoRefreshIntervalId = null;
@@ -389,6 +398,32 @@ function refreshSolvingButtons(solving) {
     }
 }
 
+function listenToBestSolutions() {
+    // The server pushes the plan whenever its score improves, and ends the stream with the final solution
+    solutionEventSource = new EventSource("/route-plans/" + scheduleId + "/events");
+    solutionEventSource.addEventListener("bestSolution", function (event) {
+        const routePlan = JSON.parse(event.data);
+        loadedRoutePlan = routePlan;
+        renderRoutes(routePlan);
+        renderTimelines(routePlan);
+        initialized = true;
+        if (routePlan.solverStatus === "NOT_SOLVING") {
+            refreshSolvingButtons(false);
+        }
+    });
+    solutionEventSource.onerror = function () {
+        if (solutionEventSource == null) {
+            return;
+        }
+        // Fall back to polling, for example behind a proxy that buffers the stream
+        solutionEventSource.close();
+        solutionEventSource = null;
+        if (optimizing && autoRefreshIntervalId == null) {
+            autoRefreshIntervalId = setInterval(refreshRoutePlan, 2000);
+        }
+    };
+}
+
 function refreshRoutePlan() {
     let path = "/route-plans/" + scheduleId;
     if (scheduleId === null) {
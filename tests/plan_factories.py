@@ -0,0 +1,56 @@
+"""
+Small plans shared by the test modules: WC and CC vehicles at the origin and trips a short drive away.
+"""
+from vehicle_routing.domain import *
+from vehicle_routing.construction import place_trips
+
+from datetime import datetime
+
+DAY = datetime(2025, 2, 26)
+
+
+def create_vehicle(vehicle_id: str, vehicle_type: str) -> Vehicle:
+    return Vehicle(id=vehicle_id, capacity=3, home_location=Location(latitude=0, longitude=0),
+                   departure_time=DAY.replace(hour=7), vehicle_type=vehicle_type,
+                   make_model="Van", driver_id=f"driver{vehicle_id}")
+
+
+def create_trip(trip_id: str, vehicle_type: str, pickup_hour: int) -> list[Visit]:
+    pickup = Visit(id=f"pickup_{trip_id}", name=f"Pickup {trip_id}", trip_id=trip_id, demand=1,
+                   location=Location(latitude=0.1, longitude=0.1),
+                   min_start_time=DAY.replace(hour=pickup_hour),
+                   max_end_time=DAY.replace(hour=pickup_hour, minute=30),
+                   service_duration=timedelta(minutes=5), vehicle_type=vehicle_type,
+                   paired_visit_id=f"dropoff_{trip_id}", is_pickup=True)
+    dropoff = Visit(id=f"dropoff_{trip_id}", name=f"Dropoff {trip_id}", trip_id=trip_id, demand=-1,
+                    location=Location(latitude=0.2, longitude=0.2),
+                    min_start_time=DAY.replace(hour=pickup_hour),
+                    max_end_time=DAY.replace(hour=pickup_hour + 1),
+                    service_duration=timedelta(minutes=5), vehicle_type=vehicle_type,
+                    paired_visit_id=f"pickup_{trip_id}", is_dropoff=True)
+    return [pickup, dropoff]
+
+
+def create_plan(name: str = "test") -> VehicleRoutePlan:
+    """
+    One WC vehicle with two trips already placed on it.
+    """
+    plan = VehicleRoutePlan(name=name,
+                            south_west_corner=Location(latitude=0, longitude=0),
+                            north_east_corner=Location(latitude=1, longitude=1),
+                            vehicles=[create_vehicle("wc", "WC")],
+                            visits=create_trip("1", "WC", 8) + create_trip("2", "WC", 9))
+    place_trips(plan)
+    return plan
+
+
+def create_sized_plan(trip_count: int, vehicle_count: int) -> VehicleRoutePlan:
+    """
+    WC trips left unassigned and WC vehicles, for code that only looks at the size of a plan.
+    """
+    return VehicleRoutePlan(name="sized",
+                            south_west_corner=Location(latitude=0, longitude=0),
+                            north_east_corner=Location(latitude=1, longitude=1),
+                            vehicles=[create_vehicle(str(i), "WC") for i in range(vehicle_count)],
+                            visits=[visit for i in range(trip_count)
+                                    for visit in create_trip(str(i), "WC", 8 + i % 10)])
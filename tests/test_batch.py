@@ -0,0 +1,91 @@
+from vehicle_routing.batch import BatchScheduler, QueueFullError
+from timefold.solver import SolverStatus
+from timefold.solver.score import HardSoftScore
+
+import asyncio
+import time
+
+
+def test_free_solvers_go_to_the_highest_priority_batch_within_its_concurrency():
+    started = []
+    scheduler = BatchScheduler(started.append, max_running=2)
+    background = scheduler.submit(["b1", "b2", "b3"], priority=0)
+    assert started == ["b1", "b2"]
+
+    urgent = scheduler.submit(["u1", "u2", "u3"], priority=5, concurrency=1)
+    scheduler.job_finished("b1", HardSoftScore.of(0, -10))
+    assert started == ["b1", "b2", "u1"]
+    # The urgent batch is at its concurrency limit, so the background batch gets the next solver
+    scheduler.job_finished("b2")
+    assert started == ["b1", "b2", "u1", "b3"]
+    scheduler.job_finished("u1")
+    assert started == ["b1", "b2", "u1", "b3", "u2"]
+
+    progress = scheduler.progress(background)
+    assert (progress.scheduled, progress.solving, progress.finished) == (0, 1, 2)
+    assert progress.jobs[0].score == HardSoftScore.of(0, -10)
+
+    dropped, solving = scheduler.cancel(urgent)
+    assert (dropped, solving) == (["u3"], ["u2"])
+    assert scheduler.progress(urgent).finished == 2
+    assert scheduler.cancel("unknown") is None
+
+
+def test_finished_jobs_are_yielded_as_they_finish():
+    async def run():
+        scheduler = BatchScheduler(lambda job_id: None, max_running=2)
+        batch_id = scheduler.submit(["a", "b", "c"])
+        scheduler.job_finished("b")
+        finished = []
+
+        async def listen():
+            async for job_id in scheduler.finished_jobs(batch_id):
+                finished.append(job_id)
+
+        listener = asyncio.create_task(listen())
+        await asyncio.sleep(0.01)
+        assert finished == ["b"]
+        scheduler.job_finished("a")
+        scheduler.job_finished("c")
+        await asyncio.wait_for(listener, 1)
+        assert finished == ["b", "a", "c"]
+        assert scheduler.progress(batch_id).jobs[1].solver_status == SolverStatus.NOT_SOLVING
+
+    asyncio.run(run())
+
+
+def test_a_full_queue_refuses_jobs_until_it_drains():
+    started = []
+    scheduler = BatchScheduler(started.append, max_running=1, max_queued=3)
+    scheduler.submit(["a", "b", "c"])
+    assert started == ["a"]
+    assert scheduler.job_progress("c").queue_position == 1
+    urgent = scheduler.submit(["u"], priority=1)
+    assert scheduler.job_progress("u").queue_position == 0
+    assert scheduler.job_progress("b").queue_position == 1
+    try:
+        scheduler.submit(["d"])
+        assert False, "The queue is full"
+    except QueueFullError as e:
+        assert e.retry_after_seconds > 0
+    assert scheduler.job_progress("d") is None
+
+    assert scheduler.drop("b")
+    assert not scheduler.drop("a")  # Already solving
+    scheduler.job_finished("a")
+    assert started == ["a", "u"]
+    assert scheduler.job_progress("c").estimated_start_seconds is not None
+    scheduler.submit(["d"])
+    assert scheduler.progress(urgent).solving == 1
+
+
+def test_finished_batches_are_forgotten_once_retained_long_enough():
+    scheduler = BatchScheduler(lambda job_id: None, max_running=2, retain_finished_seconds=0.05)
+    finished = scheduler.submit(["a"])
+    running = scheduler.submit(["b"])
+    scheduler.job_finished("a", error="RuntimeError: no solution")
+    assert finished in scheduler and scheduler.job_progress("a").error == "RuntimeError: no solution"
+
+    time.sleep(0.1)
+    assert finished not in scheduler and scheduler.job_progress("a") is None
+    assert running in scheduler
@@ -0,0 +1,19 @@
+from vehicle_routing.constraint_profiling import profile_solve, score_calculation_count
+
+from plan_factories import create_plan
+
+
+def test_profile_solve_reports_every_constraint():
+    report = profile_solve(create_plan(), 1)
+    assert {profile.name for profile in report.constraints} == {
+        'vehicleCapacity', 'pickupAndDropoffSameVehicle', 'pickupBeforeDropoff', 'vehicleTypeConstraint',
+        'enforceValidArrivalTime', 'pickupImmediatelyBeforeDropoff', 'useMoreVehicles', 'minimizeTravelTime'}
+    assert report.score is not None and report.score_calculation_count > 0
+    assert all(profile.tuples_evaluated > 0 for profile in report.constraints)
+    assert abs(sum(profile.share for profile in report.constraints) - 1) < 1e-9
+    capacity = next(profile for profile in report.constraints if profile.name == 'vehicleCapacity')
+    assert [profile.operation for profile in capacity.lambdas] == ['filter', 'group_by', 'filter', 'penalize']
+
+
+def test_score_calculation_count_is_none_without_the_java_solver():
+    assert score_calculation_count(object()) is None
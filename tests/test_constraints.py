@@ -3,6 +3,8 @@ from timefold.solver.test import ConstraintVerifier
 from vehicle_routing.domain import *
 from vehicle_routing.constraints import *
 
+from plan_factories import create_vehicle, create_trip
+
 from datetime import datetime
 
 # LOCATION_1 to LOCATION_2 is sqrt(3**2 + 4**2) * 4000 == 20_000 seconds of driving time
@@ -106,6 +108,52 @@ def test_total_driving_time():
     )
 
 
+def test_pickup_and_dropoff_same_vehicle_penalized_once_per_trip():
+    vehicleA = create_vehicle("1", "WC")
+    vehicleB = create_vehicle("2", "WC")
+    pickup, dropoff = create_trip("1", "WC", 8)
+    link_paired_visits([pickup, dropoff])
+    assert pickup.is_paired_with(dropoff) and dropoff.is_paired_with(pickup)
+
+    connect(vehicleA, pickup)
+    connect(vehicleB, dropoff)
+
+    (constraint_verifier.verify_that(pickup_and_dropoff_same_vehicle)
+        .given(vehicleA, vehicleB, pickup, dropoff)
+        .penalizes_by(100_000))
+
+
+def test_pickup_before_dropoff():
+    vehicleA = create_vehicle("1", "WC")
+    pickup1, dropoff1 = create_trip("1", "WC", 8)
+    pickup2, dropoff2 = create_trip("2", "WC", 9)
+    link_paired_visits([pickup1, dropoff1, pickup2, dropoff2])
+
+    connect(vehicleA, pickup1, dropoff1, dropoff2, pickup2)
+
+    (constraint_verifier.verify_that(pickup_before_dropoff)
+        .given(vehicleA, pickup1, dropoff1, pickup2, dropoff2)
+        .penalizes_by(100_000))
+
+
+def test_pickup_before_dropoff_arriving_in_the_same_second():
+    for order, penalty in ((0, 100_000), (1, 0)):
+        vehicleA = create_vehicle("1", "WC")
+        pickup, dropoff = create_trip("1", "WC", 8)
+        link_paired_visits([pickup, dropoff])
+        # Nothing separates the two visits, so both arrive when the vehicle gets to LOCATION_2
+        for visit in (pickup, dropoff):
+            visit.location = LOCATION_2
+            visit.min_start_seconds = visit.service_seconds = 0
+
+        connect(vehicleA, *((dropoff, pickup) if order == 0 else (pickup, dropoff)))
+        assert pickup.arrival_seconds == dropoff.arrival_seconds
+
+        (constraint_verifier.verify_that(pickup_before_dropoff)
+            .given(vehicleA, pickup, dropoff)
+            .penalizes_by(penalty))
+
+
 def connect(vehicle: Vehicle, *visits: Visit):
     vehicle.visits = list(visits)
     for i in range(len(visits)):
@@ -117,3 +165,46 @@ def connect(vehicle: Vehicle, *visits: Visit):
         if i < len(visits) - 1:
             visit.next_visit = visits[i + 1]
         visit.update_arrival_time()
+        visit.update_onboard_load()
+
+
+def test_vehicle_type_mismatch_penalized():
+    wc_vehicle = create_vehicle("1", "WC")
+    sts_vehicle = create_vehicle("2", "STS")
+    pickup1, dropoff1 = create_trip("1", "WC", 8)
+    pickup2, dropoff2 = create_trip("2", "WC", 9)
+    pickup2.vehicle_type = dropoff2.vehicle_type = "AMB"
+    link_vehicle_types([wc_vehicle, sts_vehicle], [pickup1, dropoff1, pickup2, dropoff2])
+    assert pickup1.can_be_served_by(wc_vehicle) and not pickup1.can_be_served_by(sts_vehicle)
+    # No vehicle is of type AMB, so any vehicle may serve trip 2, and is penalized for it
+    assert pickup2.can_be_served_by(wc_vehicle) and pickup2.can_be_served_by(sts_vehicle)
+
+    connect(wc_vehicle, pickup1, dropoff1)
+    connect(sts_vehicle, pickup2, dropoff2)
+    (constraint_verifier.verify_that(match_vehicle_type)
+        .given(wc_vehicle, sts_vehicle, pickup1, dropoff1, pickup2, dropoff2)
+        .penalizes_by(2))
+
+    connect(sts_vehicle, pickup1, dropoff1)
+    (constraint_verifier.verify_that(match_vehicle_type)
+        .given(wc_vehicle, sts_vehicle, pickup1, dropoff1)
+        .penalizes_by(2))
+
+
+def test_vehicle_capacity_penalizes_peak_load_on_board():
+    vehicleA = create_vehicle("1", "WC")
+    vehicleA.capacity = 1
+    pickup1, dropoff1 = create_trip("1", "WC", 8)
+    pickup2, dropoff2 = create_trip("2", "WC", 9)
+
+    connect(vehicleA, pickup1, dropoff1, pickup2, dropoff2)
+    assert [visit.onboard_load for visit in vehicleA.visits] == [1, 0, 1, 0]
+    (constraint_verifier.verify_that(vehicle_capacity)
+        .given(vehicleA, pickup1, dropoff1, pickup2, dropoff2)
+        .penalizes_by(0))
+
+    connect(vehicleA, pickup1, pickup2, dropoff1, dropoff2)
+    assert vehicleA.calculate_peak_load() == 2 and vehicleA.calculate_total_demand() == 0
+    (constraint_verifier.verify_that(vehicle_capacity)
+        .given(vehicleA, pickup1, dropoff1, pickup2, dropoff2)
+        .penalizes_by(1))
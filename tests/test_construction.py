@@ -0,0 +1,47 @@
+from vehicle_routing.domain import *
+from vehicle_routing.construction import place_trips
+
+from plan_factories import create_vehicle, create_trip
+
+
+def test_trips_are_placed_whole_on_compatible_vehicles():
+    vehicles = [create_vehicle("wc", "WC"), create_vehicle("cc", "CC")]
+    visits = create_trip("1", "WC", 9) + create_trip("2", "CC", 8) + create_trip("3", "WC", 8)
+    plan = VehicleRoutePlan(name="test",
+                            south_west_corner=Location(latitude=0, longitude=0),
+                            north_east_corner=Location(latitude=1, longitude=1),
+                            vehicles=vehicles, visits=visits)
+
+    assert place_trips(plan) == 3
+    assert [visit.id for visit in vehicles[0].visits] == ["pickup_3", "dropoff_3", "pickup_1", "dropoff_1"]
+    assert [visit.id for visit in vehicles[1].visits] == ["pickup_2", "dropoff_2"]
+    for vehicle in vehicles:
+        for index, visit in enumerate(vehicle.visits):
+            assert visit.vehicle is vehicle
+            assert visit.index_in_vehicle_route == index
+            assert visit.arrival_time is not None
+    assert vehicles[0].visits[0].next_visit is vehicles[0].visits[1]
+
+    # Already placed trips are left alone
+    assert place_trips(plan) == 0
+
+
+def test_trips_are_not_placed_on_offline_vehicles():
+    vehicles = [create_vehicle("wc1", "WC"), create_vehicle("wc2", "WC"), create_vehicle("cc", "CC")]
+    vehicles[0].offline = True
+    visits = create_trip("1", "WC", 8) + create_trip("2", "CC", 8)
+    plan = VehicleRoutePlan(name="test",
+                            south_west_corner=Location(latitude=0, longitude=0),
+                            north_east_corner=Location(latitude=1, longitude=1),
+                            vehicles=vehicles, visits=visits)
+
+    assert place_trips(plan) == 2
+    assert vehicles[0].visits == []
+    assert [visit.id for visit in vehicles[1].visits] == ["pickup_1", "dropoff_1"]
+
+    # With every vehicle offline, trips are left unassigned
+    for vehicle in vehicles:
+        vehicle.offline = True
+    plan.visits += create_trip("3", "WC", 9)
+    assert place_trips(plan) == 0
+    assert plan.visits[-1].vehicle is None
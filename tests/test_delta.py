@@ -0,0 +1,68 @@
+from vehicle_routing.domain import *
+from vehicle_routing.construction import update_route_shadow_variables
+from vehicle_routing.delta import SolutionHistory, delta_to_dict
+from vehicle_routing.serialization import route_plan_to_dict
+
+from plan_factories import create_vehicle, create_plan
+
+
+def test_delta_only_holds_changed_routes_and_visits():
+    history = SolutionHistory()
+    first = create_plan()
+    first.vehicles.append(create_vehicle("cc", "CC"))
+    history.record("job", first)
+
+    full = history.delta("job", None, lambda: None)
+    assert full.version == 1 and full.base_version is None and full.plan is first
+    unchanged = history.delta("job", 1, lambda: None)
+    assert unchanged.plan is None and unchanged.vehicles == [] and unchanged.visits == []
+
+    # The second trip moves to the other vehicle
+    second = create_plan()
+    second.vehicles.append(create_vehicle("cc", "CC"))
+    second.vehicles[1].visits = second.vehicles[0].visits[2:]
+    del second.vehicles[0].visits[2:]
+    for vehicle in second.vehicles:
+        update_route_shadow_variables(vehicle)
+    history.record("job", second)
+
+    delta = history.delta("job", 1, lambda: None)
+    assert delta.version == 2 and delta.base_version == 1 and delta.plan is None
+    assert [vehicle.id for vehicle in delta.vehicles] == ["wc", "cc"]
+    assert [visit.id for visit in delta.visits] == ["pickup_2", "dropoff_2"]
+    # Serialized as they are in the whole plan
+    data = delta_to_dict(delta)
+    full_data = route_plan_to_dict(second)
+    assert data['vehicles'] == full_data['vehicles']
+    assert data['visits'] == full_data['visits'][2:]
+    assert data['totalDrivingTimeSeconds'] == full_data['totalDrivingTimeSeconds']
+    assert delta_to_dict(full)['plan'] == route_plan_to_dict(first)
+
+    # Unknown versions get the whole plan
+    assert history.delta("job", 7, lambda: None).plan is second
+
+
+def test_jobs_not_solved_here_get_the_stored_plan():
+    history = SolutionHistory()
+    stored = create_plan()
+    assert history.delta("unknown", None, lambda: None) is None
+    delta = history.delta("elsewhere", 3, lambda: stored)
+    assert delta.plan is stored and delta.version == 0
+
+
+def test_versions_of_forgotten_jobs_are_dropped():
+    history = SolutionHistory(max_finished_jobs=1)
+    stored = create_plan()
+    history.record("first", stored, final=True)
+    history.delta("first", None, lambda: stored)
+    history.record("second", create_plan())
+    assert history.latest("first", lambda: stored) == (1, stored)
+
+    # More recently finished jobs push out the others
+    history.record("second", create_plan(), final=True)
+    assert history.latest("first", lambda: stored) == (None, stored)
+    assert all(job_id == "second" for job_id, _ in history._snapshots)
+
+    # The job store forgot the job
+    assert history.delta("second", 2, lambda: None) is None
+    assert history.latest("second", lambda: create_plan())[0] is None
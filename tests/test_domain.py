@@ -0,0 +1,53 @@
+from vehicle_routing.domain import *
+from vehicle_routing.serialization import route_plan_to_dict
+
+from plan_factories import DAY, create_plan
+
+from datetime import datetime, timedelta, timezone
+
+
+def test_epoch_seconds_of_naive_times_are_utc():
+    assert to_epoch_seconds(datetime(1970, 1, 1, 1)) == 3600
+    assert to_epoch_seconds(DAY) == to_epoch_seconds(DAY.replace(tzinfo=timezone.utc))
+    # Sub-second parts are dropped
+    assert to_epoch_seconds(DAY.replace(microsecond=999_999)) == to_epoch_seconds(DAY)
+
+    time = from_epoch_seconds(to_epoch_seconds(DAY), DAY)
+    assert time == DAY and time.tzinfo is None
+
+
+def test_epoch_seconds_keep_the_time_zone():
+    zone = timezone(timedelta(hours=-5))
+    local = DAY.replace(hour=7, tzinfo=zone)
+    assert to_epoch_seconds(local) == to_epoch_seconds(DAY.replace(hour=12))
+
+    time = from_epoch_seconds(to_epoch_seconds(local) + 90, local)
+    assert time == local + timedelta(seconds=90) and time.utcoffset() == timedelta(hours=-5)
+    # Times come back in the zone they are read like, not in the zone they were made in
+    assert from_epoch_seconds(to_epoch_seconds(local), DAY) == DAY.replace(hour=12)
+
+
+def test_a_delay_absorbed_by_waiting_leaves_later_arrivals_unchanged():
+    # The solver stops propagating arrivals at the first visit whose arrival does not change
+    vehicle = create_plan().vehicles[0]
+    pickup, dropoff = vehicle.visits[:2]
+    assert pickup.arrival_seconds + 600 < pickup.min_start_seconds
+    arrivals = [visit.arrival_seconds for visit in vehicle.visits]
+
+    vehicle.departure_seconds += 600
+    pickup.update_arrival_time()
+    dropoff.update_arrival_time()
+    assert pickup.arrival_seconds == arrivals[0] + 600
+    assert dropoff.arrival_seconds == arrivals[1]
+
+    vehicle.departure_seconds += 3600
+    pickup.update_arrival_time()
+    dropoff.update_arrival_time()
+    assert dropoff.arrival_seconds > arrivals[1]
+
+
+def test_route_indices_are_serialized():
+    plan = create_plan()
+    indices = {visit['id']: visit['indexInVehicleRoute'] for visit in route_plan_to_dict(plan)['visits']}
+    assert indices == {visit.id: index for index, visit in enumerate(plan.vehicles[0].visits)}
+    assert indices == {visit.id: visit.index_in_vehicle_route for visit in plan.visits}
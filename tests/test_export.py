@@ -0,0 +1,31 @@
+from vehicle_routing.domain import *
+from vehicle_routing.export import ExportFormat, encode_rows, rows_from_json, rows_from_plan
+from vehicle_routing.serialization import route_plan_to_dict
+
+from plan_factories import create_trip, create_plan
+
+import json
+
+
+def test_rows_from_json_and_from_plan_agree():
+    plan = create_plan()
+    plan.visits += create_trip("3", "STS", 10)
+    data = route_plan_to_dict(plan)
+    data['ProgressId'] = 5
+
+    rows = list(rows_from_json(data))
+    assert rows == list(rows_from_plan(plan, 5))
+    assert [(row['TblId'], row['VehicleId'], row['IsAssigned']) for row in rows] == \
+           [('1', 'wc', True), ('2', 'wc', True), ('3', None, False)]
+    assert rows[0]['DriverId'] == 'driverwc' and rows[0]['ProgressId'] == 5
+
+
+def test_rows_are_encoded_in_every_format():
+    rows = list(rows_from_plan(create_plan()))
+    assert json.loads(b''.join(encode_rows(iter(rows), ExportFormat.JSON))) == {'data': rows}
+    assert [json.loads(line) for line in b''.join(encode_rows(iter(rows), ExportFormat.NDJSON)).splitlines()] == rows
+    assert b''.join(encode_rows(iter(rows), ExportFormat.CSV)).decode().splitlines() == [
+        'TblId,VehicleId,DriverId,IsAssigned,Exception,Make_Model,ProgressId',
+        '1,wc,driverwc,True,,Van,',
+        '2,wc,driverwc,True,,Van,',
+    ]
@@ -0,0 +1,101 @@
+from vehicle_routing.domain import *
+from vehicle_routing import job_store
+from vehicle_routing.job_store import InMemoryJobStore, SqliteJobStore
+from timefold.solver import SolverStatus
+
+from plan_factories import create_plan
+
+import pytest
+import time
+
+
+def test_in_memory_store_evicts_least_recently_used_over_budget():
+    plan_bytes = InMemoryJobStore.estimate_size(create_plan())
+    store = InMemoryJobStore(max_bytes=2 * plan_bytes)
+    store.put("a", create_plan())
+    store.put("b", create_plan())
+    assert store.get("a") is not None  # a is now more recently used than b
+    store.put("c", create_plan())
+    assert "b" not in store
+    assert "a" in store and "c" in store
+
+
+def test_in_memory_store_expires_jobs():
+    store = InMemoryJobStore(ttl_seconds=0.05)
+    store.put("a", create_plan())
+    assert "a" in store
+    time.sleep(0.1)
+    assert "a" not in store
+
+
+def test_sqlite_store_round_trips_plans_between_instances(tmp_path):
+    plan = create_plan()
+    SqliteJobStore(tmp_path / "jobs.sqlite3").put("a", plan, SolverStatus.NOT_SOLVING)
+
+    loaded = SqliteJobStore(tmp_path / "jobs.sqlite3").get("a")
+    assert loaded.solver_status == SolverStatus.NOT_SOLVING
+    assert loaded.model_dump(by_alias=True) == plan.model_dump(by_alias=True)
+    assert loaded.visits[1].previous_visit is loaded.visits[0]
+
+
+def test_sqlite_store_batches_writes_of_a_solving_job(tmp_path):
+    writer = SqliteJobStore(tmp_path / "jobs.sqlite3", min_write_interval_seconds=0.2)
+    reader = SqliteJobStore(tmp_path / "jobs.sqlite3")
+    writer.put("a", create_plan("first"), SolverStatus.SOLVING_ACTIVE)
+    writer.put("a", create_plan("second"), SolverStatus.SOLVING_ACTIVE)
+    assert writer.get("a").name == "second"
+    assert reader.get("a").name == "first"
+    time.sleep(0.4)
+    assert reader.get("a").name == "second"
+
+    writer.put("a", create_plan("third"), SolverStatus.SOLVING_ACTIVE)
+    writer.put("a", create_plan("final"), SolverStatus.NOT_SOLVING)
+    assert reader.get("a").name == "final"
+    time.sleep(0.4)
+    assert reader.get("a").name == "final"
+
+
+def test_sqlite_store_evicts_least_recently_used_over_budget(tmp_path):
+    store = SqliteJobStore(tmp_path / "jobs.sqlite3", max_bytes=1)
+    store.put("a", create_plan())
+    store.put("b", create_plan())
+    assert "a" not in store
+    assert "b" in store
+
+
+def test_sqlite_store_checks_membership_without_loading_plans(tmp_path, monkeypatch):
+    SqliteJobStore(tmp_path / "jobs.sqlite3").put("a", create_plan(), SolverStatus.NOT_SOLVING)
+    store = SqliteJobStore(tmp_path / "jobs.sqlite3", ttl_seconds=0.05)
+    monkeypatch.setattr(job_store, 'load_compact', lambda data: pytest.fail("The plan was loaded"))
+    assert "a" in store
+    assert "b" not in store
+    time.sleep(0.1)
+    assert "a" not in store
+
+
+def test_sqlite_store_loads_each_stored_plan_once(tmp_path, monkeypatch):
+    writer = SqliteJobStore(tmp_path / "jobs.sqlite3")
+    reader = SqliteJobStore(tmp_path / "jobs.sqlite3")
+    loads = []
+    load_compact = job_store.load_compact
+    monkeypatch.setattr(job_store, 'load_compact', lambda data: loads.append(data) or load_compact(data))
+
+    writer.put("a", create_plan("first"), SolverStatus.SOLVING_ACTIVE)
+    assert reader.get("a") is reader.get("a")
+    assert len(loads) == 1
+    # Another process stores a newer plan
+    writer.put("a", create_plan("final"), SolverStatus.NOT_SOLVING)
+    assert reader.get("a").name == "final" and reader.get("a").solver_status == SolverStatus.NOT_SOLVING
+    assert len(loads) == 2
+    # The writer kept the plans it stored
+    assert writer.get("a").name == "final" and len(loads) == 2
+
+
+def test_in_memory_store_expires_the_least_recently_updated_jobs_first():
+    store = InMemoryJobStore(ttl_seconds=0.2)
+    store.put("a", create_plan())
+    time.sleep(0.1)
+    store.put("b", create_plan())
+    store.get("a")
+    time.sleep(0.15)
+    assert "a" not in store and "b" in store
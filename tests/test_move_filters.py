@@ -0,0 +1,72 @@
+from vehicle_routing.move_filters import (accept_sub_list_change_move, accept_sub_list_change_move_in_time,
+                                          accept_sub_list_swap_move)
+
+from plan_factories import create_vehicle, create_plan
+
+
+class SubListChangeMove:
+    def __init__(self, source, from_index, destination):
+        self.source = source
+        self.from_index = from_index
+        self.destination = destination
+
+    def getSourceEntity(self):
+        return self.source
+
+    def getFromIndex(self):
+        return self.from_index
+
+    def getSubListSize(self):
+        return 2
+
+    def getDestinationEntity(self):
+        return self.destination
+
+    def getDestinationIndex(self):
+        return 0
+
+
+class SubList:
+    def __init__(self, vehicle, from_index):
+        self.vehicle = vehicle
+        self.from_index = from_index
+
+    def entity(self):
+        return self.vehicle
+
+    def fromIndex(self):
+        return self.from_index
+
+    def length(self):
+        return 2
+
+
+class SubListSwapMove:
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def isMoveDoable(self, score_director):
+        return True
+
+    def getLeftSubList(self):
+        return self.left
+
+    def getRightSubList(self):
+        return self.right
+
+
+def test_sub_list_moves_only_move_whole_trips():
+    plan = create_plan()
+    vehicle = plan.vehicles[0]
+    other = create_vehicle("other", "WC")
+    other.vehicle_type_mask = vehicle.vehicle_type_mask
+    # pickup_1, dropoff_1, pickup_2, dropoff_2: index 1 is (dropoff_1, pickup_2)
+    for accept in (accept_sub_list_change_move, accept_sub_list_change_move_in_time):
+        assert accept(None, SubListChangeMove(vehicle, 0, other))
+        assert accept(None, SubListChangeMove(vehicle, 2, vehicle))
+        assert not accept(None, SubListChangeMove(vehicle, 1, other))
+        assert not accept(None, SubListChangeMove(vehicle, 1, vehicle))
+
+    assert accept_sub_list_swap_move(None, SubListSwapMove(SubList(vehicle, 0), SubList(vehicle, 2)))
+    assert not accept_sub_list_swap_move(None, SubListSwapMove(SubList(vehicle, 1), SubList(vehicle, 2)))
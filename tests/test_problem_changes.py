@@ -0,0 +1,91 @@
+from vehicle_routing.domain import *
+from vehicle_routing.problem_changes import (LiveRouteChanges, ProblemChangeBatcher, RoutePlanChange,
+                                             create_route_plan_change)
+
+from plan_factories import create_trip, create_plan
+
+import asyncio
+import pytest
+
+
+def create_live_plan() -> VehicleRoutePlan:
+    plan = create_plan()
+    link_paired_visits(plan.visits)
+    plan.score = HardSoftScore.of(0, 0)
+    return plan
+
+
+def dump_trip(trip_id: str) -> list[dict]:
+    return [visit.model_dump(mode='json', by_alias=True, exclude_none=True) for visit in create_trip(trip_id, "WC", 10)]
+
+
+def apply(plan: VehicleRoutePlan, change: RoutePlanChange) -> None:
+    # What the solver does with the change, short of re-assigning the visits
+    plan.visits = [visit for visit in plan.visits if visit.id not in change.removed_visit_ids] + change.added_visits
+    for vehicle in plan.vehicles:
+        vehicle.visits = [visit for visit in vehicle.visits if visit.id not in change.removed_visit_ids]
+        vehicle.offline = vehicle.offline or vehicle.id in change.offline_vehicle_ids
+
+
+def test_live_changes_are_checked_against_the_latest_solution():
+    plan = create_live_plan()
+    plan.vehicles[0].pinned_visit_count = 2
+    added_visits = dump_trip("3")
+    # The same location as dropoff_2 once rounded to the coordinate resolution
+    added_visits[1]['location'] = [0.2 + 1e-9, 0.2]
+
+    change = create_route_plan_change(plan, LiveRouteChanges(removed_visit_ids=['dropoff_2'],
+                                                             added_visits=added_visits,
+                                                             offline_vehicle_ids=['wc', 'wc']))
+    assert change.removed_visit_ids == ['dropoff_2', 'pickup_2']
+    assert change.offline_vehicle_ids == ['wc']
+    pickup, dropoff = change.added_visits
+    # Paired after the trips of the plan; the visits are where those of trip 2 are, and get their travel times
+    assert pickup.pair_index == dropoff.pair_index == 2
+    assert pickup.location.index == plan.visits[2].location.index is not None
+    assert pickup.location.travel_times is plan.visits[2].location.travel_times
+    assert dropoff.location.index == plan.visits[3].location.index
+
+    assert not change.is_applied_to(plan)
+    apply(plan, change)
+    assert change.is_applied_to(plan)
+    # Already offline
+    assert create_route_plan_change(plan, LiveRouteChanges(offline_vehicle_ids=['wc'])).offline_vehicle_ids == []
+
+    with pytest.raises(ValueError, match='under way'):
+        create_route_plan_change(plan, LiveRouteChanges(removed_visit_ids=['dropoff_1']))
+    with pytest.raises(ValueError, match='no such vehicle'):
+        create_route_plan_change(plan, LiveRouteChanges(offline_vehicle_ids=['sts']))
+    with pytest.raises(ValueError, match='already taken'):
+        create_route_plan_change(plan, LiveRouteChanges(added_visits=dump_trip("1")))
+    elsewhere = dump_trip("4")
+    elsewhere[1]['location'] = [0.3, 0.3]
+    with pytest.raises(ValueError, match=r"no travel times for: \['dropoff_4'\]"):
+        create_route_plan_change(plan, LiveRouteChanges(added_visits=elsewhere))
+
+
+def test_changes_submitted_together_go_to_the_solver_as_one():
+    plan = create_live_plan()
+    changes = []
+
+    def add_problem_change(job_id: str, change: RoutePlanChange) -> None:
+        changes.append(change)
+        apply(plan, change)
+
+    batcher = ProblemChangeBatcher(add_problem_change, lambda job_id: (len(changes) + 1, plan), lambda job_id: True)
+
+    async def submit_all():
+        return await asyncio.gather(
+            batcher.submit("job", LiveRouteChanges(removed_visit_ids=['pickup_1'])),
+            batcher.submit("job", LiveRouteChanges(added_visits=dump_trip("3"))),
+            batcher.submit("job", LiveRouteChanges(removed_visit_ids=['pickup_9'])),
+            batcher.submit("job", LiveRouteChanges(removed_visit_ids=['pickup_2'])),
+            return_exceptions=True)
+
+    first, second, unknown, fourth = asyncio.run(submit_all())
+    # The unknown visit only fails its own submission
+    assert isinstance(unknown, ValueError)
+    assert first == second == fourth
+    assert first.absorbed and first.version == 2
+    assert len(changes) == 1
+    assert {visit.id for visit in plan.visits} == {'pickup_3', 'dropoff_3'}
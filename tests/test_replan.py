@@ -0,0 +1,41 @@
+from vehicle_routing.domain import *
+from vehicle_routing.replan import RouteChanges, apply_route_changes, pinned_visit_count
+
+from plan_factories import DAY, create_trip, create_plan
+
+import pytest
+
+
+def test_visits_the_vehicle_left_for_are_pinned_with_their_drop_off():
+    plan = create_plan()
+    vehicle = plan.vehicles[0]
+    assert pinned_visit_count(vehicle, DAY.replace(hour=6)) == 0
+    # Left at 7 for the 8 o'clock pickup; its drop-off is pinned with it
+    assert pinned_visit_count(vehicle, DAY.replace(hour=7, minute=1)) == 2
+    assert pinned_visit_count(vehicle, DAY.replace(hour=12)) == 4
+
+
+def test_changes_are_applied_to_the_previous_solution():
+    plan = create_plan()
+    pickup, dropoff = create_trip("3", "WC", 10)
+    changes = RouteChanges.model_validate({
+        'now': DAY.replace(hour=7, minute=1),
+        'removedVisitIds': ['pickup_2'],
+        'addedVisits': [visit.model_dump(mode='json', by_alias=True, exclude_none=True)
+                        for visit in (pickup, dropoff)],
+        'modifiedVehicles': [{'id': 'wc', 'capacity': 5}],
+    })
+
+    replanned = apply_route_changes(plan, changes)
+    vehicle = replanned.vehicles[0]
+    assert [visit.id for visit in vehicle.visits] == ['pickup_1', 'dropoff_1']
+    assert vehicle.pinned_visit_count == 2 and vehicle.capacity == 5
+    assert {visit.id for visit in replanned.visits} == {'pickup_1', 'dropoff_1', 'pickup_3', 'dropoff_3'}
+    assert vehicle.visits[1].arrival_time is not None
+    # The previous plan is left as it was
+    assert len(plan.vehicles[0].visits) == 4
+
+    with pytest.raises(ValueError, match='under way'):
+        apply_route_changes(plan, RouteChanges(now=DAY.replace(hour=7, minute=1), removed_visit_ids=['dropoff_1']))
+    with pytest.raises(ValueError, match='no such visit'):
+        apply_route_changes(plan, RouteChanges(removed_visit_ids=['pickup_9']))
@@ -0,0 +1,26 @@
+from vehicle_routing.domain import *
+from vehicle_routing.serialization import ResponseCache, dump_route_plan
+
+from plan_factories import create_vehicle, create_plan
+
+import json
+
+
+def test_dump_route_plan_matches_pydantic_serialization():
+    plan = create_plan()
+    plan.vehicles.append(create_vehicle("idle", "WC"))
+    plan.visits[0].name = "Pickup 1"
+
+    assert json.loads(dump_route_plan(plan)) == json.loads(plan.model_dump_json(by_alias=True, exclude_none=True))
+    assert json.loads(dump_route_plan(plan, SolverStatus.NOT_SOLVING))["solverStatus"] == "NOT_SOLVING"
+
+
+def test_response_cache_serializes_each_version_once():
+    cache = ResponseCache(max_responses=1)
+    plan = create_plan()
+    first = cache.get(("job", 1), plan)
+    plan.vehicles[0].visits.clear()
+    assert cache.get(("job", 1), plan) is first
+    # A newer version evicts the older one
+    assert json.loads(cache.get(("job", 2), plan))["vehicles"][0]["visits"] == []
+    assert cache.get(("job", 1), plan) is not first
@@ -0,0 +1,57 @@
+from vehicle_routing.domain import *
+from vehicle_routing import solver
+from vehicle_routing.solver import (create_solver_config, create_termination_config, parse_move_thread_count,
+                                    MIN_SPENT_LIMIT_SECONDS, MAX_SPENT_LIMIT_SECONDS)
+from timefold.solver.config import MoveThreadCount
+
+import pytest
+
+from plan_factories import create_sized_plan
+
+
+def spent_limit_millis(termination_config) -> int:
+    return termination_config.termination_config_list[0].spent_limit.milliseconds
+
+
+def test_spent_limit_scales_with_problem_size():
+    small = spent_limit_millis(create_termination_config(create_sized_plan(1, 1)))
+    medium = spent_limit_millis(create_termination_config(create_sized_plan(100, 30)))
+    large = spent_limit_millis(create_termination_config(create_sized_plan(1000, 300)))
+    assert MIN_SPENT_LIMIT_SECONDS * 1000 <= small < medium < large
+    assert large == MAX_SPENT_LIMIT_SECONDS * 1000
+
+
+def test_termination_overrides():
+    termination_config = create_termination_config(create_sized_plan(1, 1), spent_limit_seconds=90,
+                                                   best_score_limit='0hard/-100soft')
+    assert spent_limit_millis(termination_config) == 90_000
+    assert termination_config.termination_config_list[-1].best_score_limit == '0hard/-100soft'
+
+    with pytest.raises(ValueError):
+        create_termination_config(create_sized_plan(1, 1), spent_limit_seconds=0)
+    with pytest.raises(ValueError):
+        create_termination_config(create_sized_plan(1, 1), best_score_limit='fast please')
+
+
+def test_parse_move_thread_count():
+    assert parse_move_thread_count(None) == MoveThreadCount.NONE
+    assert parse_move_thread_count('auto') == MoveThreadCount.AUTO
+    assert parse_move_thread_count('1') == MoveThreadCount.NONE
+    assert parse_move_thread_count('4') == 4
+    with pytest.raises(ValueError):
+        parse_move_thread_count('many')
+
+
+def test_trip_moves_are_kept_unless_nearby_selection_is_asked_for(monkeypatch):
+    monkeypatch.setattr(solver, 'is_enterprise_installed', lambda: True)
+
+    def uses(nearby_selection, trip_moves):
+        config = create_solver_config(nearby_selection=nearby_selection, trip_moves=trip_moves)
+        return config.nearby_distance_meter_function is not None, config.xml_source_text is not None
+
+    assert uses(None, None) == (False, True)
+    assert uses(None, False) == (True, False)
+    assert uses(True, None) == (True, False)
+    assert uses(True, True) == (False, True)
+    monkeypatch.setattr(solver, 'is_enterprise_installed', lambda: False)
+    assert uses(True, None) == (False, True)
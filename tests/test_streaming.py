@@ -0,0 +1,72 @@
+from vehicle_routing.domain import *
+from vehicle_routing.streaming import SolutionBroadcaster
+from timefold.solver import SolverStatus
+from timefold.solver.score import HardSoftScore
+
+from plan_factories import create_plan
+
+import asyncio
+import json
+
+
+def create_solution(hard_score: int, solver_status: SolverStatus = SolverStatus.SOLVING_ACTIVE) -> VehicleRoutePlan:
+    plan = create_plan()
+    plan.score = HardSoftScore.of(hard_score, 0)
+    plan.solver_status = solver_status
+    return plan
+
+
+def parse(frame: bytes) -> tuple[int, dict]:
+    fields = dict(line.split(": ", 1) for line in frame.decode().strip().split("\n"))
+    return int(fields["id"]), json.loads(fields["data"])
+
+
+def test_only_improving_solutions_are_streamed_until_the_final_one():
+    async def run():
+        broadcaster = SolutionBroadcaster(min_interval_seconds=0)
+        broadcaster.start("job")
+        frames = []
+
+        async def listen():
+            async for frame in broadcaster.subscribe("job"):
+                frames.append(parse(frame))
+
+        listener = asyncio.create_task(listen())
+        await asyncio.sleep(0)
+        broadcaster.publish("job", create_solution(-10))
+        await asyncio.sleep(0.01)
+        broadcaster.publish("job", create_solution(-20))  # Worse: not streamed
+        broadcaster.publish("job", create_solution(-5))
+        await asyncio.sleep(0.01)
+        broadcaster.publish("job", create_solution(-5, SolverStatus.NOT_SOLVING))
+        await asyncio.wait_for(listener, 1)
+
+        assert [(version, frame["score"], frame["solverStatus"]) for version, frame in frames] == [
+            (1, "-10hard/0soft", "SOLVING_ACTIVE"),
+            (2, "-5hard/0soft", "SOLVING_ACTIVE"),
+            (3, "-5hard/0soft", "NOT_SOLVING"),
+        ]
+        # A late client only gets the latest version
+        assert [parse(frame)[0] async for frame in broadcaster.subscribe("job")] == [3]
+        assert [parse(frame)[0] async for frame in broadcaster.subscribe("job", last_version=3)] == []
+
+    asyncio.run(run())
+
+
+def test_solutions_within_the_interval_are_debounced_to_the_latest():
+    async def run():
+        broadcaster = SolutionBroadcaster(min_interval_seconds=0.2)
+        broadcaster.start("job")
+        for hard_score in (-30, -20, -10):
+            broadcaster.publish("job", create_solution(hard_score))
+        frames = []
+        async for frame in broadcaster.subscribe("job"):
+            frames.append(parse(frame))
+            if len(frames) == 2:
+                break
+        assert [(version, frame["score"]) for version, frame in frames] == [
+            (1, "-30hard/0soft"),
+            (2, "-10hard/0soft"),
+        ]
+
+    asyncio.run(run())
@@ -0,0 +1,22 @@
+from vehicle_routing.domain import *
+from vehicle_routing.construction import update_route_shadow_variables
+from vehicle_routing.time_slack import insertion_fits_time_windows
+
+from plan_factories import create_trip, create_plan
+
+
+def late_visit_ids(vehicle: Vehicle) -> set[str]:
+    update_route_shadow_variables(vehicle)
+    return {visit.id for visit in vehicle.visits if visit.arrival_seconds > visit.max_end_seconds}
+
+
+def test_insertions_are_checked_against_the_visits_after_them():
+    for pickup_hour in (8, 9, 11):
+        for index in range(5):
+            vehicle = create_plan().vehicles[0]
+            trip = create_trip("3", "WC", pickup_hour)
+            fits = insertion_fits_time_windows(vehicle, index, trip)
+
+            on_time_visit_ids = {visit.id for visit in vehicle.visits[index:]} - late_visit_ids(vehicle)
+            vehicle.visits[index:index] = trip
+            assert fits == (not late_visit_ids(vehicle) & on_time_visit_ids), (pickup_hour, index)
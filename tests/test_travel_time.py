@@ -0,0 +1,146 @@
+from vehicle_routing.domain import *
+from vehicle_routing.travel_time import (EuclideanTravelTimeProvider, HaversineTravelTimeProvider,
+                                         MatrixTravelTimeProvider)
+from vehicle_routing.travel_time_cache import CachedTravelTimeProvider
+
+import json
+import numpy as np
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+from urllib.parse import parse_qs, urlsplit
+
+from plan_factories import create_plan
+
+def test_same_coordinates_share_an_index():
+    plan = create_plan()
+    pickup_1, dropoff_1, pickup_2, dropoff_2 = plan.vehicles[0].visits
+    assert pickup_1.location.index == pickup_2.location.index
+    assert dropoff_1.location.index == dropoff_2.location.index
+    assert len({plan.vehicles[0].home_location.index, *(visit.location.index for visit in plan.visits)}) == 3
+
+
+def test_matrix_matches_closed_form():
+    plan = create_plan()
+    for visit in plan.visits:
+        for other in plan.visits:
+            unindexed = Location(latitude=visit.location.latitude, longitude=visit.location.longitude)
+            assert visit.location.driving_time_to(other.location) == unindexed.driving_time_to(other.location)
+    # sqrt(0.1**2 + 0.1**2) * 4000
+    assert plan.visits[0].location.driving_time_to(plan.visits[1].location) == 566
+
+
+def test_haversine_speed():
+    # One degree of latitude is ~111.2 km, which takes ~2.2 hours at 50 km/h
+    provider = HaversineTravelTimeProvider(speed_kmph=50)
+    matrix = provider.travel_time_matrix([Location(latitude=44, longitude=-92),
+                                          Location(latitude=45, longitude=-92)])
+    assert matrix[0, 0] == 0
+    assert matrix[0, 1] == matrix[1, 0]
+    assert abs(matrix[0, 1] - 8_006) < 10
+
+
+def test_matrix_provider_fetches_each_pair_once():
+    requested_pairs = []
+
+    class TableHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            coordinates = [tuple(map(float, pair.split(',')))
+                           for pair in url.path.split('/')[-1].split(';')]
+            query = parse_qs(url.query)
+            sources = [coordinates[int(i)] for i in query['sources'][0].split(';')]
+            destinations = [coordinates[int(i)] for i in query['destinations'][0].split(';')]
+            requested_pairs.extend((source, destination) for source in sources for destination in destinations)
+            body = json.dumps({'code': 'Ok', 'durations': [[100 * abs(source[0] - destination[0])
+                                                            for destination in destinations]
+                                                           for source in sources]})
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), TableHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        provider = MatrixTravelTimeProvider(service_url=f'http://127.0.0.1:{server.server_port}')
+        first = [Location(latitude=0, longitude=i) for i in range(3)]
+        second = first[1:] + [Location(latitude=0, longitude=5)]
+        assert provider.travel_time_matrix(first)[0, 2] == 200
+        assert provider.travel_time_matrix(second)[1, 2] == 300
+        assert provider.travel_time_matrix(first + second[-1:])[3, 0] == 500
+    finally:
+        server.shutdown()
+
+    assert len(requested_pairs) == len(set(requested_pairs)) == 16
+
+
+def test_matrix_provider_reads_csv_tables(tmp_path):
+    path = tmp_path / "table.csv"
+    path.write_text("from_latitude,from_longitude,to_latitude,to_longitude,seconds\n"
+                    "0.0000001,0,3,4,42\n")
+    provider = MatrixTravelTimeProvider.from_file(path)
+    origin, destination = Location(latitude=0, longitude=0), Location(latitude=3, longitude=4)
+    assert provider.travel_times_between([origin], [destination])[0, 0] == 42
+    # Pairs the table does not have are estimated
+    assert provider.travel_times_between([destination], [origin])[0, 0] == 20_000
+
+
+def test_matrix_provider_stores_only_known_pairs():
+    keys = [(0.0, float(i)) for i in range(1_000)]
+    provider = MatrixTravelTimeProvider({(keys[0], destination): 7 for destination in keys})
+    provider._store_pairs([keys[-1], keys[0]], [keys[0], keys[1]], np.array([9, 8]))
+    # 1,001 pairs, not a 1,000 x 1,000 matrix
+    assert len(provider._keys) == len(provider._seconds) == 1_001
+    origins = [Location(latitude=0, longitude=i) for i in (0, 999)]
+    assert provider.known_travel_times_between(origins, origins[:1] + [Location(latitude=0, longitude=1)]).tolist() \
+        == [[7, 8], [9, -1]]
+
+
+class CountingProvider(EuclideanTravelTimeProvider):
+    def __init__(self):
+        super().__init__()
+        self.computed_pairs = 0
+
+    def travel_times_between(self, origins, destinations):
+        self.computed_pairs += len(origins) * len(destinations)
+        return super().travel_times_between(origins, destinations)
+
+
+def test_disk_cache_only_computes_missing_pairs(tmp_path):
+    counting = CountingProvider()
+    locations = [Location(latitude=0, longitude=i) for i in range(4)]
+    expected = EuclideanTravelTimeProvider().travel_time_matrix(locations)
+
+    CachedTravelTimeProvider(counting, tmp_path).travel_time_matrix(locations[:3])
+    assert counting.computed_pairs == 9
+
+    # A fresh instance, as in another worker process, reads the matrix back from disk
+    matrix = CachedTravelTimeProvider(counting, tmp_path).travel_time_matrix(locations)
+    assert counting.computed_pairs == 9 + 7
+    assert (matrix == expected).all()
+
+
+def test_disk_cache_skips_estimates_and_oversized_matrices(tmp_path):
+    locations = [Location(latitude=0, longitude=i) for i in range(3)]
+    keys = [(0.0, float(i)) for i in range(3)]
+    partial = MatrixTravelTimeProvider({(origin, destination): 7 for origin in keys[:2] for destination in keys[:2]})
+    matrix = CachedTravelTimeProvider(partial, tmp_path / "estimated").travel_time_matrix(locations)
+    assert matrix[0, 1] == 7 and matrix[0, 2] == 8_000
+    assert not list((tmp_path / "estimated").iterdir())
+
+    complete = MatrixTravelTimeProvider({(origin, destination): 7 for origin in keys for destination in keys})
+    CachedTravelTimeProvider(complete, tmp_path / "complete").travel_time_matrix(locations)
+    assert len(list((tmp_path / "complete").iterdir())) == 2
+    CachedTravelTimeProvider(complete, tmp_path / "oversized", max_bytes=8).travel_time_matrix(locations)
+    assert not list((tmp_path / "oversized").iterdir())
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    provider = CachedTravelTimeProvider(EuclideanTravelTimeProvider(), tmp_path, max_bytes=300)
+    provider.travel_time_matrix([Location(latitude=0, longitude=i) for i in range(3)])
+    provider.travel_time_matrix([Location(latitude=1, longitude=i) for i in range(3)])
+    # Each 3 x 3 int32 matrix file is 164 bytes, so only the newest one fits
+    assert len(list(tmp_path.glob('*.matrix.npy'))) == 1
+